@@ -0,0 +1,94 @@
+import asyncio
+import time
+import unittest
+
+import yaml
+
+from tubes.aio import AsyncSolver
+from tubes.bench.generate import generate_board
+from tubes.model import Game, UnsolvableError
+from tubes.solve import BFS, BudgetExhausted, solve
+
+
+class TestAsyncSolver(unittest.TestCase):
+
+    def setUp(self) -> None:
+        with open('fixtures/lvl3.yml') as file:
+            self.game = Game(yaml.safe_load(file))
+
+    def test_solve(self):
+        events = []
+
+        async def main():
+            async with AsyncSolver(max_concurrent=2) as solver:
+                return await solver.solve(self.game, on_progress=events.append, every=1)
+
+        solution = asyncio.run(main())
+        self.assertEqual(len(solve(self.game)), len(solution))
+        self.assertTrue(solution.optimal)
+        self.assertEqual(len(solution), solution.stats.depth)
+        self.assertTrue(events)
+        self.assertEqual(sorted(event.expanded for event in events),
+                         [event.expanded for event in events])
+
+    def test_workers(self):
+        async def main():
+            async with AsyncSolver() as solver:
+                return await solver.solve(self.game, workers=2)
+
+        solution = asyncio.run(main())
+        self.assertEqual(len(solve(self.game)), len(solution))
+        self.assertTrue(solution.optimal)
+
+    def test_errors(self):
+        game = Game({1: [None, 'red', 'red', 'red'], 2: None})
+
+        async def main(game, **kwargs):
+            async with AsyncSolver() as solver:
+                return await solver.solve(game, **kwargs)
+
+        with self.assertRaises(UnsolvableError) as context:
+            asyncio.run(main(game))
+        self.assertEqual(UnsolvableError.COLOR_COUNT, context.exception.reason)
+        with self.assertRaises(BudgetExhausted):
+            asyncio.run(main(self.game, max_nodes=1))
+
+    def test_cancel(self):
+        game = Game(generate_board(10, depth=500))
+        events = asyncio.Queue()
+
+        async def main():
+            async with AsyncSolver(max_concurrent=1) as solver:
+                task = asyncio.ensure_future(solver.solve(
+                    game, on_progress=events.put_nowait, every=100, mode=BFS))
+                await events.get()
+                start = time.monotonic()
+                task.cancel()
+                with self.assertRaises(asyncio.CancelledError):
+                    await task
+                return time.monotonic() - start
+
+        self.assertLess(asyncio.run(main()), 1)
+
+    def test_max_concurrent(self):
+        running = []
+        peak = []
+
+        async def main():
+            async with AsyncSolver(max_concurrent=2) as solver:
+                async def run(index):
+                    async def track(event):
+                        if index not in running:
+                            running.append(index)
+                            peak.append(len(running))
+                            # hold the slot, so that the searches overlap
+                            await asyncio.sleep(0.3)
+                    try:
+                        return await solver.solve(self.game, on_progress=track, every=1)
+                    finally:
+                        running.remove(index)
+                return await asyncio.gather(*(run(index) for index in range(4)))
+
+        solutions = asyncio.run(main())
+        self.assertEqual(4, len(solutions))
+        self.assertEqual(2, max(peak))
@@ -0,0 +1,116 @@
+import unittest
+
+import yaml
+
+from tubes.model import Game, PRUNING_AGGRESSIVE, PRUNING_NONE, PRUNING_SAFE
+from tubes.solve import ASTAR, NUMPY, solve
+
+try:
+    import numpy as np
+    from tubes.batch import BatchVisited, Frontier, _hasher, _keyer
+except ImportError:
+    np = None
+
+
+@unittest.skipUnless(np, 'numpy is not installed')
+class TestFrontier(unittest.TestCase):
+
+    def setUp(self) -> None:
+        with open('fixtures/game_partial_pour.yml') as file:
+            self.game = Game(yaml.safe_load(file))
+        self.cells = np.frombuffer(self.game._pack(), dtype=np.uint8).reshape(1, 4, 4)
+        self.frontier = Frontier(self.cells)
+
+    def test_properties(self):
+        self.assertEqual([[1, 4, 3, 0]], self.frontier.fill.tolist())
+        self.assertEqual([[1, 2, 1, 0]], self.frontier.run.tolist())
+        self.assertEqual([[3, 0, 1, 4]], self.frontier.space.tolist())
+        self.assertEqual([False], self.frontier.solved.tolist())
+
+    def test_moves(self):
+        for pruning in (PRUNING_NONE, PRUNING_SAFE, PRUNING_AGGRESSIVE):
+            _, from_tubes, to_tubes = self.frontier.moves(pruning)
+            moves = sorted((self.game._tubes[from_tube], self.game._tubes[to_tube])
+                           for from_tube, to_tube in zip(from_tubes, to_tubes))
+            self.assertEqual(sorted(self.game._generate_moves(pruning)), moves)
+
+    def test_children(self):
+        states, from_tubes, to_tubes = self.frontier.moves(PRUNING_NONE)
+        children = self.frontier.children(states, from_tubes, to_tubes)
+        for move, child in zip(zip(from_tubes, to_tubes), children):
+            self.game._push_move(*(self.game._tubes[tube] for tube in move))
+            self.assertEqual(self.game._pack(), child.tobytes())
+            self.game._pop_move()
+
+    def test_hash(self):
+        cells = np.concatenate((self.cells, self.cells[:, ::-1]))
+        hashes = _hasher(4)
+        self.assertEqual(1, len(set(hashes(_keyer(4, True)(cells)).tolist())))
+        self.assertEqual(2, len(set(hashes(_keyer(4, False)(cells)).tolist())))
+
+
+@unittest.skipUnless(np, 'numpy is not installed')
+class TestBatchVisited(unittest.TestCase):
+
+    def test_add(self):
+        visited = BatchVisited(2)
+        hashes = np.array([5, 3, 5], dtype=np.uint64)
+        keys = np.array([[1, 2], [3, 4], [1, 2]], dtype=np.uint64)
+        self.assertEqual([0, 1], visited.add(hashes, keys).tolist())
+        self.assertEqual([], visited.add(hashes[:1], keys[:1]).tolist())
+        self.assertEqual(2, len(visited))
+
+    def test_collision(self):
+        visited = BatchVisited(2)
+        hashes = np.array([5, 5, 5], dtype=np.uint64)
+        keys = np.array([[1, 2], [3, 4], [3, 4]], dtype=np.uint64)
+        self.assertEqual([0, 1], visited.add(hashes, keys).tolist())
+        keys = np.array([[3, 4], [5, 6], [1, 2]], dtype=np.uint64)
+        self.assertEqual([1], visited.add(hashes, keys).tolist())
+        self.assertEqual(3, len(visited))
+
+    def test_merge(self):
+        visited = BatchVisited(1)
+        keys = np.arange(100, dtype=np.uint64)[::-1].reshape(-1, 1)
+        for start in range(0, 100, 10):
+            fresh = visited.add(keys[start:start + 10, 0], keys[start:start + 10])
+            self.assertEqual(list(range(10)), fresh.tolist())
+        self.assertEqual(100, len(visited))
+        self.assertEqual([], visited.add(keys[::7, 0], keys[::7]).tolist())
+        stored = visited._hashes.tolist() + visited._new_hashes.tolist()
+        self.assertEqual(list(range(100)), sorted(stored))
+
+    def test_keys(self):
+        cells = np.array([[[0, 0, 1, 2], [0, 0, 0, 3]]], dtype=np.uint8)
+        self.assertEqual([[3, 258]], _keyer(4, True)(cells).tolist())
+        self.assertEqual([[258, 3]], _keyer(4, False)(cells).tolist())
+
+
+@unittest.skipUnless(np, 'numpy is not installed')
+class TestBatchBFS(unittest.TestCase):
+
+    def test_solve(self):
+        for fixture in ('lvl3', 'game_partial_pour'):
+            with open(f'fixtures/{fixture}.yml') as file:
+                game = Game(yaml.safe_load(file))
+            for symmetry in (True, False):
+                solution = solve(game, backend=NUMPY, symmetry=symmetry)
+                self.assertEqual(len(solve(game, symmetry=symmetry)), len(solution))
+                self.assertTrue(solution.optimal)
+                for move in solution:
+                    game._push_move(*move)
+                self.assertTrue(game._solved)
+                for _ in solution:
+                    game._pop_move()
+
+    def test_solve_other_modes(self):
+        with open('fixtures/lvl3.yml') as file:
+            game = Game(yaml.safe_load(file))
+        with self.assertRaises(ValueError):
+            solve(game, mode=ASTAR, backend=NUMPY)
+        with self.assertRaises(ValueError):
+            solve(game, backend='fortran')
+
+
+if __name__ == '__main__':
+    unittest.main()
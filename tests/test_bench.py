@@ -0,0 +1,61 @@
+import copy
+import unittest
+
+from tubes.bench.generate import _pour, _unpours, generate_board
+from tubes.bench.run import SOLVED, TIMEOUT, compare, measure_isolated, run_suite
+from tubes.model import Game
+from tubes.solve import solve
+
+
+class TestGenerate(unittest.TestCase):
+
+    def test_unpours(self):
+        tubes = [[1, 1, 2], [2, 2, 2], [1, 1], []]
+        for board in _unpours(tubes, 4):
+            self.assertIn(tubes, [_pour(board, i, j, 4) for i in range(4)
+                                  for j in range(4) if i != j])
+
+    def test_generate_board(self):
+        config = generate_board(5, empty=2, depth=40, seed=3)
+        self.assertEqual(config, generate_board(5, empty=2, depth=40, seed=3))
+        self.assertNotEqual(config, generate_board(5, empty=2, depth=40, seed=4))
+        self.assertEqual(7, len(config))
+        game = Game(config)
+        game._validate()
+        self.assertFalse(game._solved)
+        self.assertLessEqual(len(solve(game)), 40)
+
+    def test_capacity(self):
+        for seed in range(5):
+            config = generate_board(3, empty=1, capacity=6, depth=15, seed=seed)
+            self.assertTrue(all(len(tube) == 6 for tube in config.values()))
+            self.assertLessEqual(len(solve(Game(config))), 15)
+
+
+class TestRun(unittest.TestCase):
+
+    suite = (('small', {'num_colors': 4, 'empty': 2, 'depth': 20}),)
+
+    def test_run_suite(self):
+        report = run_suite(self.suite, ['bfs', 'idastar'], isolate=False)
+        self.assertEqual(['bfs', 'idastar'],
+                         [result['solver'] for result in report['results']])
+        bfs, idastar = report['results']
+        self.assertEqual(SOLVED, bfs['status'])
+        self.assertEqual(bfs['depth'], idastar['depth'])
+        self.assertGreater(bfs['nodes'], idastar['nodes'])
+        self.assertIn('nodes_per_second', bfs)
+
+    def test_isolated(self):
+        result = measure_isolated(generate_board(4, depth=20), {'mode': 'bfs'}, 0)
+        self.assertEqual(TIMEOUT, result['status'])
+
+    def test_compare(self):
+        baseline = run_suite(self.suite, ['bfs'], isolate=False)
+        self.assertEqual([], compare(baseline, baseline))
+        report = copy.deepcopy(baseline)
+        report['results'][0]['nodes'] *= 2
+        regression, = compare(baseline, report)
+        self.assertIn('nodes', regression)
+        report['results'][0]['status'] = TIMEOUT
+        self.assertEqual(1, len(compare(baseline, report)))
@@ -0,0 +1,107 @@
+import multiprocessing
+import os
+import pickle
+import tempfile
+import unittest
+
+import yaml
+
+from tubes.cache import SolutionCache, canonical_board
+from tubes.model import Game, PRUNING_AGGRESSIVE
+from tubes.solve import Budget, BudgetExhausted, solve
+
+
+def _fill(path, start):
+    with SolutionCache(path) as cache:
+        for i in range(start, start + 50):
+            game = Game({1: [f'color_{i}'] * 4, 2: None})
+            cache.put(game, [])
+            cache.get(game)
+
+
+class TestSolutionCache(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'solutions.db')
+        self.cache = SolutionCache(self.path)
+        with open('fixtures/lvl3.yml') as file:
+            self.config = yaml.safe_load(file)
+        self.game = Game(self.config)
+
+    def tearDown(self) -> None:
+        self.cache.close()
+        self.directory.cleanup()
+
+    def shuffled(self):
+        # the same board with its tubes in another order, renumbered
+        tubes = list(self.config.values())
+        return Game({i + 1: tube for i, tube in enumerate(reversed(tubes))})
+
+    def test_canonical_board(self):
+        key, order = canonical_board(self.game)
+        shuffled_key, shuffled_order = canonical_board(self.shuffled())
+        self.assertEqual(key, shuffled_key)
+        self.assertEqual(len(self.game._tubes), len(order))
+        self.assertNotEqual(order, shuffled_order)
+
+    def test_get_and_put(self):
+        self.assertIsNone(self.cache.get(self.game))
+        solution = solve(self.game)
+        self.cache.put(self.game, solution)
+        self.assertEqual(1, len(self.cache))
+        self.assertEqual(solution, self.cache.get(self.game))
+        self.assertTrue(self.cache.get(self.game).optimal)
+
+        shuffled = self.shuffled()
+        cached = self.cache.get(shuffled)
+        self.assertEqual(len(solution), len(cached))
+        for move in cached:
+            shuffled._push_move(*move)
+        self.assertTrue(shuffled._solved)
+
+    def test_eviction(self):
+        self.cache.max_entries = 2
+        games = [Game({1: [color] * 4, 2: None}) for color in ('red', 'green', 'blue')]
+        self.cache.put(games[0], [])
+        self.cache.put(games[1], [])
+        self.cache.get(games[0])
+        self.cache.put(games[2], [])
+        self.assertEqual(2, len(self.cache))
+        self.assertIsNotNone(self.cache.get(games[0]))
+        self.assertIsNone(self.cache.get(games[1]))
+        self.assertIsNotNone(self.cache.get(games[2]))
+
+    def test_pickle(self):
+        cache = pickle.loads(pickle.dumps(self.cache))
+        cache.put(self.game, solve(self.game))
+        self.assertIsNotNone(self.cache.get(self.game))
+        cache.close()
+
+    def test_processes(self):
+        processes = [multiprocessing.Process(target=_fill, args=(self.path, start))
+                     for start in (0, 50, 100)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+            self.assertEqual(0, process.exitcode)
+        self.assertEqual(150, len(self.cache))
+
+    def test_solve(self):
+        solution = solve(self.game, cache=self.cache)
+        self.assertEqual(1, len(self.cache))
+        # a hit needs no search at all
+        self.assertEqual(solution, solve(self.game, cache=self.cache,
+                                         budget=Budget(max_nodes=0)))
+        with self.assertRaises(BudgetExhausted):
+            solve(self.game, budget=Budget(max_nodes=0))
+
+    def test_solve_not_optimal(self):
+        solution = solve(self.game, pruning=PRUNING_AGGRESSIVE, cache=self.cache)
+        self.assertFalse(solution.optimal)
+        self.assertEqual(0, len(self.cache))
+
+
+if __name__ == '__main__':
+    unittest.main()
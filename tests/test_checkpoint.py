@@ -0,0 +1,103 @@
+import os
+import signal
+import tempfile
+import unittest
+
+import yaml
+
+from tubes.checkpoint import HEADER, Checkpoint, cancel_on_sigterm
+from tubes.model import Game, PRUNING_NONE, PRUNING_SAFE
+from tubes.solve import ASTAR, Budget, BudgetExhausted, GameState, solve
+
+
+class TestCheckpoint(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'search.ckpt')
+        with open('fixtures/game_partial_pour.yml') as file:
+            self.game = Game(yaml.safe_load(file))
+
+    def tearDown(self) -> None:
+        self.directory.cleanup()
+
+    def test_append_and_restore(self):
+        root = GameState(self.game._pack())
+        self.game._push_move(2, 4)
+        child = GameState(self.game._pack(), root, (2, 4))
+        self.game._pop_move()
+        with Checkpoint(self.path, self.game, True, PRUNING_SAFE) as checkpoint:
+            self.assertEqual([], checkpoint.restore())
+            checkpoint.append([root])
+            checkpoint.append([child])
+        with Checkpoint(self.path, self.game, True, PRUNING_SAFE,
+                        resume=True) as checkpoint:
+            root, child = (layer[0] for layer in checkpoint.restore())
+        self.assertEqual(self.game._pack(), root.state)
+        self.assertIs(root, child.parent)
+        self.assertEqual([(2, 4)], child.moves)
+
+    def test_truncated_layer(self):
+        with Checkpoint(self.path, self.game, True, PRUNING_SAFE) as checkpoint:
+            checkpoint.append([GameState(self.game._pack())])
+        size = os.path.getsize(self.path)
+        with open(self.path, 'ab') as file:
+            file.write(b'\x01\x00\x00\x00\x05\x00')
+        with Checkpoint(self.path, self.game, True, PRUNING_SAFE,
+                        resume=True) as checkpoint:
+            self.assertEqual(1, len(checkpoint.restore()))
+        self.assertEqual(size, os.path.getsize(self.path))
+
+    def test_mismatch(self):
+        with Checkpoint(self.path, self.game, True, PRUNING_SAFE) as checkpoint:
+            checkpoint.append([GameState(self.game._pack())])
+        with self.assertRaises(ValueError):
+            Checkpoint(self.path, self.game, False, PRUNING_SAFE, resume=True)
+        with self.assertRaises(ValueError):
+            Checkpoint(self.path, self.game, True, PRUNING_NONE, resume=True)
+        self.game._push_move(2, 4)
+        with self.assertRaises(ValueError):
+            Checkpoint(self.path, self.game, True, PRUNING_SAFE, resume=True)
+
+    def test_corrupt_depth(self):
+        with Checkpoint(self.path, self.game, True, PRUNING_SAFE) as checkpoint:
+            checkpoint.append([GameState(self.game._pack())])
+        with open(self.path, 'r+b') as file:
+            file.seek(HEADER.size)
+            file.write(b'\x03')
+        with self.assertRaises(ValueError):
+            Checkpoint(self.path, self.game, True, PRUNING_SAFE, resume=True)
+
+    def test_resume(self):
+        with open('fixtures/lvl3.yml') as file:
+            game = Game(yaml.safe_load(file))
+        expected = solve(game)
+        with self.assertRaises(BudgetExhausted):
+            solve(game, checkpoint=self.path, budget=Budget(max_nodes=2))
+        copy = os.path.join(self.directory.name, 'copy.ckpt')
+        solution = solve(game, resume_from=self.path, checkpoint=copy)
+        self.assertEqual(len(expected), len(solution))
+        self.assertTrue(solution.optimal)
+        solution = solve(game, resume_from=self.path)
+        self.assertEqual(len(expected), len(solution))
+        for move in solution:
+            game._push_move(*move)
+        self.assertTrue(game._solved)
+
+    def test_sigterm(self):
+        budget = Budget()
+        with cancel_on_sigterm(budget):
+            budget.spend()
+            os.kill(os.getpid(), signal.SIGTERM)
+            with self.assertRaises(BudgetExhausted):
+                budget.spend()
+        self.assertIsNone(budget.cancel)
+        budget.spend()
+
+    def test_other_modes(self):
+        with self.assertRaises(ValueError):
+            solve(self.game, mode=ASTAR, checkpoint=self.path)
+
+
+if __name__ == '__main__':
+    unittest.main()
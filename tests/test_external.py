@@ -0,0 +1,83 @@
+import os
+import tempfile
+import unittest
+from copy import deepcopy
+
+import yaml
+
+from tubes.external import LAYER_FILE, VISITED_FILE, RecordFile, _merge, external_bfs
+from tubes.model import Game, PRUNING_SAFE, UnsolvableError
+from tubes.solve import EXTERNAL, Budget, solve
+
+
+class TestExternal(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+        with open('fixtures/game_partial_pour.yml') as file:
+            self.game = Game(yaml.safe_load(file))
+
+    def tearDown(self) -> None:
+        self.directory.cleanup()
+
+    def path(self, name):
+        return os.path.join(self.directory.name, name)
+
+    def write(self, name, records):
+        with open(self.path(name), 'wb') as file:
+            file.write(b''.join(records))
+        return self.path(name)
+
+    def test_record_file(self):
+        path = self.write('records.bin', [b'aa1', b'bb2', b'dd3'])
+        with RecordFile(path, 3, 2) as records:
+            self.assertEqual(3, len(records))
+            self.assertEqual([b'aa1', b'bb2', b'dd3'], list(records))
+            self.assertEqual(b'bb2', records.find(b'bb'))
+            self.assertIsNone(records.find(b'cc'))
+        with RecordFile(self.write('empty.bin', []), 3, 2) as records:
+            self.assertEqual([], list(records))
+
+    def test_merge(self):
+        runs = [RecordFile(self.write('run_0.bin', [b'aa1', b'cc1', b'ee1']), 3, 2),
+                RecordFile(self.write('run_1.bin', [b'bb2', b'cc2', b'dd2']), 3, 2)]
+        visited = RecordFile(self.write('visited.bin', [b'bb', b'dd', b'ff']), 2, 2)
+        count = _merge(runs, visited, self.path('layer.bin'), self.path('new.bin'), 2)
+        self.assertEqual(3, count)
+        with RecordFile(self.path('layer.bin'), 3, 2) as layer:
+            self.assertEqual([b'aa1', b'cc1', b'ee1'], list(layer))
+        with RecordFile(self.path('new.bin'), 2, 2) as keys:
+            self.assertEqual([b'aa', b'bb', b'cc', b'dd', b'ee', b'ff'], list(keys))
+
+    def test_external_bfs(self):
+        for symmetry in (True, False):
+            with tempfile.TemporaryDirectory() as directory:
+                solution = external_bfs(deepcopy(self.game), symmetry, PRUNING_SAFE,
+                                        Budget(), True, directory, run_size=2)
+                self.assertTrue(os.path.exists(os.path.join(directory, VISITED_FILE)))
+                self.assertTrue(os.path.exists(os.path.join(directory,
+                                                            LAYER_FILE.format(2))))
+            self.assertEqual(len(solve(self.game, symmetry=symmetry)), len(solution))
+            for move in solution:
+                self.game._push_move(*move)
+            self.assertTrue(self.game._solved)
+            for _ in solution:
+                self.game._pop_move()
+
+    def test_solve(self):
+        with open('fixtures/lvl3.yml') as file:
+            game = Game(yaml.safe_load(file))
+        self.assertEqual(len(solve(game)), len(solve(game, mode=EXTERNAL)))
+        solve(game, mode=EXTERNAL, work_dir=self.directory.name)
+        self.assertTrue(os.path.exists(self.path(LAYER_FILE.format(0))))
+
+    def test_solve_unsolvable(self):
+        with open('fixtures/game_unsolvable.yml') as file:
+            game = Game(yaml.safe_load(file))
+        with self.assertRaises(UnsolvableError) as context:
+            solve(game, mode=EXTERNAL)
+        self.assertEqual(UnsolvableError.EXHAUSTED, context.exception.reason)
+
+
+if __name__ == '__main__':
+    unittest.main()
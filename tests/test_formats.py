@@ -0,0 +1,74 @@
+import io
+import json
+import os
+import tempfile
+import unittest
+
+import yaml
+
+from tubes.formats import convert, from_record, iter_jsonl, to_record
+from tubes.model import Game
+from tubes.runner import SOLVED, iter_puzzles, run_batch
+from tubes.solve import solve
+
+
+class TestFormats(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.paths = sorted(os.path.join('fixtures', name)
+                            for name in os.listdir('fixtures'))
+
+    def test_round_trip(self):
+        for path in self.paths:
+            with open(path) as file:
+                game = Game(yaml.safe_load(file))
+            record = json.loads(json.dumps(to_record(game, path)))
+            loaded = from_record(record)
+            self.assertEqual(game, loaded, path)
+            self.assertEqual(game._pack(), loaded._pack(), path)
+            self.assertEqual(game._color_counter, loaded._color_counter, path)
+            self.assertEqual(game._zobrist, loaded._zobrist, path)
+
+    def test_record(self):
+        game = Game({1: ['blue', 'blue', 'green', 'blue'],
+                     2: ['blue', 'green', 'green', 'green'], 3: None})
+        self.assertEqual({'colors': ['blue', 'green'], 'capacity': 4,
+                          'grid': 'aaba/abbb/....'}, to_record(game))
+        self.assertEqual(4, len(solve(from_record(to_record(game)))))
+
+    def test_invalid(self):
+        record = {'colors': ['blue', 'green'], 'capacity': 4, 'grid': 'aaba/abbb/....'}
+        for changes in ({'grid': 'aaba/a.bb/....'}, {'grid': 'aaba/abbb/...'},
+                        {'grid': 'aaba/abbc/....'}, {'grid': 'aaba/ab#b/....'},
+                        {'colors': ['blue', 'blue']}, {'capacity': 0},
+                        {'grid': 'aabaa/bbb/....'}, {'grid': 'aaba/abbb/..../'},
+                        {'grid': ''}):
+            with self.subTest(changes=changes), self.assertRaises(ValueError):
+                from_record({**record, **changes})
+
+    def test_iter_jsonl(self):
+        stream = io.StringIO(
+            '{"name": "first", "colors": ["blue"], "capacity": 2, "grid": "aa/.."}\n'
+            '\n'
+            'not json\n'
+            '{"colors": ["blue"], "capacity": 2, "grid": "a./.a"}\n'
+            '{"colors": ["blue"], "capacity": 2, "grid": ".a/.a"}\n')
+        puzzles = list(iter_jsonl(stream, 'stream'))
+        self.assertEqual(['first', 'stream:3', 'stream:4', 'stream:5'],
+                         [name for name, _ in puzzles])
+        self.assertIsInstance(puzzles[0][1], Game)
+        self.assertIsInstance(puzzles[1][1], ValueError)
+        self.assertIsInstance(puzzles[2][1], ValueError)
+        self.assertIsInstance(puzzles[3][1], Game)
+
+    def test_convert(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'puzzles.jsonl')
+            with open(path, 'w') as output:
+                convert(['fixtures/lvl3.yml', 'fixtures/game_solved.yml'], output)
+            puzzles = list(iter_puzzles([directory]))
+            self.assertEqual(['fixtures/lvl3.yml', 'fixtures/game_solved.yml'],
+                             [name for name, _ in puzzles])
+            output = io.StringIO()
+            counts = run_batch(puzzles, output, jobs=1)
+        self.assertEqual(2, counts[SOLVED])
@@ -1,8 +1,19 @@
+import random
 import unittest
 
 import yaml
 
-from tubes.model import Game, Tube, Color, move
+from tubes.model import (Game, Tube, Color, move, PRUNING_AGGRESSIVE, PRUNING_NONE,
+                         PRUNING_SAFE, UnsolvableError, independent)
+
+
+class TestIndependent(unittest.TestCase):
+
+    def test_independent(self):
+        self.assertTrue(independent((1, 2), (3, 4)))
+        self.assertFalse(independent((1, 2), (2, 3)))
+        self.assertFalse(independent((1, 2), (3, 1)))
+        self.assertFalse(independent((1, 2), (1, 2)))
 
 
 class TestColor(unittest.TestCase):
@@ -150,6 +161,48 @@ class TestTube(unittest.TestCase):
             Tube(['red', 'red', 'red', 'red'])._colors
         )
 
+    def test_runs(self):
+        self.assertEqual([], self.tube_empty._runs)
+        self.assertEqual([(Color('blue'), 1), (Color('yellow'), 1)],
+                         self.tube_half_full._runs)
+        self.assertEqual([(Color('red'), 2), (Color('blue'), 1), (Color('yellow'), 1)],
+                         Tube(['red', 'red', 'blue', 'yellow'])._runs)
+
+    def test_capacity(self):
+        tube = Tube([None, None, 'red', 'red', 'blue', 'blue'])
+        self.assertEqual(6, tube._capacity)
+        self.assertEqual(['first', 'second', 'third', 'fourth', 'fifth', 'sixth'],
+                         list(tube))
+        self.assertEqual(['third', 'fourth'], tube._slots_to_pour)
+        self.assertEqual('second', tube._last_empty)
+        self.assertEqual(8, Tube([None] * 8)._capacity)
+        self.assertEqual('slot_9', list(Tube([None] * 9))[-1])
+        self.assertEqual(4, Tube([])._capacity)
+        self.assertEqual(5, Tube(None, capacity=5)._capacity)
+
+    def test_floating_color(self):
+        with self.assertRaises(ValueError):
+            Tube(['red', None, 'blue', 'blue'])
+
+    def test_run_tracking(self):
+        tube = Tube([None, 'red', 'red', 'blue'])
+        self.assertEqual((2, 2, 3), (tube._run, tube._num_runs, tube._fill))
+        tube._add(tube._palette.add(Color('red')), 1)
+        self.assertEqual((3, 2, 4), (tube._run, tube._num_runs, tube._fill))
+        tube._remove(3)
+        self.assertEqual((1, 1, 1), (tube._run, tube._num_runs, tube._fill))
+        tube._remove(1)
+        self.assertEqual((0, 0, 0), (tube._run, tube._num_runs, tube._fill))
+        self.assertEqual(self.tube_empty, tube)
+
+    def test_load(self):
+        tube = Tube([None, 'red', 'red', 'blue'])
+        cells = bytes(tube._cells)
+        tube._remove(2)
+        tube._load(cells)
+        self.assertEqual(Tube([None, 'red', 'red', 'blue']), tube)
+        self.assertEqual((2, 2, 3), (tube._run, tube._num_runs, tube._fill))
+
     def test_pour_in(self):
         # Argument must be of type `Tube`
         with self.assertRaises(TypeError):
@@ -227,6 +280,71 @@ class TestGame(unittest.TestCase):
     def test_color_score(self):
         self.assertEqual(9, self.game._color_score)
 
+    def test_incremental_color_score(self):
+        with open('fixtures/game_partial_pour.yml') as file:
+            config = yaml.safe_load(file)
+        game = Game(config)
+        rand = random.Random(0)
+        for _ in range(50):
+            moves = game._generate_moves()
+            if not moves:
+                break
+            for comb in moves:
+                expected = game._score_move(*comb)
+                game._push_move(*comb)
+                self.assertEqual(expected, game._color_score)
+                self.assertEqual(sum(game._color_score_raw.values()), game._color_score)
+                game._pop_move()
+            game._push_move(*rand.choice(moves))
+
+    def test_validate(self):
+        self.game._validate()
+        with open('fixtures/game_solved.yml') as file:
+            Game(yaml.safe_load(file))._validate()
+
+        with open('fixtures/game_wrong_color_count.yml') as file:
+            game = Game(yaml.safe_load(file))
+        with self.assertRaises(UnsolvableError) as context:
+            game._validate()
+        self.assertEqual(UnsolvableError.COLOR_COUNT, context.exception.reason)
+        self.assertEqual({'blue': 3}, context.exception.details['counts'])
+
+        game = Game({1: ['blue', 'blue', 'blue', 'blue'], 2: [None, None, None]})
+        with self.assertRaises(UnsolvableError) as context:
+            game._validate()
+        self.assertEqual(UnsolvableError.CAPACITY, context.exception.reason)
+
+        game = Game({1: ['red', 'red', 'red'], 2: ['blue', 'blue', 'blue', 'blue'],
+                     3: [None] * 4, 4: [None, None, 'red', 'blue']})
+        with self.assertRaises(UnsolvableError) as context:
+            game._validate()
+        self.assertEqual(UnsolvableError.CAPACITY, context.exception.reason)
+
+        game = Game({1: ['blue', 'green', 'blue', 'green'],
+                     2: ['green', 'blue', 'green', 'blue']})
+        with self.assertRaises(UnsolvableError) as context:
+            game._validate()
+        self.assertEqual(UnsolvableError.NOT_ENOUGH_TUBES, context.exception.reason)
+
+        with open('fixtures/game_dead_end.yml') as file:
+            game = Game(yaml.safe_load(file))
+        with self.assertRaises(UnsolvableError) as context:
+            game._validate()
+        self.assertEqual(UnsolvableError.DEAD_END, context.exception.reason)
+
+    def test_dead_end(self):
+        self.assertFalse(self.game._dead_end)
+        with open('fixtures/game_dead_end.yml') as file:
+            game = Game(yaml.safe_load(file))
+        self.assertTrue(game._dead_end)
+        self.assertEqual([], game._generate_moves(PRUNING_NONE))
+
+    def test_lower_bound(self):
+        self.assertEqual(3, self.game._lower_bound)
+        with open('fixtures/game_solved.yml') as file:
+            config = yaml.safe_load(file)
+        self.assertEqual(0, Game(config)._lower_bound)
+
     def test_iterate(self):
         items = iter(self.game)
         self.assertEqual('tube_1', next(items))
@@ -263,6 +381,23 @@ class TestGame(unittest.TestCase):
         self.assertEqual(Tube(['blue', 'green', 'green', 'green']),
                          self.game._retrieve_tube(2))
         self.assertEqual(Tube([]), self.game._retrieve_tube(3))
+        self.assertIs(self.game.tube_2, self.game._retrieve_tube(2))
+        self.assertIsNone(self.game._retrieve_tube(4))
+        self.assertIsNone(self.game._retrieve_tube(0))
+
+    def test_solved_tracking(self):
+        with open('fixtures/game_simple_transfer.yml') as file:
+            config = yaml.safe_load(file)
+        game = Game(config)
+        self.assertEqual({3}, game._solved_tubes)
+        game._push_move(1, 2)
+        self.assertEqual({3}, game._solved_tubes)
+        game._push_move(1, 3)
+        self.assertEqual({1}, game._solved_tubes)
+        game._pop_move()
+        game._pop_move()
+        self.assertEqual({3}, game._solved_tubes)
+        self.assertFalse(game._solved)
 
     def test_forecast(self):
         self.assertEqual({}, self.game._legal_moves)
@@ -275,6 +410,67 @@ class TestGame(unittest.TestCase):
         with self.assertRaises(InterruptedError):
             game._forecast()
 
+    def test_forecast_pruning(self):
+        with open('fixtures/game_dominated_moves.yml') as file:
+            config = yaml.safe_load(file)
+        game = Game(config)
+        game._forecast(PRUNING_NONE)
+        self.assertEqual({(1, 3), (1, 4), (2, 1), (2, 3), (2, 4)},
+                         set(game._legal_moves))
+        # Pouring a single color tube into an empty one only relabels the tubes, and
+        # both empty tubes are equivalent destinations
+        game._forecast(PRUNING_SAFE)
+        self.assertEqual({(2, 1), (2, 3)}, set(game._legal_moves))
+        # The red can be poured onto red, so pouring it into an empty tube is skipped
+        game._forecast(PRUNING_AGGRESSIVE)
+        self.assertEqual({(2, 1)}, set(game._legal_moves))
+
+    def test_forecast_aggressive_pruning(self):
+        with open('fixtures/game_partial_pour.yml') as file:
+            config = yaml.safe_load(file)
+        game = Game(config)
+        game._forecast(PRUNING_SAFE)
+        self.assertEqual({(1, 3), (2, 1), (2, 3), (2, 4), (3, 1), (3, 4)},
+                         set(game._legal_moves))
+        # (2, 3) would split the blue run of tube 2, which fits whole in tube 1
+        game._forecast(PRUNING_AGGRESSIVE)
+        self.assertEqual({(1, 3), (2, 1), (3, 1)}, set(game._legal_moves))
+
+    def test_generate_moves(self):
+        self.assertEqual([(1, 3), (2, 3)], self.game._generate_moves())
+        with open('fixtures/game_no_legal_moves.yml') as file:
+            config = yaml.safe_load(file)
+        self.assertEqual([], Game(config)._generate_moves())
+
+    def test_top_color_index(self):
+        def snapshot(game):
+            return ({color: set(ids) for color, ids in game._tops.items() if ids},
+                    set(game._empty_tubes), set(game._open_tubes))
+
+        self.assertEqual(({Color('blue'): {1, 2}}, {3}, {3}), snapshot(self.game))
+        self.game._push_move(1, 3)
+        self.assertEqual(({Color('green'): {1}, Color('blue'): {2, 3}}, set(), {1, 3}),
+                         snapshot(self.game))
+        moved = snapshot(self.game)
+        self.game._index_tubes()
+        self.assertEqual(moved, snapshot(self.game))
+        self.game._pop_move()
+        self.assertEqual(({Color('blue'): {1, 2}}, {3}, {3}), snapshot(self.game))
+
+    def test_commutes(self):
+        with open('fixtures/game_partial_pour.yml') as file:
+            config = yaml.safe_load(file)
+        game = Game(config)
+        # Pours onto a tube that already holds blue
+        self.assertTrue(game._commutes(game._push_move(2, 1)))
+        game._pop_move()
+        # Pours into an empty tube
+        self.assertFalse(game._commutes(game._push_move(2, 4)))
+        game._pop_move()
+        # Empties its source
+        self.assertFalse(game._commutes(game._push_move(1, 3)))
+        game._pop_move()
+
     def test_push_move(self):
         with open('fixtures/game_simple_transfer.yml') as file:
             config = yaml.safe_load(file)
@@ -288,6 +484,77 @@ class TestGame(unittest.TestCase):
         self.assertEqual(Tube([None, 'green', 'green', 'green']), game.tube_2)
         self.assertEqual([expected_move], game._moves)
 
+    def test_pack(self):
+        state = self.game._pack()
+        self.assertIsInstance(state, bytes)
+        self.assertEqual(bytes([1, 1, 2, 1, 1, 2, 2, 2, 0, 0, 0, 0]), state)
+        self.game._push_move(1, 3)
+        self.assertNotEqual(state, self.game._pack())
+
+    def test_unpack(self):
+        state = self.game._pack()
+        self.game._push_move(1, 3)
+        self.game._push_move(2, 3)
+        self.game._unpack(state)
+        self.assertEqual(state, self.game._pack())
+        self.assertEqual(Tube(['blue', 'blue', 'green', 'blue']), self.game.tube_1)
+        self.assertEqual(Tube([]), self.game.tube_3)
+        self.assertEqual([], self.game._moves)
+
+    def test_zobrist(self):
+        initial = self.game._zobrist
+        self.assertEqual(initial, hash(self.game))
+        self.game._push_move(1, 3)
+        self.assertNotEqual(initial, self.game._zobrist)
+        self.assertEqual(self.game._zobrist_hash(), self.game._zobrist)
+        self.game._push_move(2, 3)
+        self.assertEqual(self.game._zobrist_hash(), self.game._zobrist)
+        self.game._pop_move()
+        self.game._pop_move()
+        self.assertEqual(initial, self.game._zobrist)
+
+    def test_ordered_zobrist(self):
+        initial = self.game._ordered_zobrist
+        self.game._push_move(1, 3)
+        ordered = self.game._ordered_zobrist
+        self.assertNotEqual(initial, ordered)
+        self.game._pop_move()
+        self.assertEqual(initial, self.game._ordered_zobrist)
+        state = self.game._pack()
+        self.game._push_move(1, 3)
+        self.game._unpack(state)
+        self.assertEqual(initial, self.game._ordered_zobrist)
+
+        permuted = Game({1: None,
+                         2: ['blue', 'green', 'green', 'green'],
+                         3: ['blue', 'blue', 'green', 'blue']})
+        self.assertEqual(self.game._zobrist, permuted._zobrist)
+        self.assertNotEqual(self.game._ordered_zobrist, permuted._ordered_zobrist)
+
+    def test_canonical(self):
+        state, order = self.game._canonical()
+        self.assertEqual(bytes([0, 0, 0, 0, 1, 1, 2, 1, 1, 2, 2, 2]), state)
+        self.assertEqual((3, 1, 2), order)
+
+        config = {1: None,
+                  2: ['blue', 'green', 'green', 'green'],
+                  3: ['blue', 'blue', 'green', 'blue']}
+        permuted = Game(config)
+        self.assertEqual(self.game._zobrist, permuted._zobrist)
+        self.assertEqual(state, permuted._canonical()[0])
+        self.assertEqual(state, permuted._canonical(
+            bytes(permuted._palette.code(self.game._palette.color(code))
+                  for code in permuted._pack()))[0])
+        self.assertEqual((1, 3, 2), permuted._canonical()[1])
+
+    def test_eq(self):
+        with open('fixtures/lvl3.yml') as file:
+            config = yaml.safe_load(file)
+        other = Game(config)
+        self.assertEqual(other, self.game)
+        other._push_move(1, 3)
+        self.assertNotEqual(other, self.game)
+
     def test_pop_move(self):
         with open('fixtures/game_simple_transfer_complete.yml') as file:
             config = yaml.safe_load(file)
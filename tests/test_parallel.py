@@ -0,0 +1,72 @@
+import threading
+import time
+import unittest
+
+import yaml
+
+from tubes.bench.generate import generate_board
+from tubes.model import Game, UnsolvableError
+from tubes.parallel import _shard
+from tubes.solve import ASTAR, Budget, BudgetExhausted, solve
+
+
+class TestParallelBFS(unittest.TestCase):
+
+    def setUp(self) -> None:
+        with open('fixtures/game_partial_pour.yml') as file:
+            self.game = Game(yaml.safe_load(file))
+
+    def test_shard(self):
+        self.assertEqual(0, _shard(6, 3))
+        self.assertEqual(3, _shard(2 ** 64 - 1, 4))
+
+    def test_solve(self):
+        for symmetry in (True, False):
+            solution = solve(self.game, workers=2, symmetry=symmetry)
+            self.assertEqual(len(solve(self.game, symmetry=symmetry)), len(solution))
+            self.assertTrue(solution.optimal)
+            for move in solution:
+                self.game._push_move(*move)
+            self.assertTrue(self.game._solved)
+            for _ in solution:
+                self.game._pop_move()
+
+    def test_solve_more_workers_than_states(self):
+        with open('fixtures/lvl3.yml') as file:
+            game = Game(yaml.safe_load(file))
+        self.assertEqual(len(solve(game)), len(solve(game, workers=8)))
+
+    def test_solve_unsolvable(self):
+        with open('fixtures/game_unsolvable.yml') as file:
+            game = Game(yaml.safe_load(file))
+        with self.assertRaises(UnsolvableError) as context:
+            solve(game, workers=2)
+        self.assertEqual(UnsolvableError.EXHAUSTED, context.exception.reason)
+
+    def test_solve_budget(self):
+        with self.assertRaises(BudgetExhausted):
+            solve(self.game, workers=2, budget=Budget(max_nodes=1))
+
+        # cancelling stops the workers in the middle of a layer
+        game = Game(generate_board(10, depth=500))
+        cancel = threading.Event()
+        cancelled = []
+
+        def stop():
+            cancelled.append(time.monotonic())
+            cancel.set()
+
+        timer = threading.Timer(0.5, stop)
+        timer.start()
+        with self.assertRaises(BudgetExhausted):
+            solve(game, workers=2, budget=Budget(cancel=cancel))
+        timer.join()
+        self.assertLess(time.monotonic() - cancelled[0], 0.25)
+
+    def test_solve_other_modes(self):
+        with self.assertRaises(ValueError):
+            solve(self.game, mode=ASTAR, workers=2)
+
+
+if __name__ == '__main__':
+    unittest.main()
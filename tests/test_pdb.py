@@ -0,0 +1,84 @@
+import os
+import pickle
+import tempfile
+import unittest
+
+import yaml
+
+from tubes.model import Game
+from tubes.pdb import PatternDatabase, build
+from tubes.solve import ASTAR, BFS, IDASTAR, solve
+
+
+class TestPatternDatabase(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'four_two.pdb')
+        build(self.path, num_tubes=4, num_colors=2, pattern_size=1)
+        self.pdb = PatternDatabase(self.path)
+        with open('fixtures/game_partial_pour.yml') as file:
+            self.game = Game(yaml.safe_load(file))
+
+    def tearDown(self) -> None:
+        self.pdb.close()
+        self.directory.cleanup()
+
+    def test_build(self):
+        self.assertEqual(317, len(self.pdb))
+        self.assertEqual((4, 4, 2, 1), (self.pdb.num_tubes, self.pdb.capacity,
+                                        self.pdb.num_colors, self.pdb.pattern_size))
+
+    def test_call(self):
+        # with two colors one pattern color and the wildcard tell every color apart,
+        # so the bound is exact
+        self.assertEqual(3, self.pdb(self.game))
+        for move in solve(self.game, mode=BFS):
+            self.game._push_move(*move)
+        self.assertEqual(0, self.pdb(self.game))
+
+    def test_admissible(self):
+        path = os.path.join(self.directory.name, 'five_three.pdb')
+        build(path, num_tubes=5, num_colors=3, pattern_size=1)
+        game = Game({1: ['red', 'green', 'blue', 'red'],
+                     2: ['blue', 'red', 'green', 'green'],
+                     3: ['green', 'blue', 'red', 'blue'],
+                     4: None, 5: None})
+        with PatternDatabase(path) as pdb:
+            self.assertLessEqual(pdb(game), len(solve(game, mode=BFS)))
+            self.assertGreaterEqual(pdb(game), 1)
+
+    def test_pickle(self):
+        pdb = pickle.loads(pickle.dumps(self.pdb))
+        self.assertEqual(self.path, pdb.path)
+        self.assertEqual(3, pdb(self.game))
+        pdb.close()
+
+    def test_shape(self):
+        with open('fixtures/lvl3.yml') as file:
+            game = Game(yaml.safe_load(file))
+        with self.assertRaises(ValueError):
+            self.pdb._check(game)
+        with self.assertRaises(ValueError):
+            solve(game, mode=ASTAR, pdb=self.pdb)
+
+    def test_not_a_database(self):
+        path = os.path.join(self.directory.name, 'empty.pdb')
+        with open(path, 'wb') as file:
+            file.write(bytes(32))
+        with self.assertRaises(ValueError):
+            PatternDatabase(path)
+
+    def test_build_arguments(self):
+        with self.assertRaises(ValueError):
+            build(self.path, num_tubes=2, num_colors=2, pattern_size=1)
+
+    def test_solve(self):
+        for mode in (ASTAR, IDASTAR):
+            solution = solve(self.game, mode=mode, pdb=self.pdb)
+            self.assertEqual(3, len(solution))
+            self.assertTrue(solution.optimal)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,131 @@
+import io
+import json
+import os
+import tempfile
+import unittest
+
+from tubes.formats import to_record
+from tubes.model import Game
+from tubes.runner import (ERROR, SOLVED, STDIN, TIMEOUT, UNSOLVABLE, iter_puzzles,
+                          run_batch)
+
+STREAM = '''
+1: [blue, blue, green, blue]
+2: [blue, green, green, green]
+3: null
+---
+1: [null, blue, blue, blue]
+2: [blue, green, green, green]
+3: [null, null, null, green]
+---
+1: [null, red, red, red]
+2: null
+'''
+
+PARENT_PID = os.getpid()
+
+
+class CrashingGame(Game):
+    """
+    Board whose search kills the worker process solving it.
+    """
+    def _validate(self):
+        if os.getpid() != PARENT_PID:
+            os._exit(1)
+        super()._validate()
+
+
+class TestRunner(unittest.TestCase):
+
+    def run_batch(self, puzzles, **kwargs):
+        output = io.StringIO()
+        counts = run_batch(puzzles, output, **kwargs)
+        return counts, [json.loads(line) for line in output.getvalue().splitlines()]
+
+    def test_iter_puzzles(self):
+        names = [name for name, _ in iter_puzzles(['fixtures'])]
+        self.assertIn(os.path.join('fixtures', 'lvl3.yml'), names)
+        self.assertEqual(len(os.listdir('fixtures')), len(names))
+        self.assertEqual([os.path.join('fixtures', 'lvl3.yml')],
+                         [name for name, _ in iter_puzzles(['fixtures/lvl*.yml'])])
+
+        puzzles = list(iter_puzzles([STDIN], io.StringIO(STREAM)))
+        self.assertEqual(['<stdin>:1', '<stdin>:2', '<stdin>:3'],
+                         [name for name, _ in puzzles])
+        self.assertEqual([None, 'blue', 'blue', 'blue'], puzzles[1][1][1])
+
+        (name, config), = iter_puzzles(['fixtures/missing.yml'])
+        self.assertIsInstance(config, OSError)
+
+    def test_iter_puzzles_jsonl(self):
+        records = [to_record(Game(config)) for _, config in
+                   iter_puzzles([STDIN], io.StringIO(STREAM))][:2]
+        stream = io.StringIO(''.join(json.dumps(record) + '\n' for record in records)
+                             + 'not json\n')
+        puzzles = list(iter_puzzles([STDIN], stream, jsonl=True))
+        self.assertEqual(['<stdin>:1', '<stdin>:2', '<stdin>:3'],
+                         [name for name, _ in puzzles])
+        self.assertEqual(records, [to_record(game) for _, game in puzzles[:2]])
+        self.assertIsInstance(puzzles[2][1], ValueError)
+
+    def test_run_batch(self):
+        puzzles = list(iter_puzzles([STDIN], io.StringIO(STREAM)))
+        puzzles.append(('broken', OSError('no such file')))
+        counts, results = self.run_batch(puzzles, jobs=1)
+        self.assertEqual({SOLVED: 2, UNSOLVABLE: 1, TIMEOUT: 0, ERROR: 1}, counts)
+        by_name = {result['puzzle']: result for result in results}
+        self.assertEqual(4, by_name['<stdin>:1']['depth'])
+        self.assertEqual(4, len(by_name['<stdin>:1']['moves']))
+        self.assertTrue(by_name['<stdin>:1']['optimal'])
+        self.assertGreater(by_name['<stdin>:1']['nodes'], 0)
+        self.assertIn('seconds', by_name['<stdin>:1'])
+        self.assertEqual('color_count', by_name['<stdin>:3']['reason'])
+        self.assertIn('no such file', by_name['broken']['error'])
+
+    def test_longest_first(self):
+        puzzles = list(iter_puzzles([STDIN], io.StringIO(STREAM)))[:2]
+        _, results = self.run_batch(puzzles, jobs=1)
+        # the first board needs more moves than the second
+        self.assertEqual(['<stdin>:1', '<stdin>:2'],
+                         [result['puzzle'] for result in results])
+        _, results = self.run_batch(puzzles[::-1], jobs=1)
+        self.assertEqual(['<stdin>:1', '<stdin>:2'],
+                         [result['puzzle'] for result in results])
+
+    def test_timeout(self):
+        puzzles = list(iter_puzzles([STDIN], io.StringIO(STREAM)))[:1]
+        counts, results = self.run_batch(puzzles, jobs=1, max_nodes=1)
+        self.assertEqual(1, counts[TIMEOUT])
+        self.assertEqual(1, results[0]['nodes'])
+
+    def test_pool(self):
+        with tempfile.TemporaryDirectory() as directory:
+            from tubes.cache import SolutionCache
+            cache = SolutionCache(os.path.join(directory, 'solutions.db'))
+            puzzles = list(iter_puzzles([STDIN], io.StringIO(STREAM)))
+            counts, results = self.run_batch(puzzles, jobs=2, cache=cache)
+            self.assertEqual({SOLVED: 2, UNSOLVABLE: 1, TIMEOUT: 0, ERROR: 0}, counts)
+            self.assertEqual(sorted(name for name, _ in puzzles),
+                             sorted(result['puzzle'] for result in results))
+            by_name = {result['puzzle']: result for result in results}
+            self.assertEqual(4, by_name['<stdin>:1']['depth'])
+            self.assertEqual(2, len(cache))
+            cache.close()
+
+    def test_worker_died(self):
+        puzzles = list(iter_puzzles([STDIN], io.StringIO(STREAM)))[:2] * 3
+        puzzles = [(f'{name}-{index}', config)
+                   for index, (name, config) in enumerate(puzzles)]
+        puzzles.append(('crash', CrashingGame(puzzles[0][1])))
+        counts, results = self.run_batch(puzzles, jobs=2)
+        self.assertEqual(sorted(name for name, _ in puzzles),
+                         sorted(result['puzzle'] for result in results))
+        by_name = {result['puzzle']: result for result in results}
+        self.assertEqual(ERROR, by_name['crash']['status'])
+        self.assertIn('BrokenProcessPool', by_name['crash']['error'])
+        # only the boards running alongside it on the other worker can be lost
+        self.assertGreaterEqual(counts[SOLVED], len(puzzles) - 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
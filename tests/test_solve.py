@@ -1,9 +1,125 @@
+import threading
 import unittest
+from unittest import mock
 
 import yaml
 
-from tubes.model import Game
-from tubes.solve import solve
+from tubes.bench.generate import generate_board
+from tubes.model import Game, PRUNING_AGGRESSIVE, PRUNING_NONE, UnsolvableError
+from tubes.solve import (ASTAR, BEAM, BFS, IDASTAR, TABLE_SIZE, WEIGHTED, Budget,
+                         BudgetExhausted, GameState, SearchStats, TranspositionTable,
+                         VisitedStates, solve, solve_anytime)
+
+
+class TestGameState(unittest.TestCase):
+    def test_moves(self):
+        root = GameState(b'a')
+        self.assertEqual([], root.moves)
+        child = GameState(b'b', root, (1, 3))
+        grandchild = GameState(b'c', child, (2, 3))
+        self.assertEqual([(1, 3), (2, 3)], grandchild.moves)
+
+
+class TestVisitedStates(unittest.TestCase):
+    def test_add(self):
+        visited = VisitedStates()
+        self.assertTrue(visited.add(1, b'a'))
+        self.assertFalse(visited.add(1, b'a'))
+        self.assertTrue(visited.add(2, b'b'))
+        self.assertEqual(2, len(visited))
+
+    def test_collision(self):
+        visited = VisitedStates()
+        self.assertTrue(visited.add(1, b'a'))
+        self.assertTrue(visited.add(1, b'b'))
+        self.assertFalse(visited.add(1, b'b'))
+        self.assertFalse(visited.add(1, b'a'))
+        self.assertEqual(2, len(visited))
+
+
+class TestTranspositionTable(unittest.TestCase):
+    def test_lru_eviction(self):
+        table = TranspositionTable(2)
+        table.put(b'a', 1)
+        table.put(b'b', 2)
+        self.assertEqual(1, table.get(b'a'))
+        table.put(b'c', 3)
+        self.assertEqual(2, len(table))
+        self.assertIsNone(table.get(b'b'))
+        self.assertEqual(1, table.get(b'a'))
+        self.assertEqual(3, table.get(b'c'))
+
+
+class TestBudget(unittest.TestCase):
+    def test_max_nodes(self):
+        budget = Budget(max_nodes=2)
+        budget.spend()
+        budget.spend()
+        with self.assertRaises(BudgetExhausted):
+            budget.spend()
+
+    def test_max_seconds(self):
+        budget = Budget(max_seconds=0)
+        with self.assertRaises(BudgetExhausted):
+            budget.spend()
+
+    def test_cancel(self):
+        cancel = threading.Event()
+        budget = Budget(cancel=cancel)
+        budget.spend()
+        cancel.set()
+        with self.assertRaises(BudgetExhausted):
+            budget.spend()
+
+
+class TestSearchStats(unittest.TestCase):
+    def setUp(self) -> None:
+        with open('fixtures/lvl3.yml') as file:
+            self.game = Game(yaml.safe_load(file))
+
+    def test_bfs(self):
+        solution = solve(self.game, mode=BFS)
+        stats = solution.stats
+        self.assertEqual(len(solution), stats.depth)
+        self.assertEqual(1, stats.frontier[0])
+        self.assertEqual(len(solution), len(stats.frontier))
+        self.assertEqual(max(stats.frontier), stats.peak_frontier)
+        self.assertGreater(stats.generated, stats.duplicates)
+        self.assertGreater(stats.visited, 1)
+        self.assertGreaterEqual(stats.branching_factor, 1)
+        self.assertNotIn('move_seconds', stats.as_dict())
+
+    def test_modes(self):
+        for mode in (ASTAR, WEIGHTED, IDASTAR, BEAM):
+            stats = solve(self.game, mode=mode).stats
+            self.assertGreater(stats.expanded, 0, mode)
+            self.assertGreaterEqual(stats.generated, stats.expanded, mode)
+
+    def test_branching_factor(self):
+        stats = SearchStats()
+        stats.depth, stats.generated = 3, 14
+        self.assertAlmostEqual(2, stats.branching_factor, places=3)
+
+    def test_callback(self):
+        calls = []
+        stats = SearchStats(callback=lambda stats: calls.append(stats.expanded),
+                            every=2, timing=True)
+        solve(self.game, mode=ASTAR, stats=stats)
+        self.assertEqual(list(range(2, stats.expanded + 1, 2)), calls)
+        self.assertGreater(stats.move_seconds, 0)
+        self.assertGreater(stats.hash_seconds, 0)
+        self.assertIn('copy_seconds', stats.as_dict())
+
+        calls = []
+        solve(self.game, mode=BFS, stats=SearchStats(callback=calls.append, every=1000))
+        self.assertEqual(calls[-1].depth, len(calls[-1].frontier))
+
+    def test_budget_exhausted(self):
+        stats = SearchStats()
+        with self.assertRaises(BudgetExhausted):
+            solve(self.game, budget=Budget(max_nodes=3), stats=stats)
+        self.assertEqual(3, stats.expanded)
+        self.assertIsNone(stats.depth)
 
 
 class TestSolve(unittest.TestCase):
@@ -16,6 +132,153 @@ class TestSolve(unittest.TestCase):
             game._push_move(*move)
         self.assertTrue(game._solved)
 
+    def test_solve_modes(self):
+        with open('fixtures/lvl3.yml') as file:
+            config = yaml.safe_load(file)
+        game = Game(config)
+        optimal = len(solve(game, mode=BFS))
+        self.assertEqual(optimal, len(solve(game, mode=ASTAR)))
+        for mode in (ASTAR, WEIGHTED):
+            moves = solve(game, mode=mode)
+            for move in moves:
+                game._push_move(*move)
+            self.assertTrue(game._solved)
+            for _ in moves:
+                game._pop_move()
+
+    def test_solve_idastar(self):
+        for fixture in ('fixtures/lvl3.yml', 'fixtures/game_partial_pour.yml'):
+            with open(fixture) as file:
+                config = yaml.safe_load(file)
+            game = Game(config)
+            optimal = len(solve(game, mode=BFS))
+            for table_size in (1, 1000):
+                moves = solve(game, mode=IDASTAR, table_size=table_size)
+                self.assertEqual(optimal, len(moves))
+                for move in moves:
+                    game._push_move(*move)
+                self.assertTrue(game._solved)
+                for _ in moves:
+                    game._pop_move()
+
+    def test_solve_beam(self):
+        with open('fixtures/game_partial_pour.yml') as file:
+            config = yaml.safe_load(file)
+        game = Game(config)
+        for beam_width in (1, 1000):
+            moves = solve(game, mode=BEAM, beam_width=beam_width)
+            for move in moves:
+                game._push_move(*move)
+            self.assertTrue(game._solved)
+            for _ in moves:
+                game._pop_move()
+        # A beam wide enough to never be cut is a BFS
+        self.assertTrue(solve(game, mode=BEAM, beam_width=1000).optimal)
+
+    def test_solve_budget(self):
+        with open('fixtures/lvl3.yml') as file:
+            config = yaml.safe_load(file)
+        with self.assertRaises(BudgetExhausted):
+            solve(Game(config), budget=Budget(max_nodes=1))
+
+    def test_solve_anytime(self):
+        with open('fixtures/lvl3.yml') as file:
+            config = yaml.safe_load(file)
+        game = Game(config)
+        solution = solve_anytime(game, beam_width=1)
+        self.assertTrue(solution.optimal)
+        self.assertEqual(len(solve(game)), len(solution))
+
+        cancel = threading.Event()
+        cancel.set()
+        self.assertIsNone(solve_anytime(game, cancel=cancel))
+        self.assertIsNone(solve_anytime(game, max_nodes=1))
+        for kwargs in ({'mode': BFS}, {'budget': Budget()}, {'stats': SearchStats()}):
+            with self.assertRaises(TypeError):
+                solve_anytime(game, **kwargs)
+
+    def test_solve_partial_order(self):
+        for fixture in ('fixtures/lvl3.yml', 'fixtures/game_partial_pour.yml'):
+            with open(fixture) as file:
+                config = yaml.safe_load(file)
+            game = Game(config)
+            moves = solve(game, partial_order=True)
+            self.assertEqual(len(solve(game, partial_order=False)), len(moves))
+            for move in moves:
+                game._push_move(*move)
+            self.assertTrue(game._solved)
+
+    def test_solve_unsolvable(self):
+        with open('fixtures/game_wrong_color_count.yml') as file:
+            config = yaml.safe_load(file)
+        with self.assertRaises(UnsolvableError) as context:
+            solve(Game(config))
+        self.assertEqual(UnsolvableError.COLOR_COUNT, context.exception.reason)
+
+        # Passes every static check, but the search runs dry
+        with open('fixtures/game_unsolvable.yml') as file:
+            game = Game(yaml.safe_load(file))
+        for mode in (BFS, ASTAR, IDASTAR):
+            with self.assertRaises(UnsolvableError) as context:
+                solve(game, mode=mode)
+            self.assertEqual(UnsolvableError.EXHAUSTED, context.exception.reason)
+
+        # IDA* keeps raising its threshold over the few states of this board
+        game = Game({1: ['c', 'd', 'd', 'c'],
+                     2: ['b', 'a', 'a', 'c'],
+                     3: [None, None, 'a', 'b'],
+                     4: [None, 'b', 'a', 'd'],
+                     5: [None, 'b', 'c', 'd']})
+        for table_size in (1, 30, TABLE_SIZE):
+            with self.assertRaises(UnsolvableError) as context:
+                solve(game, mode=IDASTAR, table_size=table_size)
+            self.assertEqual(UnsolvableError.EXHAUSTED, context.exception.reason)
+
+    def test_solve_without_symmetry(self):
+        with open('fixtures/lvl3.yml') as file:
+            config = yaml.safe_load(file)
+        game = Game(config)
+        self.assertEqual(len(solve(game)), len(solve(game, symmetry=False)))
+
+        # permuted boards share `_zobrist`, so the visited set must key on their order
+        instances = []
+
+        class RecordingStates(VisitedStates):
+            def __init__(self):
+                super().__init__()
+                instances.append(self)
+
+        with mock.patch('tubes.solve.VisitedStates', RecordingStates):
+            solve(Game(generate_board(5)), symmetry=False)
+        visited, = instances
+        self.assertGreater(len(visited), 1000)
+        self.assertLessEqual(len(visited._collisions), 1)
+
+    def test_solve_pruning(self):
+        with open('fixtures/lvl3.yml') as file:
+            config = yaml.safe_load(file)
+        game = Game(config)
+        self.assertEqual(len(solve(game)), len(solve(game, pruning=PRUNING_NONE)))
+        moves = solve(game, pruning=PRUNING_AGGRESSIVE)
+        for move in moves:
+            game._push_move(*move)
+        self.assertTrue(game._solved)
+
+    def test_solve_unknown_mode(self):
+        with open('fixtures/lvl3.yml') as file:
+            config = yaml.safe_load(file)
+        with self.assertRaises(ValueError):
+            solve(Game(config), mode='dfs')
+
+    def test_solve_leaves_input_untouched(self):
+        with open('fixtures/lvl3.yml') as file:
+            config = yaml.safe_load(file)
+        game = Game(config)
+        state = game._pack()
+        solve(game)
+        self.assertEqual(state, game._pack())
+        self.assertEqual([], game._moves)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -1,16 +1,83 @@
+import argparse
+import logging
+
 import yaml
 
+from tubes.cache import SolutionCache
 from tubes.model import Game
-from tubes.solve import solve
+from tubes.pdb import PatternDatabase
+from tubes.solve import (BACKENDS, BEAM_WIDTH, BFS, MODES, PYTHON, Budget,
+                         BudgetExhausted, solve, solve_anytime)
 
 input_file = '../fixtures/test_1.yml'
 
 
-def main():
-    with open(input_file) as file:
+def parse_args(args=None):
+    parser = argparse.ArgumentParser(prog='tubes', description='Solve a tubes puzzle')
+    parser.add_argument('input_file', nargs='?', default=input_file,
+                        help='YAML puzzle file')
+    parser.add_argument('--mode', choices=MODES,
+                        help=f'search mode (default: {BFS}, or the anytime search '
+                             f'with --max-nodes or --max-seconds)')
+    parser.add_argument('--weight', type=float, default=2,
+                        help='heuristic weight for the weighted mode '
+                             '(default: %(default)s)')
+    parser.add_argument('--beam-width', type=int, default=BEAM_WIDTH,
+                        help='states kept per layer by the beam mode '
+                             '(default: %(default)s)')
+    parser.add_argument('--max-nodes', type=int,
+                        help='return the best solution found after expanding this '
+                             'many states; with --mode or an option of the bfs mode, '
+                             'stop that search instead')
+    parser.add_argument('--max-seconds', type=float,
+                        help='return the best solution found after this many seconds; '
+                             'with --mode or an option of the bfs mode, stop that '
+                             'search instead')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='processes for the bfs mode (default: %(default)s)')
+    parser.add_argument('--backend', choices=BACKENDS, default=PYTHON,
+                        help='engine for the bfs mode; numpy needs numpy installed '
+                             '(default: %(default)s)')
+    parser.add_argument('--work-dir',
+                        help='directory for the layer files of the external mode '
+                             '(default: a temporary directory)')
+    parser.add_argument('--checkpoint',
+                        help='file to save the progress of the bfs mode to')
+    parser.add_argument('--resume-from',
+                        help='checkpoint file to resume the bfs mode from')
+    parser.add_argument('--cache', help='SQLite file caching solved boards')
+    parser.add_argument('--pdb', help='pattern database file for the astar and idastar '
+                                      'modes, see tubes.pdb')
+    return parser.parse_args(args)
+
+
+def main(args=None):
+    args = parse_args(args)
+    with open(args.input_file) as file:
         config = yaml.safe_load(file)
     game = Game(config)
-    solve(game)
+    kwargs = {}
+    if args.pdb is not None:
+        kwargs['pdb'] = PatternDatabase(args.pdb)
+    if args.cache is not None:
+        kwargs['cache'] = SolutionCache(args.cache)
+    bounded = args.max_nodes is not None or args.max_seconds is not None
+    # the anytime search picks its own modes, so it only runs when none was asked for
+    searches = (args.mode is not None or args.workers > 1 or args.backend != PYTHON or
+                args.work_dir is not None or args.checkpoint is not None or
+                args.resume_from is not None)
+    if bounded and not searches:
+        solve_anytime(game, max_nodes=args.max_nodes, max_seconds=args.max_seconds,
+                      beam_width=args.beam_width, **kwargs)
+        return
+    budget = Budget(max_nodes=args.max_nodes, max_seconds=args.max_seconds)
+    try:
+        solve(game, mode=args.mode or BFS, weight=args.weight,
+              beam_width=args.beam_width, budget=budget, workers=args.workers,
+              backend=args.backend, work_dir=args.work_dir, checkpoint=args.checkpoint,
+              resume_from=args.resume_from, **kwargs)
+    except BudgetExhausted as exc:
+        logging.info('search stopped: %s', exc)
 
 
 if __name__ == '__main__':
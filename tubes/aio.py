@@ -0,0 +1,160 @@
+import asyncio
+import inspect
+import logging
+import multiprocessing
+import os
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from tubes.solve import CALLBACK_EVERY, Budget, SearchStats, solve
+
+# Progress of a search running in a worker process: the deepest layer reached by
+# a layered search, or None, the states expanded and generated so far, the states
+# held for deduplication as of the last layer, and the seconds since it started
+progress = namedtuple('progress', ['depth', 'expanded', 'generated', 'visited',
+                                   'seconds'])
+
+# Seconds a cancelled search is given to stop before its process is terminated
+CANCEL_GRACE = 2
+# Seconds between two checks that a stopping process has exited
+POLL_SECONDS = 0.01
+
+# Kind of a message sent by a worker process
+_PROGRESS = 'progress'
+_DONE = 'done'
+_ERROR = 'error'
+
+
+def _context():
+    """
+    :return: multiprocessing context of the worker processes. The fork server starts
+        them from a clean process, without the threads of the event loop, where it is
+        available.
+    """
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('forkserver')
+    return multiprocessing.get_context('spawn')
+
+
+def _run(connection, cancel, game, every, max_nodes, max_seconds, kwargs):
+    """
+    Solves a board in a worker process, sending `_PROGRESS` messages every `every`
+    expanded states and after each layer, then the Solution or the exception raised.
+    """
+    logging.getLogger().setLevel(logging.WARNING)
+    start = time.monotonic()
+
+    def report(stats):
+        connection.send((_PROGRESS, progress(
+            len(stats.frontier) - 1 if stats.frontier else None, stats.expanded,
+            stats.generated, stats.visited, time.monotonic() - start)))
+
+    stats = SearchStats(callback=report, every=every)
+    try:
+        solution = solve(game, budget=Budget(max_nodes, max_seconds, cancel),
+                         stats=stats, **kwargs)
+    except Exception as exc:
+        connection.send((_ERROR, exc))
+    else:
+        if solution is not None:
+            solution.stats.callback = None
+        connection.send((_DONE, solution))
+    finally:
+        connection.close()
+
+
+def _receive(connection):
+    try:
+        return connection.recv()
+    except (EOFError, OSError):
+        return _ERROR, RuntimeError('the solver process exited without a result')
+
+
+class AsyncSolver:
+    """
+    Runs `tubes.solve.solve` from asyncio code without blocking the event loop. Each
+    search runs in its own worker process, so a hard board holds one CPU rather
+    than the loop, and at most `max_concurrent` searches run at once; the others wait
+    for a free slot. The worker sends progress events back over a pipe, read on a
+    thread so the loop stays free.
+
+    Cancelling the task awaiting `solve`, directly or through `asyncio.wait_for`,
+    sets the cancellation token of the search's `Budget`, which is checked for every
+    expanded state, so the worker stops at once. A worker that has not exited
+    `CANCEL_GRACE` seconds later is terminated.
+    :param max_concurrent: maximum number of searches run at once, defaults to the
+        number of CPUs
+    """
+    def __init__(self, max_concurrent=None):
+        self.max_concurrent = max_concurrent or os.cpu_count() or 1
+        self._slots = asyncio.Semaphore(self.max_concurrent)
+        self._threads = ThreadPoolExecutor(max_workers=self.max_concurrent,
+                                           thread_name_prefix='tubes-aio')
+        self._context = _context()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self._threads.shutdown(wait=False)
+
+    async def solve(self, game, on_progress=None, every=CALLBACK_EVERY, max_nodes=None,
+                    max_seconds=None, **kwargs):
+        """
+        :param game: Game object
+        :param on_progress: callable taking a `progress` event, or a coroutine function,
+            called on the event loop after each layer and every `every` expanded
+            states; `asyncio.Queue.put_nowait` streams the events to a consumer
+        :param every: expanded states between two progress events
+        :param max_nodes: maximum number of states to expand, or None
+        :param max_seconds: maximum wall time in seconds, or None
+        :param kwargs: passed on to `solve`; they are pickled to the worker, so
+            pattern databases and caches are reopened there by path
+        :return: Solution, with its `SearchStats`, or None, see `solve`
+        :raises UnsolvableError: if the board is proven to have no solution
+        :raises BudgetExhausted: if `max_nodes` or `max_seconds` ran out
+        """
+        loop = asyncio.get_running_loop()
+        async with self._slots:
+            cancel = self._context.Event()
+            receiver, sender = self._context.Pipe(duplex=False)
+            # not a daemon, so that `workers` can start processes of its own;
+            # `_stop` still reaps it however the search ends
+            process = self._context.Process(
+                target=_run, daemon=False,
+                args=(sender, cancel, game, every, max_nodes, max_seconds, kwargs))
+            process.start()
+            sender.close()
+            try:
+                while True:
+                    kind, value = await loop.run_in_executor(self._threads, _receive,
+                                                             receiver)
+                    if kind == _DONE:
+                        return value
+                    if kind == _ERROR:
+                        raise value
+                    if on_progress is not None:
+                        result = on_progress(value)
+                        if inspect.isawaitable(result):
+                            await result
+            except BaseException:
+                # cancelled, or the progress callback failed: stop the search
+                cancel.set()
+                raise
+            finally:
+                await self._stop(process)
+                receiver.close()
+
+    @staticmethod
+    async def _stop(process):
+        deadline = time.monotonic() + CANCEL_GRACE
+        while process.is_alive() and time.monotonic() < deadline:
+            await asyncio.sleep(POLL_SECONDS)
+        if process.is_alive():
+            logging.warning('terminating solver process %d', process.pid)
+            process.terminate()
+        process.join()
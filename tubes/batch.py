@@ -0,0 +1,298 @@
+import logging
+
+try:
+    import numpy as np
+except ImportError:  # numpy is optional, only the numpy backend needs it
+    np = None
+
+from tubes.model import PRUNING_AGGRESSIVE, PRUNING_NONE, ZOBRIST_SEED
+from tubes.solve import SearchStats, _solution
+
+# Frontier states expanded in one batch, which bounds the size of the arrays
+BATCH_STATES = 1 << 15
+# `BatchVisited` merges its new states into the main array once there are more than
+# a 1 / `NEW_FRACTION` share of it
+NEW_FRACTION = 4
+# Widest tube whose slots fit in one 64 bit integer key
+MAX_CAPACITY = 8
+
+
+class Frontier:
+    """
+    A batch of boards stored as an array of shape (states, tubes, capacity) of color
+    codes, top slot first like `Game._pack`. The per tube properties the move rules
+    need are computed for the whole batch at once.
+    :param cells: uint8 array of shape (states, tubes, capacity)
+    """
+    def __init__(self, cells):
+        self.cells = cells
+        capacity = cells.shape[2]
+        slot = np.arange(capacity)
+        self.fill = np.count_nonzero(cells, axis=2)
+        # index of the top ball, which is also the free space of the tube
+        self.space = capacity - self.fill
+        top_slot = np.minimum(self.space, capacity - 1)
+        top = np.take_along_axis(cells, top_slot[..., None], 2)[..., 0]
+        self.top = np.where(self.fill > 0, top, 0)
+        # slots above the top count as matching, so the first mismatch ends the run
+        matching = (cells == self.top[..., None]) | (slot < self.space[..., None])
+        lead = np.where(matching.all(axis=2), capacity, np.argmin(matching, axis=2))
+        self.run = np.where(self.fill > 0, lead - self.space, 0)
+
+    def __len__(self):
+        return len(self.cells)
+
+    @property
+    def solved(self):
+        """
+        :return: bool array, whether each board has every tube empty or full of one
+            color
+        """
+        capacity = self.cells.shape[2]
+        return ((self.fill == 0) | (self.run == capacity)).all(axis=1)
+
+    def moves(self, pruning):
+        """
+        The legal moves of every board, following the rules and pruning of
+        `Game._generate_moves`.
+        :param pruning: one of `PRUNING_NONE`, `PRUNING_SAFE`, `PRUNING_AGGRESSIVE`
+        :return: (state, from tube, to tube) index arrays
+        """
+        num_tubes = self.cells.shape[1]
+        empty = self.fill == 0
+        source = (self.fill > 0)[:, :, None]
+        other = ~np.eye(num_tubes, dtype=bool)[None]
+        same = (source & other & ~empty[:, None, :] & (self.space > 0)[:, None, :] &
+                (self.top[:, :, None] == self.top[:, None, :]))
+        into_empty = empty
+        if pruning != PRUNING_NONE:
+            first = np.argmax(empty, axis=1)
+            into_empty = empty & (np.arange(num_tubes) == first[:, None])
+        into_empty = source & into_empty[:, None, :]
+        if pruning != PRUNING_NONE:
+            into_empty &= (self.run < self.fill)[:, :, None]
+        legal = same | into_empty
+        if pruning == PRUNING_AGGRESSIVE:
+            whole = same & (self.space[:, None, :] >= self.run[:, :, None])
+            legal = np.where(whole.any(axis=2)[:, :, None], whole, legal)
+        return np.nonzero(legal)
+
+    def children(self, states, from_tubes, to_tubes):
+        """
+        Applies one move to a copy of its board, pouring as much of the top run as
+        fits, like `Game._push_move`.
+        :return: uint8 array of shape (moves, tubes, capacity)
+        """
+        capacity = self.cells.shape[2]
+        slot = np.arange(capacity)
+        cells = self.cells[states]
+        rows = np.arange(len(states))
+        num = np.minimum(self.run[states, from_tubes], self.space[states, to_tubes])
+        from_first = self.space[states, from_tubes][:, None]
+        poured = (slot >= from_first) & (slot < from_first + num[:, None])
+        cells[rows, from_tubes] = np.where(poured, 0, cells[rows, from_tubes])
+        to_first = self.space[states, to_tubes][:, None]
+        filled = (slot >= to_first - num[:, None]) & (slot < to_first)
+        color = self.top[states, from_tubes][:, None]
+        cells[rows, to_tubes] = np.where(filled, color, cells[rows, to_tubes])
+        return cells
+
+
+class BatchVisited:
+    """
+    Visited set of a whole layer at a time, keyed by a vectorised hash like
+    `tubes.solve.VisitedStates`. Hashes and keys live in sorted arrays searched with
+    `np.searchsorted`; keys are compared only when hashes match, and genuine
+    collisions fall back to an ordinary set.
+
+    New states go to a second, smaller sorted array, into which each batch is merged,
+    and which is only merged into the main array once it has grown to a fraction of
+    it. Each state is thus copied a bounded number of times on average, rather than
+    the whole set being copied for every batch.
+    """
+    def __init__(self, num_tubes):
+        self._hashes = np.empty(0, dtype=np.uint64)
+        self._keys = np.empty((0, num_tubes), dtype=np.uint64)
+        self._new_hashes = self._hashes
+        self._new_keys = self._keys
+        self._collisions = set()
+
+    def __len__(self):
+        return len(self._hashes) + len(self._new_hashes) + len(self._collisions)
+
+    @staticmethod
+    def _find(sorted_hashes, sorted_keys, hashes, keys):
+        """
+        :return: whether each state's hash is in the sorted arrays, and whether its key
+            is there too
+        """
+        position = np.searchsorted(sorted_hashes, hashes)
+        found = position < len(sorted_hashes)
+        found[found] = sorted_hashes[position[found]] == hashes[found]
+        seen = np.zeros(len(hashes), dtype=bool)
+        seen[found] = (sorted_keys[position[found]] == keys[found]).all(axis=1)
+        return found, seen
+
+    @staticmethod
+    def _merge(sorted_hashes, sorted_keys, hashes, keys):
+        """
+        :return: the sorted arrays with sorted `hashes` and their `keys` merged in
+        """
+        position = np.searchsorted(sorted_hashes, hashes, side='right')
+        return (np.insert(sorted_hashes, position, hashes),
+                np.insert(sorted_keys, position, keys, axis=0))
+
+    def add(self, hashes, keys):
+        """
+        Adds a batch of states, which may repeat each other.
+        :param hashes: uint64 array of hashes
+        :param keys: uint64 array of keys, one row per state
+        :return: indices of the states not seen before, first occurrences only, in
+            their original order
+        """
+        if not len(hashes):
+            return np.empty(0, dtype=np.intp)
+        order = np.argsort(hashes, kind='stable')
+        hashes, keys = hashes[order], keys[order]
+        leader = np.ones(len(hashes), dtype=bool)
+        leader[1:] = hashes[1:] != hashes[:-1]
+        first = np.maximum.accumulate(np.where(leader, np.arange(len(hashes)), 0))
+        twin = ~leader & (keys == keys[first]).all(axis=1)
+
+        found, seen = self._find(self._hashes, self._keys, hashes, keys)
+        new_found, new_seen = self._find(self._new_hashes, self._new_keys, hashes, keys)
+        found |= new_found
+        seen |= new_seen
+
+        fresh = ~twin & ~seen
+        # a hash shared by states with different keys, either in the batch or with a
+        # visited state
+        collided = fresh & (found | ~leader)
+        for index in np.flatnonzero(collided):
+            key = keys[index].tobytes()
+            if key in self._collisions:
+                fresh[index] = False
+            else:
+                self._collisions.add(key)
+        # still sorted, as a subset of the sorted batch
+        insert = fresh & ~collided
+        self._new_hashes, self._new_keys = self._merge(
+            self._new_hashes, self._new_keys, hashes[insert], keys[insert])
+        if len(self._new_hashes) * NEW_FRACTION > len(self._hashes):
+            self._hashes, self._keys = self._merge(
+                self._hashes, self._keys, self._new_hashes, self._new_keys)
+            self._new_hashes = self._hashes[:0]
+            self._new_keys = self._keys[:0]
+        return np.sort(order[fresh])
+
+
+def _hasher(num_tubes):
+    """
+    Hashes boards from their tube keys, see `_keyer`. Each key is mixed with a salt of
+    its tube position, so boards with their tubes in another order hash apart, unlike
+    with `Game._zobrist`; with symmetry the keys are sorted, so they hash alike.
+    :return: callable mapping an array of tube keys, one row per board, to uint64
+        hashes
+    """
+    salts = np.random.default_rng(ZOBRIST_SEED).integers(
+        1 << 63, size=num_tubes, dtype=np.uint64)
+    shifts = [np.uint64(shift) for shift in (30, 27, 31)]
+    multipliers = [np.uint64(0xBF58476D1CE4E5B9), np.uint64(0x94D049BB133111EB)]
+
+    def hashes(keys):
+        # splitmix64 finaliser of each salted key
+        mixed = keys ^ salts
+        mixed ^= mixed >> shifts[0]
+        mixed *= multipliers[0]
+        mixed ^= mixed >> shifts[1]
+        mixed *= multipliers[1]
+        mixed ^= mixed >> shifts[2]
+        return mixed.sum(axis=1, dtype=np.uint64)
+    return hashes
+
+
+def _keyer(capacity, symmetry):
+    """
+    :return: callable mapping an array of boards to uint64 keys, one per tube, in
+        canonical order with `symmetry`. Tube keys read the slots as a big endian
+        number, so they sort like the packed bytes in `Game._canonical`.
+    """
+    weights = np.array([256 ** (capacity - 1 - j) for j in range(capacity)],
+                       dtype=np.uint64)
+
+    def keys(cells):
+        tube_keys = (cells.astype(np.uint64) * weights).sum(axis=2, dtype=np.uint64)
+        return np.sort(tube_keys, axis=1) if symmetry else tube_keys
+    return keys
+
+
+def batch_bfs(game, symmetry, pruning, budget, optimal, stats=None):
+    """
+    Layered BFS on the numpy backend. Instead of expanding boards one at a time
+    through `Tube`, a whole layer is held as a `Frontier` array, and the top colors,
+    run lengths, free space, legal moves and children of every board are computed
+    with array operations, `BATCH_STATES` boards at a time. Children are
+    deduplicated by a `BatchVisited` set on a vectorised hash of their tube keys. Each
+    layer keeps the parent index and move of its boards, so the moves are rebuilt
+    once a solution is found. The solution is as short as `tubes.solve._bfs` finds.
+    Partial order reduction is not applied, as all moves of a board are generated
+    at once. The budget is charged once per batch. The other arguments are those of
+    `tubes.solve.solve`, on the working game.
+    :param stats: tubes.solve.SearchStats counting each batch, or None
+    :raises ImportError: if numpy is not installed
+    :raises ValueError: if the tubes are too large for the numpy backend
+    """
+    if np is None:
+        raise ImportError('the numpy backend needs numpy')
+    capacity = len(game._slots)
+    if capacity > MAX_CAPACITY:
+        raise ValueError(f'the numpy backend supports tubes of up to {MAX_CAPACITY} '
+                         f'slots, not {capacity}')
+    if game._solved:
+        return _solution([], optimal)
+    num_tubes = len(game._tube_list)
+    hashes, keys = _hasher(num_tubes), _keyer(capacity, symmetry)
+    cells = np.frombuffer(game._pack(), dtype=np.uint8).reshape(1, num_tubes,
+                                                                capacity)
+    visited = BatchVisited(num_tubes)
+    cell_keys = keys(cells)
+    visited.add(hashes(cell_keys), cell_keys)
+    # per layer: parent index in the previous layer, from tube index, to tube index
+    layers = []
+    stats = SearchStats() if stats is None else stats
+    stats._layer(1)
+
+    while len(cells):
+        parents, from_tubes, to_tubes, children = [], [], [], []
+        for start in range(0, len(cells), BATCH_STATES):
+            frontier = Frontier(cells[start:start + BATCH_STATES])
+            budget.spend(len(frontier))
+            states, from_tube, to_tube = frontier.moves(pruning)
+            child = frontier.children(states, from_tube, to_tube)
+            child_keys = keys(child)
+            fresh = visited.add(hashes(child_keys), child_keys)
+            stats._add(len(frontier), len(states), len(states) - len(fresh))
+            parents.append(states[fresh] + start)
+            from_tubes.append(from_tube[fresh])
+            to_tubes.append(to_tube[fresh])
+            children.append(child[fresh])
+        layers.append((np.concatenate(parents), np.concatenate(from_tubes),
+                       np.concatenate(to_tubes)))
+        cells = np.concatenate(children)
+        stats.visited = len(visited)
+        stats._layer(len(cells))
+
+        solved = np.flatnonzero(Frontier(cells).solved) if len(cells) else ()
+        if len(solved):
+            index = solved[0]
+            moves = []
+            for parent, from_tube, to_tube in reversed(layers):
+                moves.append((game._tubes[from_tube[index]],
+                              game._tubes[to_tube[index]]))
+                index = parent[index]
+            moves.reverse()
+            logging.debug('expanded: %d', stats.expanded)
+            return _solution(moves, optimal)
+
+    logging.debug('expanded: %d', stats.expanded)
+    return None
@@ -0,0 +1,131 @@
+import argparse
+import random
+import sys
+
+import yaml
+
+from tubes.model import DEFAULT_CAPACITY
+
+# Names given to the colors of a generated board, in order; past these, colors are
+# numbered
+COLOR_NAMES = ('red', 'green', 'blue', 'yellow', 'purple', 'orange', 'pink', 'cyan',
+               'brown', 'grey', 'lime', 'navy')
+
+
+def color_names(num_colors):
+    """
+    :param num_colors: number of colors
+    :return: list of color names
+    """
+    return [COLOR_NAMES[i] if i < len(COLOR_NAMES) else f'color_{i + 1}'
+            for i in range(num_colors)]
+
+
+def _pour(tubes, from_index, to_index, capacity):
+    """
+    Pours the top run of a tube onto another as `Game._push_move` does, as far as
+    there is room.
+    :param tubes: list of tubes, each a list of color codes from the bottom up
+    :return: new list of tubes, or None if the move is not legal
+    """
+    from_tube, to_tube = tubes[from_index], tubes[to_index]
+    if not from_tube or len(to_tube) == capacity:
+        return None
+    color = from_tube[-1]
+    if to_tube and to_tube[-1] != color:
+        return None
+    run = 1
+    while run < len(from_tube) and from_tube[-run - 1] == color:
+        run += 1
+    num = min(run, capacity - len(to_tube))
+    tubes = list(tubes)
+    tubes[from_index] = from_tube[:-num]
+    tubes[to_index] = to_tube + [color] * num
+    return tubes
+
+
+def _unpours(tubes, capacity):
+    """
+    Lists the boards from which a single legal pour leads to `tubes`: for each tube
+    and each part of its top run, the board with that part moved back onto another
+    tube, kept if pouring it forward again gives `tubes`.
+    :param tubes: list of tubes, each a list of color codes from the bottom up
+    :return: list of boards, in the same form
+    """
+    boards = []
+    for to_index, to_tube in enumerate(tubes):
+        if not to_tube:
+            continue
+        color = to_tube[-1]
+        run = 1
+        while run < len(to_tube) and to_tube[-run - 1] == color:
+            run += 1
+        for num in range(1, run + 1):
+            for from_index, from_tube in enumerate(tubes):
+                if from_index == to_index or capacity - len(from_tube) < num:
+                    continue
+                board = list(tubes)
+                board[to_index] = to_tube[:-num]
+                board[from_index] = from_tube + [color] * num
+                if _pour(board, from_index, to_index, capacity) == tubes:
+                    boards.append(board)
+    return boards
+
+
+def generate_board(num_colors, empty=2, capacity=DEFAULT_CAPACITY, depth=50, seed=0):
+    """
+    Builds a board that is guaranteed to be solvable by scrambling a solved one
+    backwards: starting from one full tube per color and `empty` empty tubes, it
+    takes `depth` random pours in reverse, each one undoable by a legal pour, then
+    shuffles the tubes. Boards not seen yet are preferred at each step, so the
+    scramble does not simply walk back and forth. The same arguments always give the
+    same board.
+    :param num_colors: number of colors, each filling one tube
+    :param empty: number of extra empty tubes
+    :param capacity: slots per tube
+    :param depth: number of reverse pours; an optimal solution is at most as long
+    :param seed: random seed
+    :return: config dict, as read from a YAML puzzle file
+    """
+    rng = random.Random(seed)
+    tubes = [[code] * capacity for code in range(1, num_colors + 1)] + [[]] * empty
+    seen = {tuple(map(tuple, tubes))}
+    for _ in range(depth):
+        boards = _unpours(tubes, capacity)
+        if not boards:
+            break
+        new = [board for board in boards if tuple(map(tuple, board)) not in seen]
+        tubes = rng.choice(new or boards)
+        seen.add(tuple(map(tuple, tubes)))
+    rng.shuffle(tubes)
+    names = color_names(num_colors)
+    return {i + 1: [None] * (capacity - len(tube)) + [names[code - 1]
+                                                      for code in reversed(tube)]
+            for i, tube in enumerate(tubes)}
+
+
+def parse_args(args=None):
+    parser = argparse.ArgumentParser(prog='tubes.bench.generate',
+                                     description='Generate a solvable tubes puzzle')
+    parser.add_argument('--colors', type=int, required=True, help='number of colors')
+    parser.add_argument('--empty', type=int, default=2,
+                        help='empty tubes (default: %(default)s)')
+    parser.add_argument('--capacity', type=int, default=DEFAULT_CAPACITY,
+                        help='slots per tube (default: %(default)s)')
+    parser.add_argument('--depth', type=int, default=50,
+                        help='reverse pours scrambling the board '
+                             '(default: %(default)s)')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='random seed (default: %(default)s)')
+    return parser.parse_args(args)
+
+
+def main(args=None):
+    args = parse_args(args)
+    config = generate_board(args.colors, args.empty, args.capacity, args.depth,
+                            args.seed)
+    yaml.safe_dump(config, sys.stdout)
+
+
+if __name__ == '__main__':
+    main()
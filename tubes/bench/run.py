@@ -0,0 +1,229 @@
+import argparse
+import json
+import logging
+import multiprocessing
+import platform
+import sys
+
+from tubes.bench.generate import generate_board
+from tubes.model import Game, UnsolvableError
+from tubes.solve import (ASTAR, BEAM, BFS, EXTERNAL, IDASTAR, NUMPY, WEIGHTED, Budget,
+                         BudgetExhausted, SearchStats, _peak_rss, solve)
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+VERSION = 1
+
+# Boards of the default suite: name, then `generate_board` arguments
+SUITE = (
+    ('c4-e2-d30', {'num_colors': 4, 'empty': 2, 'capacity': 4, 'depth': 30}),
+    ('c5-e2-d60', {'num_colors': 5, 'empty': 2, 'capacity': 4, 'depth': 60}),
+    ('c6-e2-d100', {'num_colors': 6, 'empty': 2, 'capacity': 4, 'depth': 100}),
+    ('c7-e2-d150', {'num_colors': 7, 'empty': 2, 'capacity': 4, 'depth': 150}),
+    ('c8-e2-d300', {'num_colors': 8, 'empty': 2, 'capacity': 4, 'depth': 300}),
+    ('c10-e2-d500', {'num_colors': 10, 'empty': 2, 'capacity': 4, 'depth': 500}),
+    ('c4-e1-k5-d60', {'num_colors': 4, 'empty': 1, 'capacity': 5, 'depth': 60}),
+)
+SEED = 0
+
+# Solvers benchmarked: name, then `solve` keyword arguments
+SOLVERS = {
+    BFS: {'mode': BFS},
+    f'{BFS}-{NUMPY}': {'mode': BFS, 'backend': NUMPY},
+    ASTAR: {'mode': ASTAR},
+    WEIGHTED: {'mode': WEIGHTED},
+    IDASTAR: {'mode': IDASTAR},
+    BEAM: {'mode': BEAM},
+    EXTERNAL: {'mode': EXTERNAL},
+}
+
+# Status of a result
+SOLVED = 'solved'
+UNSOLVED = 'unsolved'
+TIMEOUT = 'timeout'
+
+# Relative change of a measure tolerated by `compare`
+TOLERANCE = 0.2
+
+
+def available_solvers():
+    """
+    :return: names of the `SOLVERS` that can run here
+    """
+    return [name for name, kwargs in SOLVERS.items()
+            if numpy is not None or kwargs.get('backend') != NUMPY]
+
+
+def measure(config, kwargs, timeout=None):
+    """
+    Solves one board in this process and measures the search.
+    :param config: config dict of the board
+    :param kwargs: `solve` keyword arguments
+    :param timeout: wall time allowed in seconds, or None
+    :return: dict with the status, solution depth and optimality, nodes expanded and
+        generated, wall time, nodes per second, peak RSS, visited set size and
+        effective branching factor, see `tubes.solve.SearchStats`
+    """
+    logging.getLogger().setLevel(logging.WARNING)
+    game = Game(config)
+    budget = Budget(max_seconds=timeout)
+    stats = SearchStats()
+    result = {}
+    try:
+        solution = solve(game, budget=budget, stats=stats, **kwargs)
+    except BudgetExhausted:
+        result.update(status=TIMEOUT, depth=None, optimal=None)
+    except UnsolvableError:
+        result.update(status=UNSOLVED, depth=None, optimal=None)
+    else:
+        if solution is None:
+            result.update(status=UNSOLVED, depth=None, optimal=None)
+        else:
+            result.update(status=SOLVED, depth=len(solution), optimal=solution.optimal)
+    seconds = stats.seconds
+    result.update(nodes=stats.expanded, generated=stats.generated,
+                  seconds=round(seconds, 6),
+                  nodes_per_second=round(stats.expanded / seconds) if seconds else None,
+                  peak_rss=_peak_rss(), visited=stats.visited,
+                  branching_factor=stats.branching_factor)
+    return result
+
+
+def _measure_child(connection, config, kwargs, timeout):
+    try:
+        connection.send(measure(config, kwargs, timeout))
+    finally:
+        connection.close()
+
+
+def measure_isolated(config, kwargs, timeout=None):
+    """
+    Runs `measure` in a new process, so that its peak RSS is that of this search alone.
+    :return: see `measure`
+    """
+    context = multiprocessing.get_context('spawn')
+    receiver, sender = context.Pipe(duplex=False)
+    process = context.Process(target=_measure_child,
+                              args=(sender, config, kwargs, timeout))
+    process.start()
+    sender.close()
+    try:
+        result = receiver.recv()
+    except EOFError:
+        raise RuntimeError(f'benchmark process exited with code {process.exitcode}')
+    finally:
+        process.join()
+        receiver.close()
+    return result
+
+
+def run_suite(suite=SUITE, solvers=None, timeout=60, seed=SEED, isolate=True):
+    """
+    Generates each board of `suite` with `generate_board` and solves it with each
+    solver, one search per process unless `isolate` is off.
+    :param suite: iterable of (board name, `generate_board` keyword arguments)
+    :param solvers: names of `SOLVERS`, defaults to `available_solvers`
+    :param timeout: wall time allowed per search in seconds, or None
+    :param seed: seed of the generated boards
+    :param isolate: run each search in its own process
+    :return: report dict, with the settings of the run and one result per board and
+        solver, see `measure`
+    """
+    solvers = available_solvers() if solvers is None else list(solvers)
+    report = {'version': VERSION, 'python': platform.python_version(),
+              'platform': platform.platform(), 'seed': seed, 'timeout': timeout,
+              'boards': {}, 'results': []}
+    run = measure_isolated if isolate else measure
+    for board, arguments in suite:
+        config = generate_board(seed=seed, **arguments)
+        report['boards'][board] = arguments
+        for solver in solvers:
+            result = {'board': board, 'solver': solver}
+            result.update(run(config, SOLVERS[solver], timeout))
+            logging.info('%s %s: %s, depth %s, %s nodes, %.3fs', board, solver,
+                         result['status'], result['depth'], result['nodes'],
+                         result['seconds'])
+            report['results'].append(result)
+    return report
+
+
+def compare(baseline, report, tolerance=TOLERANCE):
+    """
+    Lists the regressions of `report` against `baseline` for every board and solver
+    found in both: a solved board no longer solved, a longer solution, or nodes
+    expanded, wall time or peak RSS grown by more than `tolerance`, relative to the
+    baseline.
+    :param baseline: report dict, see `run_suite`
+    :param report: report dict
+    :param tolerance: relative change allowed
+    :return: list of str
+    """
+    before = {(result['board'], result['solver']): result
+              for result in baseline['results']}
+    regressions = []
+    for result in report['results']:
+        name = (result['board'], result['solver'])
+        old = before.get(name)
+        if old is None:
+            continue
+        label = ' '.join(name)
+        if old['status'] == SOLVED and result['status'] != SOLVED:
+            regressions.append(f'{label}: {result["status"]}, was {SOLVED}')
+            continue
+        if old['status'] != SOLVED or result['status'] != SOLVED:
+            continue
+        if result['depth'] > old['depth']:
+            regressions.append(f'{label}: depth {result["depth"]}, was {old["depth"]}')
+        for measure_name in ('nodes', 'seconds', 'peak_rss'):
+            value, old_value = result.get(measure_name), old.get(measure_name)
+            if value is None or not old_value:
+                continue
+            if value > old_value * (1 + tolerance):
+                regressions.append(f'{label}: {measure_name} {value}, was {old_value} '
+                                   f'(+{value / old_value - 1:.0%})')
+    return regressions
+
+
+def parse_args(args=None):
+    parser = argparse.ArgumentParser(prog='tubes.bench',
+                                     description='Benchmark the tubes solvers')
+    parser.add_argument('--output', '-o',
+                        help='JSON file to write the report to (default: stdout)')
+    parser.add_argument('--solvers', nargs='+', choices=SOLVERS,
+                        help='solvers to run (default: all available)')
+    parser.add_argument('--timeout', type=float, default=60,
+                        help='seconds allowed per search (default: %(default)s)')
+    parser.add_argument('--seed', type=int, default=SEED,
+                        help='seed of the generated boards (default: %(default)s)')
+    parser.add_argument('--compare', metavar='BASELINE',
+                        help='report to compare against; exits with status 1 on a '
+                             'regression')
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE,
+                        help='relative growth of nodes, time or memory tolerated by '
+                             '--compare (default: %(default)s)')
+    return parser.parse_args(args)
+
+
+def main(args=None):
+    args = parse_args(args)
+    report = run_suite(solvers=args.solvers, timeout=args.timeout, seed=args.seed)
+    text = json.dumps(report, indent=2)
+    if args.output is None:
+        print(text)
+    else:
+        with open(args.output, 'w') as file:
+            file.write(text + '\n')
+    if args.compare is not None:
+        with open(args.compare) as file:
+            regressions = compare(json.load(file), report, args.tolerance)
+        for regression in regressions:
+            logging.warning(regression)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+import hashlib
+import json
+import sqlite3
+import time
+
+from tubes.solve import Solution
+
+# Solutions kept before the least recently used are evicted
+MAX_ENTRIES = 100000
+# Seconds a connection waits for another process to release its lock
+BUSY_TIMEOUT = 30
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS solutions (
+    key BLOB PRIMARY KEY,
+    moves BLOB NOT NULL,
+    used REAL NOT NULL
+)
+'''
+_USED_INDEX = 'CREATE INDEX IF NOT EXISTS solutions_used ON solutions (used)'
+
+
+def canonical_board(game):
+    """
+    Describes the board by color names rather than palette codes, with the tubes in a
+    canonical order, so that the same puzzle gives the same description whatever the
+    order of its tubes or of the colors in its input.
+    :param game: Game object
+    :return: (digest of the board, tube ids in canonical order)
+    """
+    colors = game._palette.colors
+    num_slots = len(game._slots)
+    state = game._pack()
+    tubes = [([None if not code else str(colors[code].color)
+               for code in state[i * num_slots:(i + 1) * num_slots]], identity)
+             for i, identity in enumerate(game._tubes)]
+    # empty slots sort before colors
+    tubes.sort(key=lambda tube: [(name is not None, name or '') for name in tube[0]])
+    text = json.dumps([names for names, _ in tubes])
+    return (hashlib.blake2b(text.encode(), digest_size=16).digest(),
+            tuple(identity for _, identity in tubes))
+
+
+class SolutionCache:
+    """
+    On-disk cache of optimal solutions in a SQLite database, keyed by
+    `canonical_board`. Moves are stored as positions in the canonical tube order and
+    mapped back to the caller's tube ids on lookup, so a board submitted with its
+    tubes in another order is still a hit.
+
+    Each lookup refreshes the entry's last use, and once more than `max_entries` are
+    held the least recently used are evicted. The database runs in write-ahead
+    logging mode, so processes that open the same file read concurrently and
+    serialise their writes. Pickling carries the path and size only, and the
+    database is opened again on load.
+    :param path: database file
+    :param max_entries: maximum number of solutions kept
+    """
+    def __init__(self, path, max_entries=MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self._connection = sqlite3.connect(path, timeout=BUSY_TIMEOUT,
+                                           isolation_level=None)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        # with a write-ahead log, commits stay durable against crashes of the
+        # process without syncing the disk on each of them
+        self._connection.execute('PRAGMA synchronous=NORMAL')
+        self._connection.execute(_SCHEMA)
+        self._connection.execute(_USED_INDEX)
+
+    def __len__(self):
+        return self._connection.execute('SELECT COUNT(*) FROM solutions').fetchone()[0]
+
+    def __getstate__(self):
+        return self.path, self.max_entries
+
+    def __setstate__(self, state):
+        self.__init__(*state)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self._connection.close()
+
+    def get(self, game):
+        """
+        :param game: Game object
+        :return: optimal Solution in the tube ids of `game`, or None if not cached
+        """
+        key, order = canonical_board(game)
+        row = self._connection.execute('SELECT moves FROM solutions WHERE key = ?',
+                                       (key,)).fetchone()
+        if row is None:
+            return None
+        self._connection.execute('UPDATE solutions SET used = ? WHERE key = ?',
+                                 (time.time(), key))
+        positions = row[0]
+        return Solution(((order[positions[i]], order[positions[i + 1]])
+                         for i in range(0, len(positions), 2)), optimal=True)
+
+    def put(self, game, solution):
+        """
+        Stores an optimal solution of `game`, evicting the least recently used
+        solutions beyond `max_entries`.
+        :param game: Game object
+        :param solution: list of (from_id, to_id) moves in the tube ids of `game`
+        """
+        key, order = canonical_board(game)
+        position = {identity: i for i, identity in enumerate(order)}
+        moves = bytes(position[identity] for move in solution for identity in move)
+        connection = self._connection
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            connection.execute('INSERT OR REPLACE INTO solutions VALUES (?, ?, ?)',
+                               (key, moves, time.time()))
+            connection.execute('DELETE FROM solutions WHERE key IN (SELECT key FROM '
+                               'solutions ORDER BY used DESC LIMIT -1 OFFSET ?)',
+                               (self.max_entries,))
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
@@ -0,0 +1,162 @@
+import signal
+import struct
+import threading
+from contextlib import contextmanager
+
+from tubes.model import PRUNING_AGGRESSIVE, PRUNING_NONE, PRUNING_SAFE
+from tubes.solve import GameState
+
+MAGIC = b'TCKP'
+VERSION = 1
+# magic, version, symmetry, pruning level, bytes per packed state
+HEADER = struct.Struct('<4sBBBxH')
+# depth, number of records
+LAYER = struct.Struct('<II')
+# index of the parent in the previous layer
+PARENT = struct.Struct('<I')
+NO_PARENT = 0xFFFFFFFF
+PRUNING_LEVELS = (PRUNING_NONE, PRUNING_SAFE, PRUNING_AGGRESSIVE)
+
+
+class Checkpoint:
+    """
+    Append-only binary checkpoint of a layered BFS. The file starts with a header
+    recording the search settings, followed by one block per completed layer: its
+    depth and size, then for each board its packed state, the index of its parent in
+    the previous block and the move from the parent, as two tube indices. The visited
+    set is every board of every block, the frontier is the last block, and the parent
+    links rebuild the moves.
+
+    Each layer is appended and flushed once it is complete, so writing costs as much as
+    the new layer, never the whole search. A block cut short by a crash is dropped
+    when the file is opened again.
+    :param path: checkpoint file
+    :param game: Game object the search starts from
+    :param symmetry: whether states are deduplicated up to tube permutations
+    :param pruning: dominated move pruning level of the search
+    :param resume: read the layers already in the file and append after them,
+        rather than starting a new file
+    :raises ValueError: if the file to resume does not match the board or settings
+    """
+    def __init__(self, path, game, symmetry, pruning, resume=False):
+        self.path = path
+        self._game = game
+        self._header = HEADER.pack(MAGIC, VERSION, symmetry,
+                                   PRUNING_LEVELS.index(pruning), len(game._pack()))
+        self._index = {identity: i for i, identity in enumerate(game._tubes)}
+        self._positions = None
+        self._layers = []
+        self._depth = 0
+        if resume:
+            self._file = open(path, 'r+b')
+            self._read()
+        else:
+            self._file = open(path, 'wb')
+            self._file.write(self._header)
+            self._file.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self._file.close()
+
+    def _read(self):
+        data = self._file.read()
+        if data[:HEADER.size] != self._header:
+            raise ValueError(f'{self.path} is not a checkpoint of this board and '
+                             f'search settings')
+        state_size = len(self._game._pack())
+        record = struct.Struct(f'<{state_size}sI2B')
+        offset = HEADER.size
+        parents = [None]
+        while offset + LAYER.size <= len(data):
+            depth, count = LAYER.unpack_from(data, offset)
+            if depth != len(self._layers):
+                raise ValueError(f'{self.path} is corrupt: layer {len(self._layers)} '
+                                 f'is marked as depth {depth}')
+            end = offset + LAYER.size + count * record.size
+            if end > len(data):
+                break
+            layer = []
+            for state, parent, from_index, to_index in record.iter_unpack(
+                    data[offset + LAYER.size:end]):
+                if parent == NO_PARENT:
+                    layer.append(GameState(state))
+                else:
+                    move = (self._game._tubes[from_index], self._game._tubes[to_index])
+                    layer.append(GameState(state, parents[parent], move))
+            self._layers.append(layer)
+            parents = layer
+            offset = end
+        if self._layers and self._layers[0][0].state != self._game._pack():
+            raise ValueError(f'{self.path} is not a checkpoint of this board')
+        self._file.seek(offset)
+        self._file.truncate()
+        self._depth = len(self._layers)
+        if self._layers:
+            self._positions = {id(node): i for i, node in enumerate(self._layers[-1])}
+
+    def restore(self):
+        """
+        :return: list of layers read from the file, each a list of GameState linked to
+            its parents, or an empty list for a new checkpoint
+        """
+        return self._layers
+
+    def append(self, layer):
+        """
+        Appends a completed layer, whose parents are the layer appended before it.
+        :param layer: list of GameState
+        """
+        self._file.write(LAYER.pack(self._depth, len(layer)))
+        index = self._index
+        records = []
+        for node in layer:
+            if node.parent is None:
+                records.append(node.state + PARENT.pack(NO_PARENT) + bytes(2))
+            else:
+                parent = self._positions[id(node.parent)]
+                records.append(node.state + PARENT.pack(parent) +
+                               bytes((index[node.move[0]], index[node.move[1]])))
+        self._file.write(b''.join(records))
+        self._file.flush()
+        self._positions = {id(node): i for i, node in enumerate(layer)}
+        self._depth += 1
+
+
+class _AnyEvent:
+    """
+    Cancellation token that is set when any of its tokens is.
+    """
+    def __init__(self, *events):
+        self.events = [event for event in events if event is not None]
+
+    def is_set(self):
+        return any(event.is_set() for event in self.events)
+
+
+@contextmanager
+def cancel_on_sigterm(budget):
+    """
+    Cancels `budget` on SIGTERM while the context is active, so the search stops with
+    `BudgetExhausted` and its checkpoint is left at the last completed layer. Signal
+    handlers can only be installed from the main thread; elsewhere this does
+    nothing.
+    :param budget: Budget of the search
+    """
+    if threading.current_thread() is not threading.main_thread():
+        yield
+        return
+    terminated = threading.Event()
+    cancel = budget.cancel
+    budget.cancel = _AnyEvent(cancel, terminated)
+    previous = signal.signal(signal.SIGTERM, lambda signum, frame: terminated.set())
+    try:
+        yield
+    finally:
+        signal.signal(signal.SIGTERM, previous)
+        budget.cancel = cancel
@@ -0,0 +1,229 @@
+import heapq
+import logging
+import mmap
+import os
+import tempfile
+
+from tubes.solve import SearchStats, _solution
+
+# Children held in memory before they are sorted and written out as a run
+RUN_SIZE = 1 << 20
+LAYER_FILE = 'layer_{}.bin'
+RUN_FILE = 'run_{}.bin'
+VISITED_FILE = 'visited.bin'
+
+
+class RecordFile:
+    """
+    A file of fixed-width records sorted by their leading key, read back through a
+    read-only memory map. Records are yielded in order by iterating, and looked up by
+    key with a binary search.
+    :param path: file path
+    :param record_size: bytes per record
+    :param key_size: bytes of the key at the start of each record
+    """
+    def __init__(self, path, record_size, key_size):
+        self.path = path
+        self.record_size = record_size
+        self.key_size = key_size
+        self._num_records = os.path.getsize(path) // record_size
+        self._mmap = None
+        if self._num_records:
+            with open(path, 'rb') as file:
+                self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __len__(self):
+        return self._num_records
+
+    def __iter__(self):
+        size = self.record_size
+        for offset in range(0, self._num_records * size, size):
+            yield self._mmap[offset:offset + size]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+
+    def find(self, key):
+        """
+        :return: the record with this key, or None
+        """
+        low, high = 0, self._num_records
+        while low < high:
+            middle = (low + high) // 2
+            offset = middle * self.record_size
+            record_key = self._mmap[offset:offset + self.key_size]
+            if record_key < key:
+                low = middle + 1
+            elif record_key > key:
+                high = middle
+            else:
+                return self._mmap[offset:offset + self.record_size]
+        return None
+
+
+def _write_run(path, records):
+    records.sort()
+    with open(path, 'wb') as file:
+        file.write(b''.join(records))
+
+
+def _merge(runs, visited, layer_path, visited_path, key_size):
+    """
+    Delayed duplicate detection: streams the sorted runs of children and the sorted
+    visited keys side by side, keeping the first child of each key that was never
+    visited. The new layer and the grown visited file are both written in order.
+    :param runs: RecordFile runs of child records
+    :param visited: RecordFile of visited keys
+    :param layer_path: file the records of the new layer are written to
+    :param visited_path: file the visited keys, old and new, are written to
+    :param key_size: bytes of the key at the start of each record
+    :return: number of records in the new layer
+    """
+    seen = iter(visited)
+    seen_key = next(seen, None)
+    last = None
+    count = 0
+    with open(layer_path, 'wb') as layer_file, open(visited_path, 'wb') as visited_file:
+        for record in heapq.merge(*runs):
+            key = record[:key_size]
+            if key == last:
+                continue
+            last = key
+            while seen_key is not None and seen_key < key:
+                visited_file.write(seen_key)
+                seen_key = next(seen, None)
+            if seen_key == key:
+                continue
+            visited_file.write(key)
+            layer_file.write(record)
+            count += 1
+        while seen_key is not None:
+            visited_file.write(seen_key)
+            seen_key = next(seen, None)
+    return count
+
+
+def external_bfs(game, symmetry, pruning, budget, optimal, work_dir=None,
+                 run_size=RUN_SIZE, stats=None):
+    """
+    Layered BFS that keeps its layers and visited set on disk instead of in memory.
+
+    A layer is a file of records sorted by state key; each record holds the key, the
+    packed board, the key of its parent and the move from the parent, as tube indices.
+    The layer is read back through a memory map and expanded in order. Children are
+    buffered up to `run_size` records, then sorted and written out as a run. Once the
+    layer is expanded, `_merge` streams all runs against the sorted file of visited
+    keys to drop duplicates and write the next layer. Memory use is bounded by
+    `run_size`, whatever the size of the search; the disk is only read and written
+    sequentially, except for the binary searches that follow parent keys back
+    through the layers once a solution is found. The other arguments are those of
+    `tubes.solve.solve`, on the working game.
+    :param work_dir: directory for the layer files, which are left there, or None
+        for a temporary directory that is removed afterwards
+    :param run_size: number of child records sorted in memory at a time
+    :param stats: tubes.solve.SearchStats counting the search, or None
+    """
+    if game._solved:
+        return _solution([], optimal)
+    if work_dir is None:
+        with tempfile.TemporaryDirectory(prefix='tubes-') as directory:
+            return external_bfs(game, symmetry, pruning, budget, optimal, directory,
+                                run_size, stats)
+
+    def key(state):
+        return game._canonical(state)[0] if symmetry else state
+
+    def path(name):
+        return os.path.join(work_dir, name)
+
+    index = {identity: i for i, identity in enumerate(game._tubes)}
+    state = game._pack()
+    key_size = len(state)
+    record_size = 3 * key_size + 2
+    with open(path(LAYER_FILE.format(0)), 'wb') as file:
+        file.write(key(state) + state + bytes(key_size + 2))
+    with open(path(VISITED_FILE), 'wb') as file:
+        file.write(key(state))
+    depth = 0
+    stats = SearchStats() if stats is None else stats
+    stats._layer(1)
+    stats.visited = 1
+
+    while True:
+        solved = None
+        runs = []
+        children = []
+        num_children = 0
+        with RecordFile(path(LAYER_FILE.format(depth)), record_size,
+                        key_size) as layer:
+            if not len(layer):
+                break
+            for record in layer:
+                budget.spend()
+                parent_key = record[:key_size]
+                game._unpack(record[key_size:2 * key_size])
+                moves = game._generate_moves(pruning)
+                stats._add(1, len(moves))
+                for move in moves:
+                    game._push_move(*move)
+                    if game._solved:
+                        solved = parent_key, move
+                    elif not game._dead_end:
+                        child = game._pack()
+                        children.append(key(child) + child + parent_key +
+                                        bytes((index[move[0]], index[move[1]])))
+                        num_children += 1
+                    game._pop_move()
+                    if solved:
+                        break
+                if solved:
+                    break
+                if len(children) >= run_size:
+                    runs.append(path(RUN_FILE.format(len(runs))))
+                    _write_run(runs[-1], children)
+                    children = []
+        if solved:
+            break
+        runs.append(path(RUN_FILE.format(len(runs))))
+        _write_run(runs[-1], children)
+        children = []
+
+        depth += 1
+        run_files = [RecordFile(run, record_size, key_size) for run in runs]
+        try:
+            with RecordFile(path(VISITED_FILE), key_size, key_size) as visited:
+                count = _merge(run_files, visited, path(LAYER_FILE.format(depth)),
+                               path(VISITED_FILE + '.new'), key_size)
+        finally:
+            for run_file in run_files:
+                run_file.close()
+        os.replace(path(VISITED_FILE + '.new'), path(VISITED_FILE))
+        for run in runs:
+            os.remove(run)
+        stats.duplicates += num_children - count
+        stats.visited += count
+        stats._layer(count)
+        logging.debug('layer %d: %d states', depth, count)
+
+    logging.debug('expanded: %d', stats.expanded)
+    if solved is None:
+        return None
+    parent_key, move = solved
+    moves = [move]
+    for parent_depth in range(depth, 0, -1):
+        with RecordFile(path(LAYER_FILE.format(parent_depth)), record_size,
+                        key_size) as layer:
+            record = layer.find(parent_key)
+        parent_key = record[2 * key_size:3 * key_size]
+        from_index, to_index = record[3 * key_size:]
+        moves.append((game._tubes[from_index], game._tubes[to_index]))
+    moves.reverse()
+    return _solution(moves, optimal)
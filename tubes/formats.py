@@ -0,0 +1,126 @@
+import argparse
+import json
+import string
+import sys
+
+import yaml
+
+from tubes.model import Game
+
+# Character of each color code in a grid, code 1 first; `EMPTY` marks an empty slot
+ALPHABET = string.ascii_letters + string.digits
+EMPTY = '.'
+# Separates the tubes of a grid
+TUBE_SEPARATOR = '/'
+
+_DECODE = {ord(EMPTY): 0, **{ord(char): code for code, char in enumerate(ALPHABET, 1)}}
+_ENCODE = (EMPTY + ALPHABET).encode('ascii').ljust(256, b'?')
+_CHARACTERS = frozenset(EMPTY + ALPHABET + TUBE_SEPARATOR)
+
+
+def to_record(game, name=None):
+    """
+    Describes a game as a compact puzzle record: the color table, the tube capacity
+    and a grid with one character per slot, tube by tube and top slot first as in
+    `Game._pack`, e.g. {"name": "lvl3", "colors": ["blue", "green"], "capacity": 4,
+    "grid": "aaba/abbb/...."}.
+    :param game: Game object
+    :param name: puzzle name, or None
+    :return: dict
+    :raises ValueError: if the game has more colors than `ALPHABET`
+    """
+    colors = [color.color for color in game._palette.colors[1:]]
+    if len(colors) > len(ALPHABET):
+        raise ValueError(f'a grid holds at most {len(ALPHABET)} colors, not '
+                         f'{len(colors)}')
+    capacity = len(game._slots)
+    cells = game._pack().translate(_ENCODE).decode('ascii')
+    grid = TUBE_SEPARATOR.join(cells[i:i + capacity]
+                               for i in range(0, len(cells), capacity))
+    record = {} if name is None else {'name': name}
+    record.update(colors=colors, capacity=capacity, grid=grid)
+    return record
+
+
+def from_record(record):
+    """
+    Builds a game from a record made by `to_record`, through `Game._from_packed`.
+    :param record: dict
+    :return: Game
+    :raises ValueError: if the record does not describe a valid board
+    """
+    colors, capacity, grid = record['colors'], record['capacity'], record['grid']
+    if len(set(colors)) != len(colors):
+        raise ValueError(f'colors repeat in {colors}')
+    if not set(grid) <= _CHARACTERS:
+        raise ValueError(f'unknown characters in grid: {set(grid) - _CHARACTERS}')
+    tubes = [tube.translate(_DECODE).encode('ascii')
+             for tube in grid.split(TUBE_SEPARATOR)]
+    for index, tube in enumerate(tubes, 1):
+        if len(tube) != capacity:
+            raise ValueError(f'tube {index} has {len(tube)} slots, not {capacity}')
+        if 0 in tube.lstrip(b'\x00'):
+            raise ValueError(f'empty slot below a color in tube {index}')
+    state = b''.join(tubes)
+    if capacity < 1 or not state:
+        raise ValueError(f'grid does not split into tubes of {capacity}')
+    if max(state) > len(colors):
+        raise ValueError(f'grid uses more than the {len(colors)} colors of its table')
+    return Game._from_packed(colors, state, capacity)
+
+
+def iter_jsonl(stream, source=None):
+    """
+    Reads puzzle records one line at a time, so large files are streamed rather
+    than loaded whole. Blank lines are skipped.
+    :param stream: text stream of JSON lines
+    :param source: name of the stream, or None
+    :return: generator of (name, Game or the exception raised reading it); records
+        without a name are named after `source` and their line number
+    """
+    for number, line in enumerate(stream, 1):
+        if not line.strip():
+            continue
+        name = str(number) if source is None else f'{source}:{number}'
+        try:
+            record = json.loads(line)
+            name = record.get('name', name)
+            yield name, from_record(record)
+        except (ValueError, KeyError, TypeError, AttributeError) as exc:
+            yield name, exc
+
+
+def convert(paths, output):
+    """
+    Converts YAML puzzle files, as in `fixtures`, to JSON lines named after their
+    path.
+    :param paths: YAML files
+    :param output: text stream the records are written to
+    """
+    for path in paths:
+        with open(path) as file:
+            game = Game(yaml.safe_load(file))
+        output.write(json.dumps(to_record(game, path)) + '\n')
+
+
+def parse_args(args=None):
+    parser = argparse.ArgumentParser(prog='tubes.formats',
+                                     description='Convert YAML puzzles to JSON lines')
+    parser.add_argument('input_files', nargs='+', help='YAML puzzle files')
+    parser.add_argument('--output', '-o',
+                        help='JSONL file to write (default: stdout)')
+    return parser.parse_args(args)
+
+
+def main(args=None):
+    args = parse_args(args)
+    output = sys.stdout if args.output is None else open(args.output, 'w')
+    try:
+        convert(args.input_files, output)
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,10 +1,70 @@
+import random
 from collections import Counter, defaultdict, namedtuple
-from itertools import permutations
+from functools import lru_cache
 
 legal_move = namedtuple('legal_move', ['coming_from', 'to'])
 move = namedtuple('move', ['coming_from', 'color', 'num_slots', 'from_slots',
                            'going_to', 'to_slots'])
 
+# Capacity of a tube when it cannot be inferred from its contents
+DEFAULT_CAPACITY = 4
+SLOT_NAMES = ('first', 'second', 'third', 'fourth', 'fifth', 'sixth', 'seventh',
+              'eighth')
+
+# Seed for the Zobrist tables, fixed so that hashes are reproducible between runs
+ZOBRIST_SEED = 0x7B7E5
+ZOBRIST_MASK = (1 << 64) - 1
+
+# Move pruning levels accepted by `Game._forecast`
+PRUNING_NONE = 'none'
+PRUNING_SAFE = 'safe'
+PRUNING_AGGRESSIVE = 'aggressive'
+
+
+@lru_cache(maxsize=None)
+def slot_names(capacity):
+    """
+    Names of the slots of a tube, from the top down. Tubes of the default capacity
+    use 'first' to 'fourth'; past 'eighth', slots are numbered.
+    :param capacity: number of slots
+    :return: tuple of str
+    """
+    return tuple(SLOT_NAMES[i] if i < len(SLOT_NAMES) else f'slot_{i + 1}'
+                 for i in range(capacity))
+
+
+class UnsolvableError(ValueError):
+    """
+    Raised for a board that provably has no solution. `reason` is one of the
+    `UnsolvableError` class constants, and `details` holds the offending values.
+    """
+    CAPACITY = 'capacity'
+    COLOR_COUNT = 'color_count'
+    NOT_ENOUGH_TUBES = 'not_enough_tubes'
+    DEAD_END = 'dead_end'
+    EXHAUSTED = 'exhausted'
+
+    def __init__(self, reason, message, **details):
+        super().__init__(message)
+        self.reason = reason
+        self.details = details
+
+    def __reduce__(self):
+        # rebuilt from its reason and message, so it can be raised in another process
+        return type(self), (self.reason, str(self)), {'details': self.details}
+
+
+def independent(first, second):
+    """
+    Whether two moves touch different tubes. Such moves can be made in either order;
+    provided neither of them empties a tube or pours into an empty one (see
+    `Game._commutes`), both orders are legal and reach the same board.
+    :param first: (from_id, to_id)
+    :param second: (from_id, to_id)
+    :return: bool
+    """
+    return not {first[0], first[1]} & {second[0], second[1]}
+
 
 class Color:
     def __init__(self, color):
@@ -23,108 +83,215 @@ class Color:
         return len(self.color)
 
 
+class Palette:
+    """
+    Maps the colors of a game onto small integer codes so that a board can be packed
+    into a compact, hashable `bytes` object. Code 0 is reserved for an empty slot.
+    """
+    def __init__(self, colors=()):
+        self.colors = [None]
+        self.codes = {}
+        for color in colors:
+            self.add(color)
+
+    def __len__(self):
+        return len(self.colors) - 1
+
+    def add(self, color):
+        if color is None:
+            return 0
+        if color not in self.codes:
+            if len(self.colors) > 255:
+                raise ValueError('at most 255 colors can be packed')
+            self.codes[color] = len(self.colors)
+            self.colors.append(color)
+        return self.codes[color]
+
+    def code(self, color):
+        return 0 if color is None else self.codes[color]
+
+    def color(self, code):
+        return self.colors[code]
+
+
 class Tube:
-    def __init__(self, input=None):
-        self.first = None
-        self.second = None
-        self.third = None
-        self.fourth = None
-        self._slots = [item for item in self]
+    """
+    A tube of `_capacity` slots, filled from the bottom. The contents are kept as an
+    array of palette codes in slot order, top slot first, together with the fill
+    level, the length of the top run and the number of runs, which are updated as
+    colors are poured in and out.
+    """
+    __slots__ = ('_palette', '_capacity', '_cells', '_fill', '_run', '_num_runs', '_id')
+
+    def __init__(self, input=None, palette=None, capacity=None):
+        self._palette = Palette() if palette is None else palette
+        if type(input) == list and input:
+            capacity = len(input)
+        self._capacity = capacity or DEFAULT_CAPACITY
+        self._cells = bytearray(self._capacity)
+        self._fill = 0
+        self._run = 0
+        self._num_runs = 0
         self._id = None
-        if type(input) == list and len(input) == 4:
-            for i, element in enumerate(self):
-                if input[i] is not None:
-                    self.__setattr__(element, Color(input[i]))
+        if type(input) == list and input:
+            codes = [self._palette.add(None if color is None else Color(color))
+                     for color in input]
+            if 0 in codes[len(codes) - sum(map(bool, codes)):]:
+                raise ValueError(f'empty slot below a color in {input}')
+            for code in reversed(codes):
+                if code:
+                    self._add(code, 1)
 
     def __iter__(self):
-        yield from [item for item in self.__dir__() if not item.startswith('_')]
+        yield from self._slots
 
     def __repr__(self):
-        yield from (f'|  {self.__getattribute__(slot)} |' for slot in self)
+        return '\n'.join(f'|  {color} |' for color in self._iter_slots())
 
     def __str__(self):
-        return '\n'.join(f'| {self.__getattribute__(slot)} | - {slot}' for slot in self)
+        return '\n'.join(f'| {self._color(slot)} | - {slot}' for slot in self)
 
     def __eq__(self, other):
-        return all(self._color(slot) == other._color(slot) for slot in self)
+        if self._palette is other._palette:
+            return self._cells == other._cells
+        return list(self._iter_slots()) == list(other._iter_slots())
 
     def __hash__(self):
-        return hash(tuple((self._color(slot) for slot in self)))
+        return hash(tuple(self._iter_slots()))
+
+    @property
+    def _slots(self):
+        return slot_names(self._capacity)
 
     def _iter_slots(self):
-        yield from [self.__getattribute__(item) for item in self.__dir__() if not
-        item.startswith('_')]
+        color = self._palette.color
+        yield from [color(code) for code in self._cells]
 
     @property
     def _empty_slots(self):
-        return [slot for slot in self if not self.__getattribute__(slot)]
+        return list(self._slots[:self._capacity - self._fill])
+
+    @property
+    def _space(self):
+        return self._capacity - self._fill
 
     @property
     def _is_full(self):
-        return all(self._iter_slots())
+        return self._fill == self._capacity
 
     @property
     def _is_empty(self):
-        return all([item is None for item in self._iter_slots()])
+        return self._fill == 0
+
+    @property
+    def _top(self):
+        return self._cells[self._capacity - self._fill] if self._fill else 0
 
     @property
     def _first_full(self):
-        for item in self:
-            if self.__getattribute__(item):
-                return item
-        return self._slots[-1]
+        return self._slots[min(self._capacity - self._fill, self._capacity - 1)]
 
     @property
     def _color_to_pour(self):
-        return self.__getattribute__(self._first_full)
+        return self._palette.color(self._top)
 
     @property
     def _slots_to_pour(self):
-        if self._is_empty:
-            return []
-        idx_start = self._slots.index(self._first_full)
-        slots_to_pour = [self._first_full]
-
-        if idx_start == len(self._slots):
-            return slots_to_pour
-        else:
-            for slot in self._slots[idx_start:]:
-                color = self._color(slot)
-                idx = self._slots.index(slot)
-                if idx == len(self._slots) - 1:
-                    break
-                next_idx = idx + 1
-                next_color = self._color(self._slots[next_idx])
-                if color != next_color:
-                    break
-                else:
-                    slots_to_pour.append(self._slots[next_idx])
-        return slots_to_pour
-
+        start = self._capacity - self._fill
+        return list(self._slots[start:start + self._run])
 
     @property
     def _last_empty(self):
         if self._is_full:
             return None
-        last = self._slots[-1]
-        for item in self:
-            if self._color(item) is None:
-                last = item
-            elif item:
-                return last
-        return last
+        return self._slots[self._capacity - self._fill - 1]
 
     def _color(self, slot):
-        return self.__getattribute__(slot)
+        return self._palette.color(self._cells[self._slots.index(slot)])
 
     @property
     def _solved(self):
-        return len({color for color in self._iter_slots()}) == 1
+        return self._fill == 0 or (self._fill == self._capacity and self._num_runs == 1)
 
     @property
     def _colors(self):
         return {color for color in self._iter_slots() if color is not None}
 
+    @property
+    def _score(self):
+        return self._num_runs * (self._num_runs + 1) // 2
+
+    @property
+    def _runs(self):
+        """
+        Contiguous runs of the same color, from the top of the tube down.
+        :return: list of (color, length)
+        """
+        runs = []
+        for color in self._iter_slots():
+            if color is None:
+                continue
+            if runs and runs[-1][0] == color:
+                runs[-1][1] += 1
+            else:
+                runs.append([color, 1])
+        return [tuple(run) for run in runs]
+
+    def _add(self, code, num):
+        """
+        Puts `num` slots of color `code` on top of the tube.
+        """
+        top = self._capacity - self._fill
+        self._cells[top - num:top] = bytes((code,)) * num
+        if self._fill and self._cells[top] == code:
+            self._run += num
+        else:
+            self._run = num
+            self._num_runs += 1
+        self._fill += num
+
+    def _remove(self, num):
+        """
+        Takes `num` slots off the top of the tube, which must not exceed the top run.
+        :return: color code that was removed
+        """
+        top = self._capacity - self._fill
+        code = self._cells[top]
+        self._cells[top:top + num] = bytes(num)
+        self._fill -= num
+        self._run -= num
+        if not self._run and self._fill:
+            self._num_runs -= 1
+            top += num
+            below = self._cells[top]
+            run = 1
+            while top + run < self._capacity and self._cells[top + run] == below:
+                run += 1
+            self._run = run
+        elif not self._run:
+            self._num_runs = 0
+        return code
+
+    def _load(self, cells):
+        """
+        Replaces the contents of the tube with packed `cells`, in slot order.
+        """
+        self._cells[:] = cells
+        self._fill = self._run = self._num_runs = 0
+        prev = 0
+        for code in cells:
+            if not code:
+                continue
+            if code == prev:
+                if self._num_runs == 1:
+                    self._run += 1
+            else:
+                self._num_runs += 1
+                if self._num_runs == 1:
+                    self._run = 1
+            prev = code
+            self._fill += 1
+
     def _pour_in(self, from_tube, slots_over=None):
         if type(from_tube) is not Tube:
             raise TypeError(f'from_tube is of type {type(from_tube)} when it should '
@@ -136,12 +303,12 @@ class Tube:
         elif not self._is_empty:
             if from_tube._color_to_pour != self._color_to_pour:
                 raise RuntimeError('colors are not the same')
-        slots = slots_over if slots_over else from_tube._slots_to_pour
-        for slot in slots:
-            if self._is_full:
-                raise RuntimeError('Tube is full')
-            self.__setattr__(self._last_empty, from_tube._color(slot))
-            from_tube.__setattr__(slot, None)
+        num = len(slots_over) if slots_over else from_tube._run
+        if num > self._space:
+            raise RuntimeError('Tube is full')
+        color = from_tube._color_to_pour
+        from_tube._remove(num)
+        self._add(self._palette.add(color), num)
 
     def _pour_out(self, to_tube):
         raise NotImplementedError
@@ -149,40 +316,187 @@ class Tube:
 
 class Game:
     def __init__(self, input):
-        num = 1
+        self._palette = Palette()
+        capacity = max((len(tube) for tube in input.values() if type(tube) == list),
+                       default=DEFAULT_CAPACITY)
+        self._set_tubes([Tube(input[tube], self._palette, capacity) for tube in input])
+
+    @classmethod
+    def _from_packed(cls, colors, state, capacity):
+        """
+        Builds a game straight from a packed state and its color table, as read from a
+        compact puzzle file (see `tubes.formats`): each tube loads its slice of the
+        state at once, with no `Color` made per slot. The state is not checked.
+        :param colors: color names, the one of code 1 first
+        :param state: packed state, see `_pack`
+        :param capacity: slots per tube
+        :return: Game
+        """
+        game = cls.__new__(cls)
+        game._palette = Palette(Color(color) for color in colors)
+        tubes = []
+        for start in range(0, len(state), capacity):
+            tube = Tube(palette=game._palette, capacity=capacity)
+            tube._load(state[start:start + capacity])
+            tubes.append(tube)
+        game._set_tubes(tubes)
+        return game
+
+    def _set_tubes(self, tubes):
+        """
+        Numbers the tubes from 1, as `tube_1`, `tube_2`, ..., and builds the rest of the
+        game state around them.
+        :param tubes: list of Tube sharing `_palette`
+        """
         self._tubes = []
-        for tube in input:
+        self._tube_list = []
+        for num, tube in enumerate(tubes, 1):
             tube_attr = f'tube_{num}'
-            self.__setattr__(tube_attr, Tube(input[tube]))
-            self.__getattribute__(tube_attr)._id = num
+            self.__setattr__(tube_attr, tube)
+            tube._id = num
             self._tubes.append(num)
-            num += 1
-        self._num_tubes = num
-        self._slots = self.tube_1._slots
-        self._colors = set()
-        for tube in self._iter_tubes():
-            self._colors = self._colors.union(tube._colors)
+            self._tube_list.append(tube)
+        self._num_tubes = len(tubes) + 1
+        # the widest tube sizes the slot index and Zobrist table, so that a board whose
+        # tubes differ in capacity is still built, and rejected by `_validate`
+        self._slots = max((tube._slots for tube in tubes), key=len)
+        # Pouring never changes how much of each color there is, so the counter only
+        # needs to be built once
+        codes = Counter(self._pack())
+        codes.pop(0, None)
+        self._color_counter = Counter({self._palette.color(code): num
+                                       for code, num in codes.items()})
+        self._colors = set(self._color_counter)
         self._max_len_color = max(self._colors, key=len)
+        self._slot_index = {slot: i for i, slot in enumerate(self._slots)}
+        self._zobrist_table = self._build_zobrist_table()
+        self._tube_salts = self._build_tube_salts()
+        self._zobrist = self._zobrist_hash()
+        self._index_tubes()
         self._moves = []
         self._legal_moves = {}
-        #TODO: valdiate same number of slots per tube, validate multiples of colors
-        # is correct
+        # Boards are not validated here, see `_validate`
 
     def __hash__(self):
-        return hash(tuple(hash(tube) for tube in self._iter_tubes()))
+        return self._zobrist
+
+    def _validate(self):
+        """
+        Cheap checks that reject boards which cannot be solved: every tube has the same
+        capacity, there is exactly one tube's worth of each color, there are enough
+        tubes to move anything at all, and some move can be made.
+        :raises UnsolvableError: if the board cannot be solved
+        """
+        capacities = {tube._capacity for tube in self._iter_tubes()}
+        if len(capacities) > 1:
+            raise UnsolvableError(UnsolvableError.CAPACITY,
+                                  f'tubes have different capacities: {capacities}',
+                                  capacities=capacities)
+        capacity = capacities.pop()
+        counts = {color.color: num for color, num in self._color_counter.items()
+                  if num != capacity}
+        if counts:
+            raise UnsolvableError(UnsolvableError.COLOR_COUNT,
+                                  f'colors do not fill exactly one tube of {capacity}: '
+                                  f'{counts}', capacity=capacity, counts=counts)
+        if self._solved:
+            return
+        if len(self._tube_list) <= len(self._color_counter):
+            raise UnsolvableError(UnsolvableError.NOT_ENOUGH_TUBES,
+                                  f'{len(self._tube_list)} tubes cannot sort '
+                                  f'{len(self._color_counter)} colors',
+                                  tubes=len(self._tube_list),
+                                  colors=len(self._color_counter))
+        if self._dead_end:
+            raise UnsolvableError(UnsolvableError.DEAD_END, 'no legal moves')
 
     @property
-    def _color_counter(self):
-        colors = []
-        for tube in self._iter_tubes():
-            for color in tube._iter_slots():
-                if color is not None:
-                    colors.append(color)
-        return Counter(colors)
+    def _dead_end(self):
+        """
+        Whether the board is unsolved and no move can be made: there is no empty tube
+        and no top color shows on two tubes with room on one of them. Answered from
+        the top color index without generating moves.
+        :return: bool
+        """
+        if self._empty_tubes or self._solved:
+            return False
+        for tubes in self._tops.values():
+            if len(tubes) > 1 and tubes & self._open_tubes:
+                return False
+        return True
+
+    def __eq__(self, other):
+        if not isinstance(other, Game):
+            return NotImplemented
+        return self._zobrist == other._zobrist and self._pack() == other._pack()
+
+    def _build_zobrist_table(self):
+        """
+        Builds the Zobrist table, indexed as [slot][color code]. An empty slot (code 0)
+        contributes nothing to the hash.
+        :return: list
+        """
+        rand = random.Random(ZOBRIST_SEED)
+        return [[0] + [rand.getrandbits(64) for _ in range(len(self._palette))]
+                for _ in self._slots]
+
+    def _build_tube_salts(self):
+        """
+        Builds the odd multipliers of each tube position used by `_ordered_zobrist`.
+        :return: list
+        """
+        rand = random.Random(ZOBRIST_SEED + 1)
+        return [rand.getrandbits(64) | 1 for _ in self._tubes]
+
+    def _zobrist_hash(self):
+        """
+        Computes the Zobrist hash of the board from scratch. Each tube is hashed on its
+        own, and the tube hashes are summed so that the board hash does not depend on
+        the order of the tubes (see `_canonical`). `_push_move` and `_pop_move` keep
+        `_tube_hashes` and `_zobrist` up to date incrementally afterwards.
+
+        `_ordered_zobrist` weighs each tube hash by a salt of its position instead, so
+        boards with their tubes in another order hash apart, for searches that do not
+        deduplicate up to tube permutation.
+        :return: int
+        """
+        table = self._zobrist_table
+        self._tube_hashes = [0] * len(self._tubes)
+        for i, tube in enumerate(self._iter_tubes()):
+            for j, code in enumerate(tube._cells):
+                self._tube_hashes[i] ^= table[j][code]
+        self._ordered_zobrist = sum(
+            value * salt for value, salt in zip(self._tube_hashes, self._tube_salts)
+        ) & ZOBRIST_MASK
+        return sum(self._tube_hashes) & ZOBRIST_MASK
+
+    def _zobrist_toggle(self, tube_identity, slots, color):
+        code = self._palette.code(color)
+        old = value = self._tube_hashes[tube_identity - 1]
+        for slot in slots:
+            value ^= self._zobrist_table[self._slot_index[slot]][code]
+        self._tube_hashes[tube_identity - 1] = value
+        self._zobrist = (self._zobrist - old + value) & ZOBRIST_MASK
+        self._ordered_zobrist = (self._ordered_zobrist + (value - old)
+                                 * self._tube_salts[tube_identity - 1]) & ZOBRIST_MASK
+
+    def _canonical(self, state=None):
+        """
+        Tubes are interchangeable, so any permutation of them is the same puzzle. The
+        canonical form sorts the tubes by their packed contents.
+        :param state: packed state to canonicalize, defaults to the current board
+        :return: (canonical packed state, tube ids in canonical order)
+        """
+        state = self._pack() if state is None else state
+        num_slots = len(self._slots)
+        tubes = sorted((state[i * num_slots:(i + 1) * num_slots], identity)
+                       for i, identity in enumerate(self._tubes))
+        return (b''.join(tube for tube, _ in tubes),
+                tuple(identity for _, identity in tubes))
 
     @property
     def _solved(self):
-        return all([tube._solved for tube in self._iter_tubes()])
+        return len(self._solved_tubes) == len(self._tube_list)
 
     @property
     def _color_score_raw(self):
@@ -217,13 +531,53 @@ class Game:
 
     @property
     def _color_score(self):
-        return sum(self._color_score_raw.values())
+        """
+        Sum of `_color_score_raw`. A tube with n runs contributes n * (n + 1) / 2, so
+        the total is kept per tube and updated for the tubes touched by each move.
+        :return: int
+        """
+        return self._score
+
+    def _score_move(self, from_tube_identity, to_tube_identity):
+        """
+        The `_color_score` the board would have after a legal move, without applying
+        it. Only the two tubes involved are looked at.
+        :return: int
+        """
+        from_tube = self._retrieve_tube(from_tube_identity)
+        to_tube = self._retrieve_tube(to_tube_identity)
+        from_runs = from_tube._num_runs
+        if from_tube._run <= to_tube._space:
+            from_runs -= 1
+        to_runs = to_tube._num_runs or 1
+        return (self._score - from_tube._score - to_tube._score
+                + from_runs * (from_runs + 1) // 2 + to_runs * (to_runs + 1) // 2)
+
+    @property
+    def _lower_bound(self):
+        """
+        Admissible estimate of the number of moves left. `_color_score_raw` credits the
+        k-th run from the top of a tube with k points, so a tube with n runs scores
+        n * (n + 1) / 2; the bound works on those run counts directly. Every run
+        above the bottom run of its tube has to be poured out at least once, and a
+        move pours out at most one run that has never moved before. The same holds
+        for all but one of the bottom runs of each color. A move lowers the bound by
+        at most one, so it is also consistent.
+        :return: int
+        """
+        bottoms = Counter()
+        bound = 0
+        for tube in self._iter_tubes():
+            if tube._fill:
+                bound += tube._num_runs - 1
+                bottoms[tube._cells[-1]] += 1
+        return bound + sum(num - 1 for num in bottoms.values())
 
     def __iter__(self):
-        yield from [tube for tube in self.__dir__() if not tube.startswith('_')]
+        yield from (f'tube_{identity}' for identity in self._tubes)
 
     def _iter_tubes(self):
-        yield from [self.__getattribute__(tube) for tube in self]
+        yield from self._tube_list
 
     def __str__(self):
         print_list = [self._color_score, self._color_score_raw]
@@ -248,51 +602,160 @@ class Game:
         return f'<Game>'
 
     def _retrieve_tube(self, identity):
-        for tube in self._iter_tubes():
-            if tube._id == identity:
-                return tube
+        if 0 < identity <= len(self._tube_list):
+            return self._tube_list[identity - 1]
         return None
 
-    def _forecast(self):
-        self._legal_moves = {}
-        combs = permutations(self._tubes, 2)
-        for comb in combs:
-            try:
-                self._push_move(comb[0], comb[1])
-            except RuntimeError:
+    def _pack(self):
+        """
+        Packs the board into `bytes`, one byte per slot, tube by tube and slot by slot.
+        Each byte is the palette code of the color in that slot (0 for empty).
+        :return: bytes
+        """
+        return b''.join(tube._cells for tube in self._iter_tubes())
+
+    def _unpack(self, state):
+        """
+        Restores the board from a state produced by `_pack`. The move history is
+        cleared, as it no longer describes how the board was reached.
+        :param state: bytes
+        """
+        num_slots = len(self._slots)
+        for i, tube in enumerate(self._iter_tubes()):
+            tube._load(state[i * num_slots:(i + 1) * num_slots])
+        self._moves = []
+        self._zobrist = self._zobrist_hash()
+        self._index_tubes()
+
+    def _index_tubes(self):
+        """
+        Builds the indexes used for move generation from scratch: the tubes showing
+        each top color, the empty tubes and the tubes that are not full, along with the
+        solved tubes used by `_solved` and the per tube scores of `_color_score`.
+        `_push_move` and `_pop_move` keep them up to date afterwards.
+        """
+        self._tops = defaultdict(set)
+        self._top_of = {}
+        self._empty_tubes = set()
+        self._open_tubes = set()
+        self._solved_tubes = set()
+        self._tube_scores = [0] * len(self._tube_list)
+        self._score = 0
+        for tube in self._iter_tubes():
+            self._top_of[tube._id] = None
+            self._reindex_tube(tube)
+
+    def _reindex_tube(self, tube):
+        identity = tube._id
+        top = self._top_of[identity]
+        if top is not None:
+            self._tops[top].discard(identity)
+        top = tube._color_to_pour
+        self._top_of[identity] = top
+        if top is None:
+            self._empty_tubes.add(identity)
+        else:
+            self._empty_tubes.discard(identity)
+            self._tops[top].add(identity)
+        if tube._is_full:
+            self._open_tubes.discard(identity)
+        else:
+            self._open_tubes.add(identity)
+        if tube._solved:
+            self._solved_tubes.add(identity)
+        else:
+            self._solved_tubes.discard(identity)
+        score = tube._score
+        self._score += score - self._tube_scores[identity - 1]
+        self._tube_scores[identity - 1] = score
+
+    def _generate_moves(self, pruning=PRUNING_SAFE):
+        """
+        Lists the legal moves from the current board, straight from the top color
+        index. A tube can pour onto any other tube that is not full and shows the same
+        top color, or into an empty tube. Dominated moves are left out according to
+        `pruning`:
+
+        `PRUNING_SAFE` drops moves that only relabel the tubes, so some optimal
+        solution always survives:
+          - pouring a tube that holds a single color into an empty tube;
+          - pouring into any empty tube but the first one, as they are equivalent.
+        `PRUNING_AGGRESSIVE` additionally drops, for each source tube that can pour its
+        whole top run onto a tube of the same color:
+          - partial pours that would split that run;
+          - pours of that run into an empty tube.
+        These moves may be part of every optimal solution, so only use it when a
+        non-optimal solution is acceptable.
+        :param pruning: one of `PRUNING_NONE`, `PRUNING_SAFE`, `PRUNING_AGGRESSIVE`
+        :return: list of (from_id, to_id)
+        """
+        moves = []
+        empty = sorted(self._empty_tubes)
+        if pruning != PRUNING_NONE:
+            empty = empty[:1]
+        for from_id in self._tubes:
+            color = self._top_of[from_id]
+            if color is None:
                 continue
-            score = self._color_score
-            self._pop_move()
-            self._legal_moves[comb] = score
+            from_tube = self._retrieve_tube(from_id)
+            to_ids = sorted((self._tops[color] & self._open_tubes) - {from_id})
+            if pruning == PRUNING_AGGRESSIVE:
+                whole = [to_id for to_id in to_ids if
+                         self._retrieve_tube(to_id)._space >= from_tube._run]
+                if whole:
+                    moves.extend((from_id, to_id) for to_id in whole)
+                    continue
+            moves.extend((from_id, to_id) for to_id in to_ids)
+            if pruning != PRUNING_NONE and from_tube._num_runs == 1:
+                continue
+            moves.extend((from_id, to_id) for to_id in empty)
+        return moves
+
+    def _forecast(self, pruning=PRUNING_SAFE):
+        """
+        Finds the legal moves from the current board (see `_generate_moves`) and scores
+        each of them with the `_color_score` of the board it leads to.
+        :param pruning: one of `PRUNING_NONE`, `PRUNING_SAFE`, `PRUNING_AGGRESSIVE`
+        :return: 0, the legal moves are stored in `_legal_moves`
+        """
+        self._legal_moves = {}
+        for comb in self._generate_moves(pruning):
+            self._legal_moves[comb] = self._score_move(*comb)
         if not self._legal_moves:
             raise InterruptedError('No Legal Moves Left')
         return 0
 
+    def _commutes(self, cur_move):
+        """
+        Whether the move just applied left the set of empty tubes alone: it neither
+        emptied its source nor poured into an empty tube. Which empty tube a move may
+        pour into depends on the other tubes (see `_generate_moves`), so only such
+        moves commute with the `independent` moves around them.
+        :param cur_move: move returned by `_push_move`, still applied
+        :return: bool
+        """
+        return (not self._retrieve_tube(cur_move.coming_from)._is_empty and
+                self._retrieve_tube(cur_move.going_to)._fill > cur_move.num_slots)
+
     def _push_move(self, from_tube_identity, to_tube_identity):
         from_tube = self._retrieve_tube(from_tube_identity)
         to_tube = self._retrieve_tube(to_tube_identity)
         if from_tube._is_empty or to_tube._is_full:
             raise RuntimeError
         color = from_tube._color_to_pour
-        num_slots = min(len(from_tube._slots_to_pour), len(to_tube._empty_slots))
-        from_slots = from_tube._slots_to_pour
-        while len(from_slots) > num_slots:
-            del from_slots[-1]
-        slots_filled = [to_tube._last_empty]
-        idx = to_tube._slots.index(to_tube._last_empty)
-        for i in range(num_slots):
-            if i == 0:
-                continue
-            if idx < 0:
-                raise RuntimeError
-            idx = idx - 1
-            slot = to_tube._slots[idx]
-            slots_filled.append(slot)
+        num_slots = min(from_tube._run, to_tube._space)
+        from_slots = from_tube._slots_to_pour[:num_slots]
+        to_top = to_tube._capacity - to_tube._fill
+        slots_filled = list(reversed(to_tube._slots[to_top - num_slots:to_top]))
 
         cur_move = move(from_tube_identity, color, num_slots, from_slots,
                         to_tube_identity, slots_filled)
-        self._moves.append(cur_move)
         to_tube._pour_in(from_tube, from_slots)
+        self._moves.append(cur_move)
+        self._zobrist_toggle(from_tube_identity, from_slots, color)
+        self._zobrist_toggle(to_tube_identity, slots_filled, color)
+        self._reindex_tube(from_tube)
+        self._reindex_tube(to_tube)
         return cur_move
 
     def _pop_move(self):
@@ -303,14 +766,14 @@ class Game:
             undo_move = self._moves.pop()
             coming_from = self._retrieve_tube(undo_move.coming_from)
             color = undo_move.color
-            # num_slots = undo_move.num_slots
             from_slots = undo_move.from_slots
             going_to = self._retrieve_tube(undo_move.going_to)
             to_slots = undo_move.to_slots
-            for slot in from_slots:
-                coming_from.__setattr__(slot, color)
-            for slot in to_slots:
-                going_to.__setattr__(slot, None)
+            coming_from._add(going_to._remove(undo_move.num_slots), undo_move.num_slots)
+            self._zobrist_toggle(undo_move.coming_from, from_slots, color)
+            self._zobrist_toggle(undo_move.going_to, to_slots, color)
+            self._reindex_tube(coming_from)
+            self._reindex_tube(going_to)
             # self._legal_moves = {}
             return 0
 
@@ -0,0 +1,290 @@
+import logging
+import multiprocessing
+import queue
+import traceback
+
+from tubes.solve import (GameState, SearchStats, VisitedStates, _expand,
+                         _solution)
+
+# Children sent to another shard in one message
+BATCH_SIZE = 4096
+# Seconds between checks that the workers are still alive while waiting on them
+POLL_SECONDS = 1
+# Seconds between checks of the time limit and cancellation of the budget while
+# waiting on the workers
+BUDGET_POLL_SECONDS = 0.05
+
+# Messages to the workers
+_SEED = 'seed'
+_EXPAND = 'expand'
+_BATCH = 'batch'
+_DONE = 'done'
+_PARENT = 'parent'
+_STOP = 'stop'
+
+
+def _shard(zobrist, workers):
+    """
+    :return: index of the worker owning the states with this Zobrist hash
+    """
+    return zobrist % workers
+
+
+class ShardWorker:
+    """
+    One worker of the parallel BFS. It owns the states whose Zobrist hash falls into
+    its shard: their part of the visited set, their parent links and their part of
+    the frontier. Each layer it expands its own frontier and sends every child, as
+    packed bytes in batches, to the shard owning it; then it deduplicates the children
+    it was sent and reports the size of its next frontier. `game`, copied into the
+    worker once, `symmetry`, `pruning` and `reduce` are those of `parallel_bfs`.
+    :param index: shard index
+    :param inboxes: one message queue per worker
+    :param results: queue of replies to the coordinator
+    :param stop: event set by the coordinator once the budget has run out; the
+        worker checks it for every state it expands and exits
+    """
+    def __init__(self, index, game, symmetry, pruning, reduce, inboxes, results,
+                 stop):
+        self.index = index
+        self.game = game
+        self.symmetry = symmetry
+        self.pruning = pruning
+        self.reduce = reduce
+        self.inboxes = inboxes
+        self.results = results
+        self.stop = stop
+        self.visited = VisitedStates()
+        self.parents = {}
+        self.frontier = []
+        self.next_layer = {}
+
+    def _key(self, state):
+        if self.symmetry:
+            return self.game._canonical(state)[0]
+        return state
+
+    def _zobrist(self):
+        if self.symmetry:
+            return self.game._zobrist
+        return self.game._ordered_zobrist
+
+    def run(self):
+        try:
+            self._serve()
+        except _Stopped:
+            # nobody reads the batches still queued, so do not wait to flush them
+            for inbox in self.inboxes:
+                inbox.cancel_join_thread()
+        except Exception:
+            self.results.put(('error', self.index, traceback.format_exc()))
+
+    def _serve(self):
+        inbox = self.inboxes[self.index]
+        done = 0
+        expanded = None
+        while True:
+            message = inbox.get()
+            kind = message[0]
+            if kind == _STOP:
+                return
+            if kind == _SEED:
+                _, zobrist, key, state = message
+                self.visited.add(zobrist, key)
+                self.parents[key] = None
+                self.frontier.append((zobrist, key, GameState(state, last=frozenset())))
+            elif kind == _PARENT:
+                self.results.put(('parent', self.parents[message[1]]))
+            elif kind == _BATCH:
+                self._receive(message[1])
+            elif kind == _DONE:
+                done += 1
+            elif kind == _EXPAND:
+                expanded = self._expand_frontier()
+            if expanded is not None and done == len(self.inboxes) - 1:
+                self._report(expanded)
+                done = 0
+                expanded = None
+
+    def _expand_frontier(self):
+        game = self.game
+        workers = len(self.inboxes)
+        batches = [[] for _ in range(workers)]
+        for parent_zobrist, parent_key, node in self.frontier:
+            if self.stop.is_set():
+                raise _Stopped
+            for move in _expand(game, node, self.pruning, self.reduce):
+                state = game._pack()
+                last = None
+                if self.reduce and game._commutes(game._moves[-1]):
+                    last = frozenset((move,))
+                zobrist = self._zobrist()
+                owner = _shard(zobrist, workers)
+                batch = batches[owner]
+                batch.append((zobrist, self._key(state), state,
+                              (parent_zobrist, parent_key, move), last, game._solved,
+                              game._dead_end))
+                if len(batch) >= BATCH_SIZE:
+                    if owner == self.index:
+                        self._receive(batch)
+                    else:
+                        self.inboxes[owner].put((_BATCH, batch))
+                    batches[owner] = []
+        for owner, batch in enumerate(batches):
+            if owner == self.index:
+                self._receive(batch)
+                continue
+            if batch:
+                self.inboxes[owner].put((_BATCH, batch))
+            self.inboxes[owner].put((_DONE,))
+        expanded = len(self.frontier)
+        self.frontier = []
+        return expanded
+
+    def _receive(self, batch):
+        """
+        Deduplicates children against this shard, merging the partial order
+        reduction moves of twins reached in the same layer like `tubes.solve._bfs`.
+        """
+        for zobrist, key, state, parent, last, solved, dead_end in batch:
+            if not self.visited.add(zobrist, key):
+                twin = self.next_layer.get(key)
+                if twin is not None and twin[1].last is not None:
+                    same = last is not None and twin[1].state == state
+                    twin[1].last = twin[1].last | last if same else None
+                continue
+            self.parents[key] = parent
+            self.next_layer[key] = (zobrist, GameState(state, last=last), solved,
+                                    dead_end)
+
+    def _report(self, expanded):
+        solved = None
+        for key, (zobrist, node, is_solved, dead_end) in self.next_layer.items():
+            if is_solved:
+                solved = (zobrist, key)
+                break
+            if not dead_end:
+                self.frontier.append((zobrist, key, node))
+        self.next_layer = {}
+        self.results.put(('layer', self.index, expanded, len(self.frontier), solved))
+
+
+class _Stopped(Exception):
+    """
+    Raised in a worker told to stop in the middle of a layer.
+    """
+
+
+def _run_worker(*args):
+    ShardWorker(*args).run()
+
+
+def _receive(results, processes, budget=None):
+    """
+    Waits for the next reply of a worker, checking the time limit and cancellation
+    of `budget` every `BUDGET_POLL_SECONDS` meanwhile.
+    :raises RuntimeError: if a worker failed or died
+    :raises BudgetExhausted: if `budget` ran out of time or was cancelled
+    """
+    waited = 0
+    while True:
+        try:
+            reply = results.get(timeout=BUDGET_POLL_SECONDS)
+        except queue.Empty:
+            if budget is not None:
+                budget.spend(0)
+            waited += BUDGET_POLL_SECONDS
+            if waited >= POLL_SECONDS:
+                waited = 0
+                if not all(process.is_alive() for process in processes):
+                    raise RuntimeError('a parallel BFS worker died')
+            continue
+        if reply[0] == 'error':
+            raise RuntimeError(f'parallel BFS worker {reply[1]} failed:\n{reply[2]}')
+        return reply
+
+
+def parallel_bfs(game, symmetry, pruning, budget, optimal, reduce, workers,
+                 stats=None):
+    """
+    Layered BFS spread over `workers` processes, each owning the shard of the
+    visited set, parent links and frontier whose states hash to it (see
+    `ShardWorker`). The coordinator only starts each layer and collects the shard
+    sizes, so it never handles states itself. The workers swap children as packed
+    bytes in batches of up to `BATCH_SIZE`. Every child of a layer reaches its owner
+    before the next layer starts, so the depth of the solution is the same as
+    `tubes.solve._bfs`, although twins may keep another of their equally short paths.
+    Once solved, the moves are rebuilt by asking the owner of each state for its
+    parent in turn.
+
+    The budget is charged with the states of each layer once it completes, but its
+    time limit and cancellation are checked while a layer runs, and stop the workers
+    in the middle of it. The other arguments are those of `tubes.solve.solve`, on the
+    working game.
+    :param reduce: apply partial order reduction, see `tubes.solve._expand`
+    :param stats: tubes.solve.SearchStats counting each layer, or None; children
+        and duplicates are not counted, as they stay in the workers
+    """
+    if game._solved:
+        return _solution([], optimal)
+    context = multiprocessing.get_context()
+    inboxes = [context.Queue() for _ in range(workers)]
+    results = context.Queue()
+    stop = context.Event()
+    processes = [context.Process(target=_run_worker, daemon=True,
+                                 args=(index, game, symmetry, pruning, reduce, inboxes,
+                                       results, stop))
+                 for index in range(workers)]
+    for process in processes:
+        process.start()
+
+    try:
+        state = game._pack()
+        if symmetry:
+            key, zobrist = game._canonical(state)[0], game._zobrist
+        else:
+            key, zobrist = state, game._ordered_zobrist
+        inboxes[_shard(zobrist, workers)].put((_SEED, zobrist, key, state))
+        stats = SearchStats() if stats is None else stats
+        stats._layer(1)
+        while True:
+            for inbox in inboxes:
+                inbox.put((_EXPAND,))
+            expanded = frontier = 0
+            solved = []
+            for _ in range(workers):
+                reply = _receive(results, processes, budget)
+                _, index, num_expanded, size, solved_state = reply
+                expanded += num_expanded
+                frontier += size
+                if solved_state is not None:
+                    solved.append((index, solved_state))
+            budget.spend(expanded)
+            stats._add(expanded)
+            if solved:
+                break
+            stats._layer(frontier)
+            if not frontier:
+                logging.debug('expanded: %d', stats.expanded)
+                return None
+
+        moves = []
+        _, (zobrist, key) = min(solved)
+        while True:
+            inboxes[_shard(zobrist, workers)].put((_PARENT, key))
+            _, parent = _receive(results, processes)
+            if parent is None:
+                break
+            zobrist, key, move = parent
+            moves.append(move)
+        moves.reverse()
+        logging.debug('expanded: %d', stats.expanded)
+        return _solution(moves, optimal)
+    finally:
+        stop.set()
+        for inbox in inboxes:
+            inbox.put((_STOP,))
+        for process in processes:
+            process.join(POLL_SECONDS)
+            if process.is_alive():
+                process.terminate()
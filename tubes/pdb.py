@@ -0,0 +1,240 @@
+import argparse
+import logging
+import mmap
+import struct
+
+from tubes.model import DEFAULT_CAPACITY
+
+MAGIC = b'TPDB'
+VERSION = 1
+# magic, version, number of tubes, capacity, number of colors, pattern size, records
+HEADER = struct.Struct('<4sBBBBBxQ')
+# Cell codes of an abstract board: 0 is empty, 1 to `pattern_size` are the pattern
+# colors, and every other color is projected onto `WILD`
+EMPTY = 0
+MAX_DISTANCE = 255
+
+
+def _tube_top(tube):
+    """
+    :param tube: abstract tube, a bytes object top slot first
+    :return: (index of the top ball or len(tube) if empty, top cell, top run length)
+    """
+    first = len(tube) - len(tube.lstrip(b'\x00'))
+    if first == len(tube):
+        return first, EMPTY, 0
+    top = tube[first]
+    run = 1
+    while first + run < len(tube) and tube[first + run] == top:
+        run += 1
+    return first, top, run
+
+
+def _goal(num_tubes, capacity, num_colors, pattern_size):
+    """
+    The one solved abstract board: a full tube per pattern color, full wildcard tubes
+    for the other colors and empty tubes for the rest.
+    """
+    wild = pattern_size + 1
+    tubes = [bytes([label]) * capacity for label in range(1, pattern_size + 1)]
+    tubes += [bytes([wild]) * capacity] * (num_colors - pattern_size)
+    tubes += [bytes(capacity)] * (num_tubes - num_colors)
+    return tuple(sorted(tubes))
+
+
+def _predecessors(board, wild):
+    """
+    Abstract boards from which one pour leads to `board`. A pattern color pours its
+    whole top run, as far as there is room, like `Game._push_move`. The wildcard
+    stands for several colors whose runs it merges, so it may pour any number of
+    balls from its top run; this keeps every real move a move of the abstraction.
+    :param board: abstract board, a sorted tuple of abstract tubes
+    :param wild: cell code of the wildcard
+    :return: generator of abstract boards, sorted
+    """
+    tubes = list(board)
+    tops = [_tube_top(tube) for tube in tubes]
+    for to_index, (to_first, color, to_run) in enumerate(tops):
+        if not color:
+            continue
+        to_tube = tubes[to_index]
+        for from_index, (from_first, from_color, from_run) in enumerate(tops):
+            if from_index == to_index or not from_first:
+                continue
+            from_tube = tubes[from_index]
+            below = from_run if from_color == color else 0
+            if color != wild and below and to_first:
+                # the pour would have taken the balls below as well
+                continue
+            for num in range(1, min(to_run, from_first) + 1):
+                if num < to_run or to_first + num == len(to_tube):
+                    tubes[to_index] = bytes(to_first + num) + to_tube[to_first + num:]
+                    tubes[from_index] = (bytes(from_first - num) +
+                                         bytes([color]) * num + from_tube[from_first:])
+                    yield tuple(sorted(tubes))
+            tubes[to_index] = to_tube
+            tubes[from_index] = from_tube
+
+
+def build(path, num_tubes, num_colors, pattern_size, capacity=DEFAULT_CAPACITY):
+    """
+    Builds the pattern database of boards with `num_tubes` tubes holding
+    `num_colors` colors, projected onto `pattern_size` of them. A retrograde BFS
+    from the solved abstract board visits every abstract board that can still be
+    solved, and records its distance to the goal. The records are sorted by board and
+    written after a header, so they can be looked up by binary search in place.
+    :param path: output file
+    :param num_tubes: number of tubes
+    :param num_colors: number of colors
+    :param pattern_size: number of colors kept apart by the projection
+    :param capacity: tube capacity
+    :return: number of records
+    """
+    if not 0 < pattern_size <= num_colors < num_tubes:
+        raise ValueError('need 0 < pattern_size <= num_colors < num_tubes')
+    goal = _goal(num_tubes, capacity, num_colors, pattern_size)
+    wild = pattern_size + 1
+    distances = {goal: 0}
+    layer = [goal]
+    distance = 0
+    while layer:
+        distance += 1
+        if distance > MAX_DISTANCE:
+            raise ValueError('distances do not fit the record format')
+        next_layer = []
+        for board in layer:
+            for previous in _predecessors(board, wild):
+                if previous not in distances:
+                    distances[previous] = distance
+                    next_layer.append(previous)
+        logging.debug('distance %d: %d boards', distance, len(next_layer))
+        layer = next_layer
+
+    with open(path, 'wb') as file:
+        file.write(HEADER.pack(MAGIC, VERSION, num_tubes, capacity, num_colors,
+                               pattern_size, len(distances)))
+        for board in sorted(distances):
+            file.write(b''.join(board))
+            file.write(bytes((distances[board],)))
+    logging.info('pattern database: %d boards, depth %d', len(distances), distance - 1)
+    return len(distances)
+
+
+class PatternDatabase:
+    """
+    Read-only view on a pattern database file built by `build`. The file is memory
+    mapped, so processes that open the same file share its pages instead of loading
+    copies. Pickling only carries the path, and the file is mapped again on load.
+
+    Calling it with a Game returns an admissible lower bound on its remaining moves:
+    the colors are split into groups of `pattern_size`, each group's projection is
+    looked up, and the largest distance is taken.
+    """
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as file:
+            self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, version, self.num_tubes, self.capacity, self.num_colors,
+         self.pattern_size, self._num_records) = HEADER.unpack_from(self._mmap)
+        if magic != MAGIC or version != VERSION:
+            self._mmap.close()
+            raise ValueError(f'{path} is not a version {VERSION} pattern database')
+        self._key_size = self.num_tubes * self.capacity
+        self._record_size = self._key_size + 1
+        self._tables = []
+        for start in range(1, self.num_colors + 1, self.pattern_size):
+            start = min(start, self.num_colors - self.pattern_size + 1)
+            table = bytearray([self.pattern_size + 1]) * 256
+            table[EMPTY] = EMPTY
+            for label in range(1, self.pattern_size + 1):
+                table[start + label - 1] = label
+            self._tables.append(bytes(table))
+
+    def __len__(self):
+        return self._num_records
+
+    def __getstate__(self):
+        return self.path
+
+    def __setstate__(self, path):
+        self.__init__(path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self._mmap.close()
+
+    def _lookup(self, key):
+        """
+        Binary search for an abstract board.
+        :param key: abstract board, its sorted tubes joined
+        :return: distance to the goal, or None if the board cannot be solved
+        """
+        low, high = 0, self._num_records
+        while low < high:
+            middle = (low + high) // 2
+            offset = HEADER.size + middle * self._record_size
+            record = self._mmap[offset:offset + self._key_size]
+            if record < key:
+                low = middle + 1
+            elif record > key:
+                high = middle
+            else:
+                return self._mmap[offset + self._key_size]
+        return None
+
+    def _check(self, game):
+        """
+        :raises ValueError: if the database was built for other boards than `game`
+        """
+        shape = (len(game._tube_list), game._tube_list[0]._capacity,
+                 len(game._color_counter))
+        if shape != (self.num_tubes, self.capacity, self.num_colors):
+            raise ValueError(f'{self.path} holds boards of (tubes, capacity, colors) '
+                             f'{(self.num_tubes, self.capacity, self.num_colors)}, '
+                             f'not {shape}')
+
+    def __call__(self, game):
+        """
+        :param game: Game object with the shape the database was built for
+        :return: lower bound on the moves left, inf if the board cannot be solved
+        """
+        state = game._pack()
+        capacity = self.capacity
+        bound = 0
+        for table in self._tables:
+            cells = state.translate(table)
+            key = b''.join(sorted(cells[i:i + capacity]
+                                  for i in range(0, len(cells), capacity)))
+            distance = self._lookup(key)
+            if distance is None:
+                return float('inf')
+            bound = max(bound, distance)
+        return bound
+
+
+def parse_args(args=None):
+    parser = argparse.ArgumentParser(prog='tubes.pdb',
+                                     description='Build a pattern database')
+    parser.add_argument('output_file', help='pattern database file to write')
+    parser.add_argument('--tubes', type=int, required=True, help='number of tubes')
+    parser.add_argument('--colors', type=int, required=True, help='number of colors')
+    parser.add_argument('--pattern-size', type=int, default=2,
+                        help='colors per pattern (default: %(default)s)')
+    parser.add_argument('--capacity', type=int, default=DEFAULT_CAPACITY,
+                        help='tube capacity (default: %(default)s)')
+    return parser.parse_args(args)
+
+
+def main(args=None):
+    args = parse_args(args)
+    build(args.output_file, args.tubes, args.colors, args.pattern_size, args.capacity)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    main()
@@ -0,0 +1,308 @@
+import argparse
+import glob
+import json
+import logging
+import multiprocessing
+import os
+import pickle
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+import yaml
+
+from tubes.cache import SolutionCache
+from tubes.formats import iter_jsonl
+from tubes.model import Game, UnsolvableError
+from tubes.pdb import PatternDatabase
+from tubes.solve import BFS, MODES, Budget, BudgetExhausted, SearchStats, solve
+
+# Files picked up when a directory is given
+PUZZLE_SUFFIXES = ('.yml', '.yaml', '.jsonl')
+# Files read as compact puzzle records, see `tubes.formats`
+JSONL_SUFFIX = '.jsonl'
+# Reads puzzles from standard input instead of a path
+STDIN = '-'
+# Name of standard input in the names of its puzzles
+STDIN_NAME = '<stdin>'
+
+# Status of a result line
+SOLVED = 'solved'
+UNSOLVABLE = 'unsolvable'
+TIMEOUT = 'timeout'
+ERROR = 'error'
+
+# `solve` keyword arguments of the current worker process
+_solve_kwargs = {}
+# Queue the current worker process reports the jobs it starts to, or None
+_started = None
+
+
+def iter_puzzles(sources, stdin=None, jsonl=False):
+    """
+    Reads puzzles from directories of puzzle files, glob patterns, file paths, or
+    `STDIN` for a stream of YAML documents, one puzzle each, separated by `---`.
+    Files are YAML, one puzzle each, or JSON lines of compact puzzle records (see
+    `tubes.formats`), which are built into games as they are read. Documents and
+    lines are read one at a time, so streams are never loaded whole.
+    :param sources: iterable of sources
+    :param stdin: stream read for `STDIN`, defaults to `sys.stdin`
+    :param jsonl: read `STDIN` as JSON lines of puzzle records rather than YAML
+    :return: generator of (name, config), where config is a YAML puzzle, a Game, or
+        the exception raised if the puzzle could not be read
+    """
+    for source in sources:
+        if source == STDIN and jsonl:
+            yield from iter_jsonl(stdin or sys.stdin, STDIN_NAME)
+            continue
+        if source == STDIN:
+            documents = yaml.safe_load_all(stdin or sys.stdin)
+            index = 0
+            while True:
+                index += 1
+                try:
+                    config = next(documents)
+                except StopIteration:
+                    break
+                except yaml.YAMLError as exc:
+                    yield f'{STDIN_NAME}:{index}', exc
+                    break
+                yield f'{STDIN_NAME}:{index}', config
+            continue
+        if os.path.isdir(source):
+            paths = sorted(os.path.join(source, name) for name in os.listdir(source)
+                           if name.endswith(PUZZLE_SUFFIXES))
+        else:
+            paths = sorted(glob.glob(source)) or [source]
+        for path in paths:
+            try:
+                with open(path) as file:
+                    if path.endswith(JSONL_SUFFIX):
+                        yield from iter_jsonl(file, path)
+                    else:
+                        yield path, yaml.safe_load(file)
+            except (OSError, yaml.YAMLError) as exc:
+                yield path, exc
+
+
+def estimate(game):
+    """
+    Rough size of the search for a board, used to schedule the longest jobs first.
+    :param game: Game object
+    :return: sortable estimate, larger for longer searches
+    """
+    return len(game._color_counter), game._lower_bound, len(game._tube_list)
+
+
+def _init_worker(kwargs, reopen=False, started=None):
+    """
+    :param kwargs: `solve` keyword arguments of this process
+    :param reopen: copy them through pickle, so that pattern databases and caches
+        open their own files rather than use those inherited from the parent process
+    :param started: queue to report the index of each job to as it starts, or None
+    """
+    global _solve_kwargs, _started
+    _solve_kwargs = pickle.loads(pickle.dumps(kwargs)) if reopen else kwargs
+    _started = started
+    logging.getLogger().setLevel(logging.WARNING)
+
+
+def _solve_job(name, game, timeout=None, max_nodes=None):
+    """
+    Solves one board with the `solve` keyword arguments of this worker.
+    :return: result dict, see `run_batch`
+    """
+    budget = Budget(max_nodes=max_nodes, max_seconds=timeout)
+    stats = SearchStats()
+    result = {'puzzle': name}
+    start = time.perf_counter()
+    try:
+        solution = solve(game, budget=budget, stats=stats, **_solve_kwargs)
+    except UnsolvableError as exc:
+        result.update(status=UNSOLVABLE, reason=exc.reason)
+    except BudgetExhausted as exc:
+        result.update(status=TIMEOUT, reason=str(exc))
+    except Exception as exc:
+        result.update(status=ERROR, error=f'{type(exc).__name__}: {exc}')
+    else:
+        if solution is None:
+            result.update(status=UNSOLVABLE, reason='search ran dry')
+        else:
+            result.update(status=SOLVED, moves=[list(move) for move in solution],
+                          depth=len(solution), optimal=solution.optimal)
+    result.update(nodes=stats.expanded,
+                  seconds=round(time.perf_counter() - start, 6))
+    return result
+
+
+def _pool_job(index, *args):
+    """
+    Reports job `index` as started, then runs `_solve_job`.
+    """
+    _started.put(index)
+    return _solve_job(*args)
+
+
+def _error(name, exc):
+    return {'puzzle': name, 'status': ERROR, 'error': f'{type(exc).__name__}: {exc}'}
+
+
+def _run_pool(queued, write, jobs, timeout, max_nodes, kwargs):
+    """
+    Solves the queued boards over a pool of `jobs` processes. A worker that dies
+    abruptly, killed or out of memory, breaks the pool and fails every pending
+    job: the boards that had started are written as errors, since one of them
+    killed it, and the others are submitted again to a new pool.
+    :param queued: list of (name, Game), in order of submission
+    :param write: callable writing a result dict
+    """
+    context = multiprocessing.get_context()
+    started = context.SimpleQueue()
+    remaining = dict(enumerate(queued))
+    while remaining:
+        running, lost = set(), {}
+        with ProcessPoolExecutor(max_workers=jobs, mp_context=context,
+                                 initializer=_init_worker,
+                                 initargs=(kwargs, True, started)) as executor:
+            futures = {executor.submit(_pool_job, index, name, game, timeout,
+                                       max_nodes): index
+                       for index, (name, game) in remaining.items()}
+            for future in as_completed(futures):
+                index = futures[future]
+                while not started.empty():
+                    running.add(started.get())
+                name = remaining[index][0]
+                try:
+                    result = future.result()
+                except BrokenProcessPool as exc:
+                    lost[index] = exc
+                    continue
+                except Exception as exc:
+                    result = _error(name, exc)
+                del remaining[index]
+                write(result)
+        while not started.empty():
+            running.add(started.get())
+        # a pool broken before any job started would break again
+        dead = [index for index in lost if index in running] or list(lost)
+        if lost:
+            logging.warning('a worker process died, resubmitting %d puzzles',
+                            len(lost) - len(dead))
+        for index in dead:
+            name = remaining.pop(index)[0]
+            write(_error(name, lost[index]))
+
+
+def run_batch(puzzles, output, jobs=None, timeout=None, max_nodes=None, **kwargs):
+    """
+    Solves many puzzles over a pool of `jobs` processes, writing one JSON line to
+    `output` per puzzle as soon as it is finished. Each line holds the puzzle name,
+    its status (`SOLVED`, `UNSOLVABLE`, `TIMEOUT` or `ERROR`), the moves, depth and
+    optimality of a solution, the reason or error otherwise, and the nodes expanded
+    and wall time of the search. Lines come in order of completion, not input.
+    Puzzles lost with a worker process that died are written as errors, see
+    `_run_pool`.
+
+    Boards are built and validated up front and sorted by `estimate`, so the
+    longest searches start first rather than holding up the end of the batch. All of
+    `puzzles` is therefore read before the first search starts: a stream gets no
+    results until it has ended, except for the boards rejected on reading or
+    validation, which are written as they are read.
+
+    Each worker process is started once, with the `solve` keyword arguments, so no
+    interpreter or import cost is paid per puzzle. Pattern databases and caches are
+    reopened by path in each worker.
+    :param puzzles: iterable of (name, config or Game), see `iter_puzzles`
+    :param output: text stream the results are written to
+    :param jobs: number of worker processes, defaults to the number of CPUs; with 1
+        the puzzles are solved in this process
+    :param timeout: wall time allowed per puzzle in seconds, or None
+    :param max_nodes: states expanded allowed per puzzle, or None
+    :param kwargs: passed on to `solve`
+    :return: dict counting the results by status
+    """
+    counts = dict.fromkeys((SOLVED, UNSOLVABLE, TIMEOUT, ERROR), 0)
+
+    def write(result):
+        counts[result['status']] += 1
+        output.write(json.dumps(result) + '\n')
+        output.flush()
+
+    queued = []
+    for name, config in puzzles:
+        try:
+            if isinstance(config, Exception):
+                raise config
+            game = config if isinstance(config, Game) else Game(config)
+            game._validate()
+        except UnsolvableError as exc:
+            write({'puzzle': name, 'status': UNSOLVABLE, 'reason': exc.reason})
+            continue
+        except Exception as exc:
+            write(_error(name, exc))
+            continue
+        queued.append((estimate(game), len(queued), name, game))
+    queued.sort(key=lambda job: (job[0], -job[1]), reverse=True)
+
+    jobs = jobs or os.cpu_count() or 1
+    if jobs == 1:
+        level = logging.getLogger().level
+        _init_worker(kwargs)
+        try:
+            for _, _, name, game in queued:
+                write(_solve_job(name, game, timeout, max_nodes))
+        finally:
+            _init_worker({})
+            logging.getLogger().setLevel(level)
+        return counts
+
+    _run_pool([(name, game) for _, _, name, game in queued], write, jobs, timeout,
+              max_nodes, kwargs)
+    return counts
+
+
+def parse_args(args=None):
+    parser = argparse.ArgumentParser(
+        prog='tubes.runner', description='Solve many tubes puzzles',
+        epilog='Every puzzle is read before the first search starts, so that the '
+               'longest ones are started first: results from standard input only '
+               'come once the stream has ended.')
+    parser.add_argument('sources', nargs='+',
+                        help=f'puzzle directories, glob patterns or files, or '
+                             f'{STDIN} for a stream of YAML documents')
+    parser.add_argument('--jsonl', action='store_true',
+                        help=f'read {STDIN} as JSON lines of puzzle records')
+    parser.add_argument('--output', '-o',
+                        help='JSONL file to write the results to (default: stdout)')
+    parser.add_argument('--jobs', '-j', type=int,
+                        help='worker processes (default: number of CPUs)')
+    parser.add_argument('--timeout', type=float, help='seconds allowed per puzzle')
+    parser.add_argument('--max-nodes', type=int, help='states allowed per puzzle')
+    parser.add_argument('--mode', choices=MODES, default=BFS,
+                        help='search mode (default: %(default)s)')
+    parser.add_argument('--cache', help='SQLite file caching solved boards')
+    parser.add_argument('--pdb', help='pattern database file for the astar and '
+                                      'idastar modes')
+    return parser.parse_args(args)
+
+
+def main(args=None):
+    args = parse_args(args)
+    kwargs = {'mode': args.mode}
+    if args.pdb is not None:
+        kwargs['pdb'] = PatternDatabase(args.pdb)
+    if args.cache is not None:
+        kwargs['cache'] = SolutionCache(args.cache)
+    output = sys.stdout if args.output is None else open(args.output, 'w')
+    try:
+        counts = run_batch(iter_puzzles(args.sources, jsonl=args.jsonl), output,
+                           args.jobs, args.timeout, args.max_nodes, **kwargs)
+    finally:
+        if output is not sys.stdout:
+            output.close()
+    logging.warning(', '.join(f'{status}: {num}' for status, num in counts.items()))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,30 +1,306 @@
+import heapq
 import logging
+import shutil
+import sys
+import time
+from collections import OrderedDict
 from copy import deepcopy
+from itertools import count
+
+from tubes.model import PRUNING_AGGRESSIVE, PRUNING_SAFE, UnsolvableError, independent
+
+try:
+    import resource
+except ImportError:
+    resource = None
 
 logging.basicConfig(level=logging.INFO)
 
+# Search modes accepted by `solve`
+BFS = 'bfs'
+ASTAR = 'astar'
+WEIGHTED = 'weighted'
+IDASTAR = 'idastar'
+BEAM = 'beam'
+EXTERNAL = 'external'
+MODES = (BFS, ASTAR, WEIGHTED, IDASTAR, BEAM, EXTERNAL)
 
-class GameState:
-    def __init__(self, game=None, moves=None, legal_moves=None):
-        self.game = game
-        self.moves = moves or []
-        self.legal_moves = legal_moves or {}
+# Search backends accepted by `solve`
+PYTHON = 'python'
+NUMPY = 'numpy'
+BACKENDS = (PYTHON, NUMPY)
+
+# Default number of entries kept in the `IDASTAR` transposition table
+TABLE_SIZE = 1 << 20
+# Default number of states kept per layer by the `BEAM` mode
+BEAM_WIDTH = 1000
+# Number of beam searches, each four times wider, run by `solve_anytime`
+BEAM_ROUNDS = 3
+# Expanded states between two calls of a `SearchStats` callback
+CALLBACK_EVERY = 10000
+
+
+class BudgetExhausted(Exception):
+    """
+    Raised by `Budget.spend` once a search has run out of nodes or time, or has been
+    cancelled.
+    """
+
+
+class Budget:
+    """
+    Bounds the work of a search. Expanded states are charged with `spend`, which
+    raises `BudgetExhausted` once `max_nodes` states have been expanded,
+    `max_seconds` have passed since the budget was created, or `cancel` is set.
+    :param max_nodes: maximum number of states to expand, or None
+    :param max_seconds: maximum wall time in seconds, or None
+    :param cancel: cancellation token with an `is_set` method, such as a
+        `threading.Event`, or None
+    """
+    def __init__(self, max_nodes=None, max_seconds=None, cancel=None):
+        self.max_nodes = max_nodes
+        self.deadline = None if max_seconds is None else time.monotonic() + max_seconds
+        self.cancel = cancel
+        self.nodes = 0
+
+    def spend(self, num=1):
+        self.nodes += num
+        if self.max_nodes is not None and self.nodes > self.max_nodes:
+            raise BudgetExhausted(f'expanded {self.max_nodes} states')
+        if self.deadline is not None and time.monotonic() > self.deadline:
+            raise BudgetExhausted('out of time')
+        if self.cancel is not None and self.cancel.is_set():
+            raise BudgetExhausted('cancelled')
+
+
+class Solution(list):
+    """
+    List of (from_id, to_id) moves, flagged with whether it is proven optimal. `solve`
+    attaches the `SearchStats` of the search that found it as `stats`.
+    """
+    def __init__(self, moves=(), optimal=False):
+        super().__init__(moves)
+        self.optimal = optimal
+        self.stats = None
+
+
+def _peak_rss():
+    """
+    :return: peak resident set size of this process in bytes, or None where the
+        `resource` module is missing
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+class SearchStats:
+    """
+    Counters of a search, filled in by `solve` and attached to its Solution. A
+    SearchStats passed to `solve` is filled in place, so it can also be read after the
+    search ran out of budget; passed to several searches, it adds them up.
+
+    `expanded` counts the states whose moves were generated, `generated` the children
+    reached through them, and `duplicates` the children dropped as already seen.
+    `frontier` holds the size of each layer reached by the layered searches, from
+    depth 0, and `peak_frontier` the largest frontier or open list. `visited` is the
+    number of states held for deduplication when the search ended. `peak_rss` is the
+    peak resident memory of the process, in bytes, which includes whatever it held
+    before the search.
+
+    `callback` is called with this object after each layer of a layered search, and
+    every `every` expanded states in any search, so a long search can be followed as
+    it runs. The counters are kept per state expanded, never per child, so they cost
+    next to nothing. With `timing`, the seconds spent generating and applying moves,
+    hashing boards into their deduplication key, and copying packed boards out of the
+    working game are also measured; this adds clock reads around every child and
+    slows the search down, so it is off by default. Only the `PYTHON` backend in one
+    process is timed, and fills in `generated` and `duplicates`.
+    :param callback: callable taking this object, or None
+    :param every: expanded states between two calls of `callback`
+    :param timing: measure the time spent per step of the search
+    """
+    def __init__(self, callback=None, every=CALLBACK_EVERY, timing=False):
+        self.callback = callback
+        self.every = every
+        self.timing = timing
+        self.expanded = 0
+        self.generated = 0
+        self.duplicates = 0
+        self.frontier = []
+        self.peak_frontier = 0
+        self.visited = 0
+        self.depth = None
+        self.seconds = 0.0
+        self.move_seconds = 0.0
+        self.hash_seconds = 0.0
+        self.copy_seconds = 0.0
+        self.peak_rss = None
+        self._report_at = every if callback is not None else float('inf')
+
+    def __repr__(self):
+        return f'SearchStats({self.as_dict()})'
 
     @property
-    def solved(self) -> bool:
-        return self.game._solved
+    def branching_factor(self):
+        """
+        Effective branching factor: the b of a uniform tree of the solution depth
+        with as many nodes as were generated, N + 1 = 1 + b + b^2 + ... + b^depth.
+        :return: float, or None before a solution of at least one move is found, or
+            when children were not counted
+        """
+        if not self.depth or not self.generated:
+            return None
+        nodes = self.generated + 1
+
+        def size(branching):
+            return sum(branching ** depth for depth in range(self.depth + 1))
+
+        low, high = 0.0, max(1.0, float(nodes))
+        for _ in range(100):
+            middle = (low + high) / 2
+            if size(middle) < nodes:
+                low = middle
+            else:
+                high = middle
+        return round((low + high) / 2, 4)
+
+    def as_dict(self):
+        """
+        :return: dict of the counters, for JSON
+        """
+        stats = {name: getattr(self, name) for name in (
+            'expanded', 'generated', 'duplicates', 'frontier', 'peak_frontier',
+            'visited', 'depth', 'seconds', 'peak_rss')}
+        stats['branching_factor'] = self.branching_factor
+        if self.timing:
+            stats.update(move_seconds=self.move_seconds, hash_seconds=self.hash_seconds,
+                         copy_seconds=self.copy_seconds)
+        return stats
+
+    def _add(self, expanded=1, generated=0, duplicates=0):
+        """
+        Counts states expanded along with their children, calling `callback` once
+        `every` more states have been expanded since it was last called.
+        """
+        self.expanded += expanded
+        self.generated += generated
+        self.duplicates += duplicates
+        if self.expanded >= self._report_at:
+            self._report_at = self.expanded + self.every
+            self.callback(self)
+
+    def _layer(self, size):
+        """
+        Records a completed layer of `size` states and calls `callback`.
+        """
+        self.frontier.append(size)
+        self.peak_frontier = max(self.peak_frontier, size)
+        if self.callback is not None:
+            self.callback(self)
+
+    def _timed(self, function, counter):
+        """
+        :return: `function`, adding the time spent in each call to the `counter`
+            attribute when `timing` is on
+        """
+        if not self.timing:
+            return function
+
+        def timed(*args):
+            start = time.perf_counter()
+            try:
+                return function(*args)
+            finally:
+                setattr(self, counter,
+                        getattr(self, counter) + time.perf_counter() - start)
+        return timed
+
+    def _timed_moves(self, moves):
+        """
+        :param moves: move generator, see `_expand`
+        :return: `moves`, adding the time spent producing each move to `move_seconds`
+            when `timing` is on
+        """
+        if not self.timing:
+            return moves
+        return self._time_moves(moves)
+
+    def _time_moves(self, moves):
+        moves = iter(moves)
+        while True:
+            start = time.perf_counter()
+            move = next(moves, None)
+            self.move_seconds += time.perf_counter() - start
+            if move is None:
+                return
+            yield move
+
+
+class GameState:
+    """
+    A node of the search tree. Only the packed board is stored, along with the node it
+    was reached from and the move that led to it; the move list is rebuilt once the
+    solution is found.
+
+    `last` holds the moves through which BFS reached this board at its depth, for
+    partial order reduction, or None when no reduction applies (see `_expand`).
+    """
+    __slots__ = ('state', 'parent', 'move', 'last')
+
+    def __init__(self, state, parent=None, move=None, last=None):
+        self.state = state
+        self.parent = parent
+        self.move = move
+        self.last = last
 
     @property
-    def score(self) -> int:
-        # This is not yet used, but could be leveraged for less naive move selection
-        return self.game._color_score
+    def moves(self):
+        moves = []
+        node = self
+        while node.parent is not None:
+            moves.append(node.move)
+            node = node.parent
+        moves.reverse()
+        return moves
+
+
+class VisitedStates:
+    """
+    Set of packed states keyed by the game's incremental Zobrist hash: `_zobrist` for
+    canonical states, `_ordered_zobrist` for states whose tube order matters. Lookups
+    are a dictionary probe on the 64 bit hash; the packed states are only compared
+    when hashes match, and genuine collisions fall back to an ordinary set.
+    """
+    def __init__(self):
+        self._states = {}
+        self._collisions = set()
 
-    def make_move(self, move):
-        self.moves.append(move)
-        self.game._push_move(*move)
+    def __len__(self):
+        return len(self._states) + len(self._collisions)
 
+    def add(self, key, state):
+        """
+        :param key: Zobrist hash of `state`
+        :param state: packed state
+        :return: True if the state had not been seen before
+        """
+        seen = self._states.get(key)
+        if seen is None:
+            self._states[key] = state
+            return True
+        if seen == state or state in self._collisions:
+            return False
+        self._collisions.add(state)
+        return True
 
-def solve(game_input):
+
+def solve(game_input, mode=BFS, weight=2, symmetry=True, pruning=PRUNING_SAFE,
+          table_size=TABLE_SIZE, beam_width=BEAM_WIDTH, budget=None,
+          partial_order=True, pdb=None, workers=1, backend=PYTHON, work_dir=None,
+          checkpoint=None, resume_from=None, cache=None, stats=None):
     """
     Implements a naive BFS solver for the Game. The BFS algorithm has to tackle both
     graph generation and evaluation for criteria--this wrinkle introduces some
@@ -33,49 +309,610 @@ def solve(game_input):
     order to traverse the graph, as the full structure of the state graph is not
     known ahead of time. Instead, we are forced to calculate possible states and
     evaluate for solution simultaneously.
+
+    The search runs over packed board states (see `Game._pack`) rather than over
+    `Game` objects. A single working copy of the game is loaded with a state when it
+    is expanded, and its children are produced by applying and undoing each legal
+    move on that board, so `game_input` itself is left untouched.
+
+    Besides BFS, two best-first modes are available. `ASTAR` orders the frontier by
+    depth plus `Game._lower_bound` and returns an optimal solution, like BFS, while
+    usually expanding far fewer states. `WEIGHTED` orders it by depth plus `weight`
+    times `Game._color_score`, trading optimality for speed.
+
+    For boards whose frontier does not fit in memory, `IDASTAR` runs iterative
+    deepening A* on the same lower bound. It walks the tree depth first on the working
+    board, so memory is linear in the solution depth plus a transposition table
+    capped at `table_size` entries, and the solution is still optimal.
+
+    `BEAM` searches layer by layer like BFS but only keeps the `beam_width` states
+    with the lowest `Game._color_score` in each layer. It is fast, but it may miss
+    solutions; see also `solve_anytime`. Its frontier is bounded by `beam_width`, but
+    not its memory: every child generated stays in its visited set, which grows by up
+    to `beam_width` times the branching factor per layer.
+
+    `EXTERNAL` is BFS with its layers and visited set kept in sorted files on disk
+    rather than in memory, for boards whose search does not fit in RAM, see
+    `tubes.external.external_bfs`. The files go to `work_dir`, or to a temporary
+    directory.
+
+    BFS in one process with the `PYTHON` backend can write its progress to a
+    `checkpoint` file, one layer at a time, see `tubes.checkpoint.Checkpoint`. On
+    SIGTERM the search stops with `BudgetExhausted`, leaving the checkpoint at the
+    last completed layer. A later call with `resume_from` set to that file, on the
+    same board and settings, reloads the visited boards and carries on from the last
+    layer, appending to the file, or to a copy at `checkpoint` if both are given.
+
+    With a `tubes.cache.SolutionCache`, a cached solution of the same board, with its
+    tubes in any order, is returned without searching, and optimal solutions found
+    are added to the cache.
+
+    A `Budget` bounds the work of any mode; `BudgetExhausted` is raised when it runs
+    out.
+
+    The counters of the search are kept in a `SearchStats`, attached to the solution
+    as `stats`. Pass one in to follow the search through its callback, to time the
+    steps of the search, or to read the counters of a search that raised.
+
+    The board is checked with `Game._validate` first, so malformed and trivially
+    unsolvable boards are rejected before any search. Boards with no legal move
+    (`Game._dead_end`) are never queued for expansion. All modes but `BEAM` are
+    complete, so when their search runs out of states without finding a solution,
+    the board is proven unsolvable.
+
+    With `symmetry`, states are deduplicated on their canonical form (see
+    `Game._canonical`), so boards that only differ by the order of their tubes are
+    searched once. Nodes still hold the actual board, so the returned moves refer to
+    the tube ids of `game_input`.
+
+    `pruning` is passed on to `Game._generate_moves`. The default rules never discard
+    every optimal solution; `PRUNING_AGGRESSIVE` shrinks the search further but BFS and
+    A* are then no longer guaranteed to be optimal.
+
+    A `tubes.pdb.PatternDatabase` built for boards of this shape raises the lower bound
+    used by `ASTAR` and `IDASTAR` to the larger of `Game._lower_bound` and its own
+    bound, which is still admissible and consistent, so fewer states are expanded.
+
+    With more than one of `workers`, BFS expands each layer in that many processes,
+    see `tubes.parallel.parallel_bfs`. The other modes run in this process only.
+
+    The `NUMPY` backend runs BFS on whole layers with array operations, see
+    `tubes.batch.batch_bfs`. It needs numpy, and finds solutions as short as the
+    default `PYTHON` backend.
+
+    With `partial_order`, BFS only generates one order of two commuting moves, see
+    `_expand`. It is not combined with `PRUNING_AGGRESSIVE`, whose rules depend on
+    tubes other than those a move touches.
     :param game_input: Game object
-    :return: #TODO: return solution
-    """
-    game_state = GameState(game_input)
-
-    # Queue and visited are utilized as standard BFS structures. The queue stores the
-    # unevaluated states, and the visited stores hashes of previously seen states.
-    queue, visited = [game_state], set()
-    num_moves_tried = 0
-
-    while queue:
-        num_moves_tried += 1
-
-        # take the first element in the queue and get ready to analyze.
-        node = queue.pop(0)
-        # Also, note that we have visited this node
-        visited.add(node.game)
-
-        # In order to prevent inappropriate copying of information from one node to
-        # another, copy the node information to avoid making changes to the original.
-        if node.solved:
-            logging.info('solved!')
-            logging.info(game_state.moves)
-            logging.info(f'depth: {len(game_state.moves)}')
-            return game_state.moves
-
-        # Determine what moves are legal from the given state.
-        node.game._forecast()
-        legal_moves = node.game._legal_moves
-
-        # Evaluate each legal move for its effect on the state of the game
-        for move in legal_moves:
-            game_state = deepcopy(node)
-            game_state.make_move(move)
-            logging.debug(game_state.moves)
-
-            if game_state.game not in visited:
-                queue.append(game_state)
-
-            if game_state.solved:
-                logging.info('solved!')
-                logging.info(game_state.moves)
-                logging.info(f'depth: {len(game_state.moves)}')
-                return game_state.moves
-
-        logging.debug(f'depth: {num_moves_tried}')
+    :param mode: one of `MODES`
+    :param weight: heuristic weight used by the `WEIGHTED` mode
+    :param symmetry: deduplicate states up to a permutation of the tubes
+    :param pruning: dominated move pruning level, see `Game._generate_moves`
+    :param table_size: maximum number of transposition table entries for `IDASTAR`
+    :param beam_width: number of states kept per layer by `BEAM`
+    :param budget: Budget bounding the search, or None
+    :param partial_order: skip commuted orders of independent moves in BFS
+    :param pdb: PatternDatabase for `ASTAR` and `IDASTAR`, or None
+    :param workers: number of processes for `BFS`
+    :param backend: one of `BACKENDS`; `NUMPY` only runs `BFS`
+    :param work_dir: directory for the files of `EXTERNAL`, or None
+    :param checkpoint: file to write the progress of `BFS` to, or None
+    :param resume_from: checkpoint file to resume `BFS` from, or None
+    :param cache: SolutionCache, or None
+    :param stats: SearchStats filled in by the search, or None for a new one
+    :return: Solution, a list of (from_id, to_id) moves, or None if `BEAM` found no
+        solution
+    :raises UnsolvableError: if the board is proven to have no solution
+    """
+    if workers > 1 and mode != BFS:
+        raise ValueError(f'only {BFS} runs on several workers, not {mode!r}')
+    if backend not in BACKENDS:
+        raise ValueError(f'backend must be one of {BACKENDS}, not {backend!r}')
+    if backend == NUMPY and (mode != BFS or workers > 1):
+        raise ValueError(f'the {NUMPY} backend only runs {BFS} in one process')
+    saving = checkpoint is not None or resume_from is not None
+    if saving and (mode != BFS or workers > 1 or backend != PYTHON):
+        raise ValueError(f'only {BFS} in one process with the {PYTHON} backend '
+                         f'writes checkpoints')
+    game_input._validate()
+    stats = SearchStats() if stats is None else stats
+    if cache is not None:
+        solution = cache.get(game_input)
+        if solution is not None:
+            stats.depth = len(solution)
+            solution = _solution(solution, True)
+            solution.stats = stats
+            return solution
+    game = deepcopy(game_input)
+    budget = budget or Budget()
+    optimal = pruning != PRUNING_AGGRESSIVE
+    if pdb is None:
+        def bound():
+            return game._lower_bound
+    else:
+        pdb._check(game)
+
+        def bound():
+            return max(game._lower_bound, pdb(game))
+    if symmetry:
+        def key(state):
+            return game._canonical(state)[0]
+
+        def zobrist():
+            return game._zobrist
+    else:
+        def key(state):
+            return state
+
+        def zobrist():
+            return game._ordered_zobrist
+
+    start = time.perf_counter()
+    try:
+        if mode == BFS:
+            reduce = partial_order and pruning != PRUNING_AGGRESSIVE
+            if backend == NUMPY:
+                from tubes.batch import batch_bfs
+                solution = batch_bfs(game, symmetry, pruning, budget, optimal, stats)
+            elif workers > 1:
+                from tubes.parallel import parallel_bfs
+                solution = parallel_bfs(game, symmetry, pruning, budget, optimal,
+                                        reduce, workers, stats)
+            elif saving:
+                from tubes.checkpoint import Checkpoint, cancel_on_sigterm
+                if resume_from is not None and checkpoint is not None:
+                    shutil.copyfile(resume_from, checkpoint)
+                with Checkpoint(checkpoint or resume_from, game, symmetry, pruning,
+                                resume=resume_from is not None) as saved:
+                    with cancel_on_sigterm(budget):
+                        solution = _bfs(game, key, zobrist, pruning, budget, stats,
+                                        optimal, reduce, saved)
+            else:
+                solution = _bfs(game, key, zobrist, pruning, budget, stats, optimal,
+                                reduce)
+        elif mode == ASTAR:
+            solution = _best_first(game, key, pruning, budget, stats,
+                                   lambda move: bound(), 1, optimal)
+        elif mode == WEIGHTED:
+            solution = _best_first(game, key, pruning, budget, stats,
+                                   lambda move: game._color_score, weight, False)
+        elif mode == IDASTAR:
+            solution = _ida(game, key, pruning, budget, stats, bound, table_size,
+                            optimal)
+        elif mode == BEAM:
+            solution = _beam(game, key, pruning, budget, stats, beam_width, optimal)
+        elif mode == EXTERNAL:
+            from tubes.external import external_bfs
+            solution = external_bfs(game, symmetry, pruning, budget, optimal,
+                                    work_dir, stats=stats)
+        else:
+            raise ValueError(f'mode must be one of {MODES}, not {mode!r}')
+    finally:
+        stats.seconds += time.perf_counter() - start
+        stats.peak_rss = _peak_rss()
+    if solution is None and pruning != PRUNING_AGGRESSIVE and mode != BEAM:
+        raise UnsolvableError(UnsolvableError.EXHAUSTED,
+                              'every reachable board was searched', mode=mode)
+    if solution is not None:
+        stats.depth = len(solution)
+        solution.stats = stats
+        if cache is not None and solution.optimal:
+            cache.put(game_input, solution)
+    return solution
+
+
+def _expand(game, node, pruning, reduce=False):
+    """
+    Loads `node` onto the working board and applies each legal move in turn. The
+    move is applied while control is yielded to the caller, and undone afterwards.
+
+    With `reduce`, a move m is skipped when, for every move x in `node.last`, m and x
+    are `independent` and m < x: the same board is reached at the same depth by
+    making m before x. The order only applies between moves that `Game._commutes`,
+    which is checked for m here and for x when it was recorded in `node.last`.
+    :param game: working Game object
+    :param node: GameState to expand
+    :param pruning: dominated move pruning level, see `Game._generate_moves`
+    :param reduce: apply partial order reduction using `node.last`
+    :return: generator of (from_id, to_id) moves
+    """
+    game._unpack(node.state)
+    last = node.last if reduce else None
+    for move in game._generate_moves(pruning):
+        cur_move = game._push_move(*move)
+        if not (last and game._commutes(cur_move) and
+                all(move < other and independent(move, other) for other in last)):
+            yield move
+        game._pop_move()
+
+
+# The searches below take the working Game, loaded with each state as it is
+# expanded, a `key` callable mapping a packed state to its deduplication key, the
+# `pruning` level of `Game._generate_moves`, the Budget charged for every expanded
+# state and the SearchStats they fill in. They return a Solution, flagged as
+# `optimal` when the search guarantees it, or None if they ran dry.
+
+
+def _bfs(game, key, zobrist, pruning, budget, stats, optimal, reduce,
+         checkpoint=None):
+    """
+    Layered BFS. Boards are checked against `visited` as they are generated, and the
+    first path to reach a board is kept. For partial order reduction, each board of
+    the next layer also collects the last moves of every path reaching it at that
+    depth, as long as they all reach the same board, tube for tube.
+
+    With a `checkpoint`, every completed layer is appended to it. If it already holds
+    layers, their boards are visited and the search resumes from the last one; the
+    moves its boards were reached through are not saved, so that layer is expanded
+    without partial order reduction.
+    :param zobrist: callable returning the hash of the working board, alike for
+        boards of the same key
+    :param reduce: apply partial order reduction, see `_expand`
+    :param checkpoint: tubes.checkpoint.Checkpoint, or None
+    """
+    game_state = GameState(game._pack(), last=frozenset())
+    if game._solved:
+        return _solution(game_state.moves, optimal)
+
+    # Layer and visited are utilized as standard BFS structures. The layer stores the
+    # unevaluated states, and the visited stores every packed state seen so far,
+    # keyed by the Zobrist hash of the board.
+    layer, visited = [game_state], VisitedStates()
+    visited.add(zobrist(), key(game_state.state))
+    if checkpoint is not None:
+        saved = checkpoint.restore()
+        if saved:
+            for saved_layer in saved[1:]:
+                for node in saved_layer:
+                    game._unpack(node.state)
+                    visited.add(zobrist(), key(node.state))
+            layer = saved[-1]
+            logging.info('resumed at depth %d: %d states', len(saved) - 1, len(layer))
+            for saved_layer in saved[:-1]:
+                stats.frontier.append(len(saved_layer))
+        else:
+            checkpoint.append(layer)
+    stats._layer(len(layer))
+    key = stats._timed(key, 'hash_seconds')
+    pack = stats._timed(game._pack, 'copy_seconds')
+
+    while layer:
+        next_layer = {}
+        for node in layer:
+            budget.spend()
+            generated = duplicates = 0
+
+            # evaluate each legal move for its effect on the state of the game
+            for move in stats._timed_moves(_expand(game, node, pruning, reduce)):
+                generated += 1
+                state = pack()
+                state_key = key(state)
+                last = None
+                if reduce and game._commutes(game._moves[-1]):
+                    last = frozenset((move,))
+                if not visited.add(zobrist(), state_key):
+                    duplicates += 1
+                    twin = next_layer.get(state_key)
+                    if twin is not None and twin.last is not None:
+                        same = last is not None and twin.state == state
+                        twin.last = twin.last | last if same else None
+                    continue
+                game_state = GameState(state, node, move, last)
+
+                if game._solved:
+                    stats._add(1, generated, duplicates)
+                    stats.visited = len(visited)
+                    return _solution(game_state.moves, optimal)
+                if game._dead_end:
+                    continue
+
+                next_layer[state_key] = game_state
+            stats._add(1, generated, duplicates)
+        layer = list(next_layer.values())
+        stats.visited = len(visited)
+        if checkpoint is not None:
+            checkpoint.append(layer)
+        stats._layer(len(layer))
+
+    logging.debug('expanded: %d', stats.expanded)
+    return None
+
+
+def _best_first(game, key, pruning, budget, stats, heuristic, weight, optimal):
+    """
+    Best-first search ordered by depth + weight * heuristic. With a weight of 1 and an
+    admissible, consistent heuristic this is A* and the solution is optimal.
+    :param heuristic: callable taking the move to a child, evaluated while that
+        move is applied to `game`; children estimated at inf are dropped
+    :param weight: heuristic weight
+    """
+    tiebreak = count()
+    game_state = GameState(game._pack())
+    heap = [(0, next(tiebreak), 0, game_state)]
+    depths = {key(game_state.state): 0}
+    key = stats._timed(key, 'hash_seconds')
+    pack = stats._timed(game._pack, 'copy_seconds')
+
+    while heap:
+        _, _, depth, node = heapq.heappop(heap)
+        if depths[key(node.state)] < depth:
+            continue
+        budget.spend()
+        stats.peak_frontier = max(stats.peak_frontier, len(heap) + 1)
+
+        game._unpack(node.state)
+        if game._solved:
+            stats.visited = len(depths)
+            logging.debug('expanded: %d', stats.expanded)
+            return _solution(node.moves, optimal)
+
+        generated = duplicates = 0
+        for move in stats._timed_moves(_expand(game, node, pruning)):
+            generated += 1
+            state = pack()
+            state_key = key(state)
+            if depths.get(state_key, depth + 2) <= depth + 1:
+                duplicates += 1
+                continue
+            depths[state_key] = depth + 1
+            if game._dead_end:
+                continue
+            estimate = heuristic(move)
+            if estimate == float('inf'):
+                continue
+            priority = depth + 1 + weight * estimate
+            heapq.heappush(heap, (priority, next(tiebreak), depth + 1,
+                                  GameState(state, node, move)))
+        stats._add(1, generated, duplicates)
+
+    stats.visited = len(depths)
+    logging.debug('expanded: %d', stats.expanded)
+    return None
+
+
+class TranspositionTable:
+    """
+    Bounded map from state keys to what the depth first search learned about them,
+    evicting the least recently used entry once `size` entries are held. `epoch`
+    counts the evictions, so that facts relying on entries being held can be dated.
+    """
+    def __init__(self, size):
+        self.size = size
+        self.epoch = 0
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def values(self):
+        return self._entries.values()
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+        return entry
+
+    def put(self, key, entry):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.size:
+            self._entries.popitem(last=False)
+            self.epoch += 1
+
+
+def _ida(game, key, pruning, budget, stats, bound, table_size, optimal):
+    """
+    Iterative deepening A* on the `bound` lower bound. Each iteration is a depth first
+    search that pushes and pops moves on the working board, cut off once depth plus
+    bound exceeds the threshold; the next threshold is the smallest value that was
+    cut off.
+
+    The transposition table holds, per state, the iteration and depth it was last
+    searched at, and the lower bound on its remaining moves learned so far. A state
+    already searched in this iteration at the same or a smaller depth is skipped as a
+    duplicate. A fully searched state learns the smallest value cut off below it; a
+    state with a skipped child learns nothing, as that child may lead back to it.
+
+    States on the current path are skipped, and learned bounds are capped at the
+    deepest state expanded plus the highest `bound` met, so the threshold eventually
+    covers every path and an unsolvable board runs dry, whatever `table_size`. Sooner
+    than that, the search returns None once an iteration adds no state to the table
+    and every held state is closed: expanded, since the last eviction, with every
+    child held or a dead end.
+    :param bound: callable returning an admissible lower bound for the working board
+    :param table_size: maximum number of transposition table entries
+    """
+    table = TranspositionTable(table_size)
+    path = []
+    on_path = set()
+    # deepest state expanded and highest bound met, capping the bounds learned
+    deepest = highest = 0
+    iteration = 0
+    key = stats._timed(key, 'hash_seconds')
+    pack = stats._timed(game._pack, 'copy_seconds')
+    generate = stats._timed(game._generate_moves, 'move_seconds')
+
+    def search(depth, threshold):
+        """
+        :return: None once solved, else the smallest depth + bound cut off below this
+            state, whether the subtree was searched without skipping any state, and
+            whether this state is now held in the table or is a dead end
+        """
+        nonlocal deepest, highest
+        state_key = key(pack())
+        entry = table.get(state_key)
+        if state_key in on_path:
+            stats.duplicates += 1
+            return float('inf'), False, entry is not None
+        if entry is not None:
+            seen_iteration, seen_depth, learned, _ = entry
+            if seen_iteration == iteration and seen_depth <= depth:
+                stats.duplicates += 1
+                return float('inf'), False, True
+        estimate = bound()
+        highest = max(highest, estimate)
+        if entry is not None:
+            estimate = max(estimate, learned)
+        if depth + estimate > threshold:
+            return depth + estimate, True, entry is not None or game._dead_end
+        if game._solved:
+            return None
+        if game._dead_end:
+            return float('inf'), True, True
+        budget.spend()
+        moves = generate(pruning)
+        stats._add(1, len(moves))
+        stats.peak_frontier = max(stats.peak_frontier, depth + 1)
+        deepest = max(deepest, depth)
+
+        table.put(state_key, (iteration, depth, estimate, None))
+        epoch = table.epoch
+        lowest = float('inf')
+        exact = closed = True
+        on_path.add(state_key)
+        for move in moves:
+            game._push_move(*move)
+            path.append(move)
+            result = search(depth + 1, threshold)
+            if result is None:
+                return None
+            path.pop()
+            game._pop_move()
+            lowest = min(lowest, result[0])
+            exact = exact and result[1]
+            closed = closed and result[2]
+        on_path.discard(state_key)
+        if exact:
+            estimate = max(estimate, min(lowest - depth, deepest + highest))
+        closed = closed and table.epoch == epoch
+        table.put(state_key, (iteration, depth, estimate, epoch if closed else None))
+        return lowest, exact, True
+
+    initial_key = key(pack())
+    threshold = bound()
+    while True:
+        iteration += 1
+        held, epoch = len(table), table.epoch
+        result = search(0, threshold)
+        stats.visited = len(table)
+        if result is None:
+            logging.debug('expanded: %d', stats.expanded)
+            return _solution(path, optimal)
+        if result[0] == float('inf') or (
+                len(table) == held and table.epoch == epoch
+                and initial_key in table
+                and all(entry[3] == epoch for entry in table.values())):
+            logging.debug('expanded: %d', stats.expanded)
+            return None
+        threshold = result[0]
+
+
+def _beam(game, key, pruning, budget, stats, width, optimal):
+    """
+    Beam search: BFS that only keeps the `width` children with the lowest
+    `Game._color_score` in each layer. States are deduplicated against every layer
+    seen so far, so the search never cycles and ends once the beam runs dry, but the
+    visited set grows with every layer rather than staying within `width`. As long as
+    no layer had to be cut down, the search is the same as BFS, and a solution is
+    optimal.
+    :param width: number of states kept per layer
+    """
+    tiebreak = count()
+    game_state = GameState(game._pack())
+    if game._solved:
+        return _solution(game_state.moves, optimal)
+    layer, visited = [game_state], {key(game_state.state)}
+    cut = False
+    stats._layer(len(layer))
+    key = stats._timed(key, 'hash_seconds')
+    pack = stats._timed(game._pack, 'copy_seconds')
+
+    while layer:
+        children = []
+        for node in layer:
+            budget.spend()
+            generated = duplicates = 0
+            for move in stats._timed_moves(_expand(game, node, pruning)):
+                generated += 1
+                state = pack()
+                state_key = key(state)
+                if state_key in visited:
+                    duplicates += 1
+                    continue
+                visited.add(state_key)
+                game_state = GameState(state, node, move)
+                if game._solved:
+                    stats._add(1, generated, duplicates)
+                    stats.visited = len(visited)
+                    return _solution(game_state.moves, optimal and not cut)
+                if game._dead_end:
+                    continue
+                children.append((game._color_score, next(tiebreak), game_state))
+            stats._add(1, generated, duplicates)
+        if len(children) > width:
+            cut = True
+            children = heapq.nsmallest(width, children)
+        layer = [child for _, _, child in children]
+        stats.visited = len(visited)
+        stats._layer(len(layer))
+    return None
+
+
+def solve_anytime(game_input, max_nodes=None, max_seconds=None, cancel=None,
+                  beam_width=BEAM_WIDTH, improve=True, **kwargs):
+    """
+    Finds a solution within a budget, then keeps improving it while the budget lasts.
+    Up to `BEAM_ROUNDS` beam searches of growing width are run first, as they find
+    solutions quickly. With `improve`, or if the beams found nothing, an A* search
+    follows to find and prove the optimal solution. When the budget runs out the best
+    solution found so far is returned.
+    :param game_input: Game object
+    :param max_nodes: maximum number of states to expand, or None
+    :param max_seconds: maximum wall time in seconds, or None
+    :param cancel: cancellation token with an `is_set` method, or None
+    :param beam_width: width of the first beam search
+    :param improve: keep searching for shorter solutions after the first one
+    :param kwargs: passed on to `solve`, except for `mode`, `budget` and `stats`,
+        which are set for each search
+    :return: Solution with `optimal` set if it is proven optimal, or None if no
+        solution was found
+    :raises UnsolvableError: if the board is proven to have no solution
+    :raises TypeError: if `kwargs` holds an argument set for each search
+    """
+    reserved = sorted(kwargs.keys() & {'mode', 'budget', 'stats'})
+    if reserved:
+        raise TypeError(f'solve_anytime sets {", ".join(reserved)} for each search; '
+                        f'use max_nodes, max_seconds and cancel to bound it')
+    budget = Budget(max_nodes, max_seconds, cancel)
+    best = None
+    try:
+        for _ in range(BEAM_ROUNDS):
+            solution = solve(game_input, mode=BEAM, beam_width=beam_width,
+                             budget=budget, **kwargs)
+            if solution is not None and (best is None or len(solution) < len(best)):
+                best = solution
+            if solution is None or solution.optimal or not improve:
+                break
+            beam_width *= 4
+
+        if best is not None and len(best) == game_input._lower_bound:
+            best.optimal = True
+        if best is None or (improve and not best.optimal):
+            # A* is complete, so it either proves the optimum or that there is none
+            solution = solve(game_input, mode=ASTAR, budget=budget, **kwargs)
+            if solution is not None:
+                best = solution
+    except BudgetExhausted as exc:
+        logging.info('search stopped: %s', exc)
+    return best
+
+
+def _solution(moves, optimal):
+    logging.info('solved!')
+    logging.info('%s', moves)
+    logging.info('depth: %d', len(moves))
+    return Solution(moves, optimal)